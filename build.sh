@@ -15,4 +15,10 @@ python manage.py collectstatic --no-input
 # Apply database migrations
 python manage.py migrate
 
+# Index any vault clients missing from the blind search index
+python manage.py rebuild_search_index
+
+# Rebuild the dashboard's daily metrics rollup from view/lead history
+python manage.py backfill_daily_metrics
+
 playwright install chromium
\ No newline at end of file
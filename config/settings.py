@@ -41,6 +41,7 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware', # WhiteNoise must be here
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'core.middleware.TenantMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -101,10 +102,14 @@ LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
 USE_TZ = True
+#HIT COUNTERS
+COUNTER_FLUSH_SECONDS = 10  # profile/vCard/agency hits are buffered per process (see core/counters.py)
+PAGE_CACHE_SECONDS = 300  # anonymous microsite pages (see core/page_cache.py)
 #ENCRYPTION FOR EMAILS
 ENCRYPTION_KEY = b'PKhR0eKUBNCRHxdl3ewdgFNwb6XsiC-cTBX7TMluMEY='
 #EMAIL BACKEND
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = 'core.mail.PooledEmailBackend'  # keeps warm SMTP connections (see core/mail.py)
+EMAIL_POOL_SIZE = 4
 EMAIL_HOST = 'smtp.resend.com'
 EMAIL_PORT = 465
 EMAIL_USE_SSL = True
@@ -4,9 +4,10 @@ from django.utils.html import strip_tags
 from django.utils import timezone
 from .models import Agent, GlobalNewsletter, Subscriber # Adjust Subscriber if named differently
 from django.template.loader import render_to_string
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from .models import PendingAgentOnboarding
 from .models import AuditLog
+from .models import BackgroundJob
 # --- INLINE EDITING (Keeps your current workflow) ---
 class TestimonialInline(admin.TabularInline):
     model = Testimonial
@@ -51,6 +52,8 @@ admin.site.register(Service)
 admin.site.register(Credential)
 
 
+BROADCAST_BATCH_SIZE = 100
+
 @admin.action(description="🚀 BROADCAST NEWSLETTER TO ALL AGENT CLIENTS")
 def broadcast_to_all_clients(modeladmin, request, queryset):
     for newsletter in queryset:
@@ -61,12 +64,14 @@ def broadcast_to_all_clients(modeladmin, request, queryset):
         # 1. Get all public agents
         agents = Agent.objects.filter(is_public=True)
         total_emails_sent = 0
+        # One connection for the whole blast; the pooled backend pipelines each batch
+        connection = get_connection(fail_silently=True)
 
         # 2. Loop through every agent
         for agent in agents:
             # 3. Get that specific agent's vaulted clients
-            # Adjust 'subscriber_set' to whatever your related_name is in models.py
-            clients = Subscriber.objects.filter(agent=agent) 
+            clients = Subscriber.objects.filter(agent=agent).decrypted('name', 'email')
+            batch = []
 
             # 4. Send white-labeled email to each client
             for client in clients:
@@ -88,12 +93,13 @@ def broadcast_to_all_clients(modeladmin, request, queryset):
                     to=[client.email]
                 )
                 msg.attach_alternative(html_content, "text/html")
-                
-                try:
-                    msg.send()
-                    total_emails_sent += 1
-                except Exception as e:
-                    print(f"Failed to send to {client.email}: {e}")
+                batch.append(msg)
+
+                if len(batch) >= BROADCAST_BATCH_SIZE:
+                    total_emails_sent += connection.send_messages(batch)
+                    batch = []
+
+            total_emails_sent += connection.send_messages(batch)
 
         # 5. Mark as sent
         newsletter.is_sent = True
@@ -171,4 +177,12 @@ class AuditLogAdmin(admin.ModelAdmin):
         return False
         
     def has_delete_permission(self, request, obj=None):
-        return False
\ No newline at end of file
+        return False
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'agent', 'status', 'progress_done', 'progress_total', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('agent__name', 'kind', 'result')
+    readonly_fields = ('created_at', 'finished_at', 'locked_at')
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # Registers the card template index and page cache invalidation signals, the job
+        # handlers and the daily metrics lead counter
+        from . import services, tasks, metrics, page_cache  # noqa: F401
@@ -0,0 +1,147 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import Agency, Agent, AgentDailyMetrics, DailyProfileView
+
+
+# ==========================================
+# BUFFERED HIT COUNTERS
+# ==========================================
+# A viral profile turns every first visit into UPDATEs on the same few rows, which then
+# queue up behind each other's row locks. Hits are summed in process memory instead and
+# written COUNTER_FLUSH_SECONDS after the first unwritten hit (by a timer thread, so counts
+# don't wait for the next visitor) or after COUNTER_FLUSH_THRESHOLD hits: one UPDATE per
+# table, plus an INSERT ... ON CONFLICT DO NOTHING for daily rows seen for the first time.
+# A crashed worker loses at most one interval of counts.
+#
+#   COUNTER_FLUSH_SECONDS = 10   (0 writes through immediately)
+
+COUNTER_FLUSH_THRESHOLD = 500
+
+logger = logging.getLogger(__name__)
+
+# (model, counter field) -> {pk: hits}
+TOTALS = {
+    'profile_views': (Agent, 'profile_views'),
+    'vcard_downloads': (Agent, 'vcard_downloads'),
+    'agency_views': (Agency, 'page_views'),
+}
+# daily counter -> tables it feeds, keyed by (agent_id, date)
+DAILY = {
+    'views': (DailyProfileView, AgentDailyMetrics),
+    'vcard_downloads': (AgentDailyMetrics,),
+}
+
+
+class CounterBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timer = None
+        self._reset()
+        self.last_flush = time.monotonic()
+
+    def _reset(self):
+        self.totals = defaultdict(lambda: defaultdict(int))   # name -> pk -> hits
+        self.daily = defaultdict(lambda: defaultdict(int))    # name -> (agent_id, date) -> hits
+        self.pending = 0
+
+    def hit(self, total=None, pk=None, daily=None, agent_id=None, n=1):
+        with self.lock:
+            if total:
+                self.totals[total][pk] += n
+            if daily:
+                self.daily[daily][(agent_id, timezone.now().date())] += n
+            self.pending += n
+            interval = getattr(settings, 'COUNTER_FLUSH_SECONDS', 10)
+            due = (self.pending >= COUNTER_FLUSH_THRESHOLD or interval <= 0 or
+                   time.monotonic() - self.last_flush >= interval)
+            if not due:
+                self._schedule(interval)
+        if due:
+            self.flush()
+
+    def _schedule(self, interval):
+        """Start the flush timer if none is pending (call with the lock held)."""
+        if self.timer is None:
+            self.timer = threading.Timer(interval, self._timed_flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()   # the timer thread's own connection
+
+    def flush(self):
+        with self.lock:
+            totals, daily, pending = self.totals, self.daily, self.pending
+            self._reset()
+            self.last_flush = time.monotonic()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not pending:
+            return
+        try:
+            with transaction.atomic():
+                for name, hits in totals.items():
+                    model, field = TOTALS[name]
+                    _add(model.objects.filter(pk__in=hits), field, [(Q(pk=pk), n) for pk, n in hits.items()])
+                for name, hits in daily.items():
+                    for model in DAILY[name]:
+                        model.objects.bulk_create(
+                            [model(agent_id=agent_id, date=day) for agent_id, day in hits], ignore_conflicts=True
+                        )
+                        keys = [(Q(agent_id=agent_id, date=day), n) for (agent_id, day), n in hits.items()]
+                        _add(model.objects.filter(_any(q for q, _ in keys)), name, keys)
+        except Exception:
+            logger.exception("Counter flush failed, keeping %s hits for the next attempt", pending)
+            with self.lock:
+                for name, hits in totals.items():
+                    for key, n in hits.items():
+                        self.totals[name][key] += n
+                for name, hits in daily.items():
+                    for key, n in hits.items():
+                        self.daily[name][key] += n
+                self.pending += pending
+                self._schedule(getattr(settings, 'COUNTER_FLUSH_SECONDS', 10) or 1)
+
+
+def _any(conditions):
+    combined = Q()
+    for condition in conditions:
+        combined |= condition
+    return combined
+
+
+def _add(queryset, field, increments):
+    """One UPDATE adding a per-row amount: field = field + CASE WHEN <row> THEN n ... END."""
+    queryset.update(**{field: F(field) + Case(
+        *[When(condition, then=Value(n)) for condition, n in increments],
+        default=Value(0), output_field=IntegerField(),
+    )})
+
+
+buffer = CounterBuffer()
+atexit.register(buffer.flush)
+
+
+def count_profile_view(agent_id):
+    buffer.hit(total='profile_views', pk=agent_id, daily='views', agent_id=agent_id)
+
+
+def count_vcard_download(agent_id):
+    buffer.hit(total='vcard_downloads', pk=agent_id, daily='vcard_downloads', agent_id=agent_id)
+
+
+def count_agency_view(agency_id):
+    buffer.hit(total='agency_views', pk=agency_id)
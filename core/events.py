@@ -0,0 +1,144 @@
+from datetime import date, timedelta
+
+from django.db.models import Q
+
+from .models import Subscriber, SubscriberSearchToken, CardLog
+from .services import get_template_index
+
+
+REVIEW_WINDOW_DAYS = 90   # show reviews due in the next 90 days
+CARD_WINDOW_DAYS = 30     # show birthdays/festivals in the next 30 days
+
+# Festivals that fall on the same day every year roll over to next year once passed
+FIXED_DATE_FESTIVALS = ['New Year', 'Christmas', 'Pongal']
+
+
+def festival_dates(today):
+    return {
+        'New Year': date(today.year, 1, 1),
+        'Pongal': date(today.year, 1, 14),
+        'Lunar New Year': date(2026, 2, 17),
+        'Hari Raya Aidilfitri': date(2026, 3, 20),
+        'Hari Raya Haji': date(2026, 5, 27),
+        'Mid-Autumn Festival': date(2026, 9, 25),
+        'Deepavali': date(2026, 11, 8),
+        'Christmas': date(today.year, 12, 25),
+    }
+
+
+def next_birthday(month, day, today):
+    """Next occurrence of a birthday on or after today (29 Feb falls back to 1 Mar)."""
+    try: bday_this_year = date(today.year, month, day)
+    except ValueError: bday_this_year = date(today.year, 3, 1)
+
+    if bday_this_year >= today:
+        return bday_this_year
+    try: return date(today.year + 1, month, day)
+    except ValueError: return date(today.year + 1, 3, 1)
+
+
+def birthday_window_q(today, days):
+    """
+    SQL filter on birth_month/birth_day for birthdays in [today, today + days].
+    Collapses the window into one day-range per calendar month, so it stays a handful of
+    clauses even when it wraps over New Year.
+    """
+    ranges = {}
+    for offset in range(days + 1):
+        d = today + timedelta(days=offset)
+        lo, hi = ranges.get(d.month, (d.day, d.day))
+        ranges[d.month] = (min(lo, d.day), max(hi, d.day))
+
+    q = Q()
+    for month, (lo, hi) in ranges.items():
+        q |= Q(birth_month=month, birth_day__gte=lo, birth_day__lte=hi)
+        if month == 3 and lo == 1:
+            q |= Q(birth_month=2, birth_day=29)  # 29 Feb birthdays fall back to 1 Mar
+    return q
+
+
+def _whatsapp_url(sub):
+    if sub.phone:
+        phone_digits = ''.join(filter(str.isdigit, sub.phone))
+        if phone_digits:
+            return f"https://wa.me/{phone_digits}"
+    return ''
+
+
+def build_event_calendar(agent, today=None, card_window=CARD_WINDOW_DAYS, review_window=REVIEW_WINDOW_DAYS):
+    """
+    Upcoming birthdays, festivals and policy reviews for an agent's active clients.
+    Runs a fixed number of queries (sent card logs, subscribers, and templates when the
+    agent isn't indexed yet) however large the vault is.
+    Returns (upcoming, reviews, unique_occasions).
+    """
+    today = today or date.today()
+    card_window_end = today + timedelta(days=card_window)
+
+    upcoming_festivals = {}
+    for tag, fest_date in festival_dates(today).items():
+        if fest_date < today and tag in FIXED_DATE_FESTIVALS:
+            fest_date = date(today.year + 1, fest_date.month, fest_date.day)
+        if today <= fest_date <= card_window_end:
+            upcoming_festivals[tag] = fest_date
+
+    # Only pull clients that can actually produce an event in the window; festival tags are
+    # narrowed through the blind index and confirmed exactly below
+    wanted = Q(next_review_date__range=(today, today + timedelta(days=review_window)))
+    wanted |= birthday_window_q(today, card_window)
+    for tag in upcoming_festivals:
+        wanted |= Q(pk__in=SubscriberSearchToken.matching([agent.pk], 'tags', tag))
+
+    matcher = get_template_index(agent)
+    already_sent = set(CardLog.objects.filter(
+        agent=agent, status='sent', scheduled_date__range=(today, card_window_end)
+    ).values_list('subscriber_id', 'occasion', 'scheduled_date'))
+
+    upcoming_list = []    # birthdays + festivals
+    reviews_list = []     # upcoming policy reviews
+    unique_occasions = set()
+
+    subscribers = Subscriber.objects.filter(agent=agent, is_active=True, is_subscribed=True).filter(wanted)
+    for sub in subscribers.decrypted():
+
+        # 0. CHECK UPCOMING REVIEWS
+        if sub.next_review_date:
+            days_until_review = (sub.next_review_date - today).days
+            if 0 <= days_until_review <= review_window:
+                reviews_list.append({
+                    'subscriber': sub,
+                    'days_until': days_until_review,
+                    'event_date': sub.next_review_date,
+                    'last_review_date': sub.last_review_date,
+                    'review_freq_months': sub.review_freq_months,
+                    'wa_url': _whatsapp_url(sub),
+                })
+
+        # 1. CHECK BIRTHDAYS
+        if sub.birth_month and sub.birth_day:
+            next_bday = next_birthday(sub.birth_month, sub.birth_day, today)
+            days_until = (next_bday - today).days
+
+            if 0 <= days_until <= card_window and (sub.pk, 'Birthday', next_bday) not in already_sent:
+                age_turning = next_bday.year - sub.date_of_birth.year if sub.date_of_birth else 0
+                upcoming_list.append({
+                    'subscriber': sub, 'occasion': 'Birthday', 'days_until': days_until,
+                    'event_date': next_bday, 'details': f"Turning {age_turning}" if age_turning > 0 else "Birthday",
+                    'template': matcher.match('Birthday', sub.gender, age_turning), 'wa_url': _whatsapp_url(sub),
+                })
+                unique_occasions.add('Birthday')
+
+        # 2. CHECK FESTIVALS
+        for tag in sub.tag_list:
+            fest_date = upcoming_festivals.get(tag)
+            if fest_date and (sub.pk, tag, fest_date) not in already_sent:
+                upcoming_list.append({
+                    'subscriber': sub, 'occasion': tag, 'days_until': (fest_date - today).days,
+                    'event_date': fest_date, 'details': "Festive Greeting",
+                    'template': matcher.match(tag, sub.gender, sub.age), 'wa_url': _whatsapp_url(sub),
+                })
+                unique_occasions.add(tag)
+
+    upcoming_list.sort(key=lambda x: x['days_until'])
+    reviews_list.sort(key=lambda x: x['days_until'])
+    return upcoming_list, reviews_list, unique_occasions
@@ -0,0 +1,163 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.db import transaction
+
+from .models import Subscriber, SubscriberSearchToken, hash_email
+from .utils_import import add_months_to_date
+
+
+# ==========================================
+# BULK VAULT IMPORT
+# ==========================================
+# preview_import used to do a hash lookup and a full Subscriber.save() per row. This engine
+# preloads the agent's email/name hashes in one query, builds and encrypts the rows in a
+# thread pool, then writes everything with bulk_create/bulk_update in a single transaction.
+IMPORT_BATCH_SIZE = 500
+ENCRYPT_WORKERS = 4
+
+# Columns touched by a 'replace' row (bulk_update needs them spelled out)
+UPDATE_FIELDS = [
+    'encrypted_name', 'name_hash', 'encrypted_dob', 'birth_month', 'birth_day',
+    'encrypted_race', 'encrypted_gender', 'encrypted_tags', 'encrypted_phone',
+    'encrypted_address', 'encrypted_notes', 'pipeline_status', 'next_review_date',
+    'last_review_date', 'review_freq_months',
+]
+
+
+def _parse_iso(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def import_dates(client_data, default_freq):
+    """(dob, next_review_date, last_review_date, review_freq_months) for one parsed row."""
+    dob_value = _parse_iso(client_data.get('dob_db'))
+
+    calc_date_str = client_data.get('next_review_date_calc')
+    last_updated_str = client_data.get('last_updated_for_calc') or client_data.get('last_review')
+    last_review_val = _parse_iso(last_updated_str)
+
+    raw_freq = client_data.get('review_freq') or default_freq
+    try:
+        freq_months_val = int(float(str(raw_freq)))
+    except (ValueError, TypeError):
+        freq_months_val = None
+
+    if calc_date_str:
+        next_review_val = _parse_iso(calc_date_str)
+    else:
+        # Calculate using file frequency or user-provided default
+        next_review_val = _parse_iso(add_months_to_date(last_updated_str, raw_freq))
+
+    return dob_value, next_review_val, last_review_val, freq_months_val
+
+
+def _build_new(agent, client_data, default_freq):
+    dob_value, next_review_val, last_review_val, freq_months_val = import_dates(client_data, default_freq)
+    # Encrypted properties are set after construction, never as constructor kwargs
+    sub = Subscriber(
+        agent=agent,
+        source='csv_import',
+        pipeline_status=client_data.get('pipeline_status', 'client'),
+        next_review_date=next_review_val,
+        last_review_date=last_review_val,
+        review_freq_months=freq_months_val,
+    )
+    sub.name = client_data.get('name', '')
+    sub.race = client_data.get('race', 'O')
+    sub.gender = client_data.get('gender', 'U')
+    sub.date_of_birth = dob_value
+    sub.email = client_data.get('email', '')
+    sub.phone = client_data.get('phone', '')
+    sub.address = client_data.get('address', '')
+    sub.notes = client_data.get('notes', '')
+    sub.apply_festival_tags()
+    return sub
+
+
+def _apply_replace(sub, rows, default_freq):
+    for client_data in rows:
+        dob_value, next_review_val, last_review_val, freq_months_val = import_dates(client_data, default_freq)
+        if client_data.get('name'): sub.name = client_data.get('name')
+        if dob_value is not None: sub.date_of_birth = dob_value
+        if client_data.get('race'): sub.race = client_data.get('race')
+        if client_data.get('gender'): sub.gender = client_data.get('gender')
+
+        # Update HQ & Review Fields
+        sub.pipeline_status = client_data.get('pipeline_status', 'client')
+        if next_review_val: sub.next_review_date = next_review_val
+        if last_review_val: sub.last_review_date = last_review_val
+        if freq_months_val: sub.review_freq_months = freq_months_val
+        if client_data.get('phone'): sub.phone = client_data.get('phone')
+        if client_data.get('address'): sub.address = client_data.get('address')
+        if client_data.get('notes'): sub.notes = client_data.get('notes')
+        sub.apply_festival_tags()
+    return sub
+
+
+def bulk_import_subscribers(agent, pending_import, actions, default_freq=12):
+    """
+    Applies the preview screen's per-row actions ('add' / 'replace' / 'skip').
+    'add' skips emails already in the vault; 'replace' matches on email, or on name when
+    the row has no email. Returns (added, updated, skipped).
+    """
+    by_email, by_name = {}, {}
+    for pk, email_hash, name_hash in Subscriber.objects.filter(agent=agent).order_by('pk').values_list('pk', 'email_hash', 'name_hash'):
+        by_email.setdefault(email_hash, pk)
+        if name_hash:
+            by_name.setdefault(name_hash, pk)
+
+    to_create = []
+    to_update = {}   # existing pk -> rows to apply, in file order
+    skipped_count = 0
+
+    for client_data, action in zip(pending_import, actions):
+        email_raw = client_data.get('email', '')
+
+        if action == 'add':
+            if email_raw:
+                hashed = hash_email(email_raw)
+                if hashed in by_email:
+                    skipped_count += 1
+                    continue
+                by_email[hashed] = None   # a later row with the same email is a duplicate too
+            to_create.append(client_data)
+
+        elif action == 'replace':
+            if email_raw:
+                pk = by_email.get(hash_email(email_raw))
+            else:
+                imported_name = client_data.get('name', '').strip()
+                pk = by_name.get(hashlib.sha256(imported_name.lower().encode()).hexdigest()) if imported_name else None
+            if pk:
+                to_update.setdefault(pk, []).append(client_data)
+
+        else:
+            skipped_count += 1
+
+    existing = Subscriber.objects.in_bulk(list(to_update))
+
+    # Fernet is the bottleneck; each Subscriber is independent, so encrypt them side by side
+    with ThreadPoolExecutor(max_workers=ENCRYPT_WORKERS) as pool:
+        new_subs = list(pool.map(lambda row: _build_new(agent, row, default_freq), to_create))
+        updated_subs = list(pool.map(
+            lambda item: _apply_replace(existing[item[0]], item[1], default_freq),
+            [(pk, rows) for pk, rows in to_update.items() if pk in existing],
+        ))
+
+    with transaction.atomic():
+        Subscriber.objects.bulk_create(new_subs, batch_size=IMPORT_BATCH_SIZE)
+        Subscriber.objects.bulk_update(updated_subs, UPDATE_FIELDS, batch_size=IMPORT_BATCH_SIZE)
+        # bulk writes skip save(), so refresh the blind index for new and renamed/retagged rows
+        SubscriberSearchToken.index_subscribers(
+            new_subs + [s for s in updated_subs if s.__dict__.pop('_search_dirty', False)]
+        )
+
+    updated_count = sum(len(to_update[s.pk]) for s in updated_subs)
+    return len(new_subs), updated_count, skipped_count
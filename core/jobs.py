@@ -0,0 +1,77 @@
+import traceback
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+
+# ==========================================
+# DB-BACKED JOB QUEUE
+# ==========================================
+# Handlers register with @job('name') and receive the BackgroundJob plus its payload as
+# keyword arguments. A handler that raises is retried with exponential backoff until
+# max_attempts; use job.set_progress(..., checkpoint=...) so a retry can skip work done.
+# set_progress doubles as the heartbeat, so long handlers should call it at least every
+# few minutes.
+RETRY_BASE_SECONDS = 30
+STALE_AFTER = timedelta(minutes=30)   # a 'running' job with no progress write for this long belongs to a dead worker
+
+JOB_HANDLERS = {}
+
+
+def job(name):
+    def register(func):
+        JOB_HANDLERS[name] = func
+        return func
+    return register
+
+
+def enqueue(kind, agent=None, max_attempts=3, delay=None, **payload):
+    """Queue a job for the worker and return it. Payload must be JSON-serialisable."""
+    return BackgroundJob.objects.create(
+        kind=kind, agent=agent, payload=payload, max_attempts=max_attempts,
+        run_after=timezone.now() + (delay or timedelta()),
+    )
+
+
+def claim_next_job():
+    """
+    Atomically take the oldest runnable job. The conditional UPDATE means two workers
+    can never claim the same row, on SQLite or Postgres alike.
+    """
+    now = timezone.now()
+    runnable = BackgroundJob.objects.filter(
+        Q(status='queued', run_after__lte=now) | Q(status='running', locked_at__lt=now - STALE_AFTER)
+    ).order_by('run_after', 'pk')
+
+    for candidate in runnable.values('pk', 'status', 'locked_at')[:10]:
+        claimed = BackgroundJob.objects.filter(
+            pk=candidate['pk'], status=candidate['status'], locked_at=candidate['locked_at']
+        ).update(status='running', locked_at=now)
+        if claimed:
+            return BackgroundJob.objects.get(pk=candidate['pk'])
+    return None
+
+
+def run_job(job):
+    handler = JOB_HANDLERS.get(job.kind)
+    job.attempts += 1
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'")
+        job.result = (handler(job, **job.payload) or '')[:255]
+        job.status = 'done'
+        job.finished_at = timezone.now()
+    except Exception as e:
+        job.last_error = f"{e}\n\n{traceback.format_exc()}"
+        if handler is not None and job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+    job.locked_at = None
+    job.save(update_fields=['attempts', 'result', 'status', 'finished_at', 'last_error', 'run_after', 'locked_at'])
+    return job
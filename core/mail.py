@@ -0,0 +1,129 @@
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+
+
+# ==========================================
+# POOLED SMTP BACKEND
+# ==========================================
+# Every msg.send() normally opens a fresh TLS session to smtp.resend.com:465. This backend
+# keeps up to EMAIL_POOL_SIZE authenticated connections warm per process and spreads
+# multi-message batches across them from a thread pool.
+#
+#   EMAIL_BACKEND = 'core.mail.PooledEmailBackend'
+#   EMAIL_POOL_SIZE = 4
+
+# A dropped/idle-timed-out session; anything else (refused recipient etc.) is the message's fault.
+# SMTPException subclasses OSError, so the server's own refusals are re-raised before the retry.
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, OSError)
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException)
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPConnectionPool:
+    def __init__(self, size):
+        self.size = size
+        self.idle = queue.LifoQueue()   # most recently used first, so spare connections can go stale
+        self.created = 0
+        self.lock = threading.Lock()
+        self.stats = {'sent': 0, 'failed': 0, 'reconnects': 0, 'seconds': 0.0}
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                return SMTPBackend(fail_silently=False)
+        return self.idle.get()  # all connections busy: wait for one to come back
+
+    def release(self, connection):
+        self.idle.put(connection)
+
+    def record(self, **deltas):
+        with self.lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def send(self, message):
+        """Send one message on a warm connection, reconnecting once if the session died."""
+        connection = self.acquire()
+        try:
+            for attempt in (1, 2):
+                try:
+                    if connection.connection is None:
+                        connection.open()
+                    return connection.send_messages([message])
+                except MESSAGE_ERRORS:
+                    raise
+                except CONNECTION_ERRORS:
+                    connection.close()
+                    if attempt == 2:
+                        raise
+                    self.record(reconnects=1)
+        finally:
+            self.release(connection)
+
+    def throughput(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['per_second'] = stats['sent'] / stats['seconds'] if stats['seconds'] else 0.0
+        return stats
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """One pool per process (rebuilt after a fork so workers never share sockets)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = SMTPConnectionPool(getattr(settings, 'EMAIL_POOL_SIZE', 4))
+            _pool_pid = os.getpid()
+    return _pool
+
+
+class PooledEmailBackend(BaseEmailBackend):
+    """Drop-in EMAIL_BACKEND; open()/close() are no-ops because the pool outlives the backend."""
+
+    def _send_one(self, pool, message):
+        try:
+            return pool.send(message), None
+        except Exception as e:
+            logger.warning("Pooled SMTP send failed for %s: %s", message.to, e)
+            return 0, e
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        pool = get_pool()
+        started = time.monotonic()
+
+        if len(email_messages) == 1:
+            results = [self._send_one(pool, email_messages[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(pool.size, len(email_messages))) as executor:
+                results = list(executor.map(lambda m: self._send_one(pool, m), email_messages))
+
+        elapsed = time.monotonic() - started
+        num_sent = sum(sent for sent, _ in results)
+        errors = [error for _, error in results if error is not None]
+        pool.record(sent=num_sent, failed=len(email_messages) - num_sent, seconds=elapsed)
+
+        if errors and not self.fail_silently:
+            raise errors[0]
+        return num_sent
@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.metrics import refresh_events_due
+from core.models import Agent, AgentDailyMetrics, DailyProfileView, Lead
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the AgentDailyMetrics rollup (views and leads) from DailyProfileView and Lead history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='How many days back to rebuild')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        start = today - timedelta(days=options['days'] - 1)
+
+        rows = {}
+        def row(agent_id, day):
+            return rows.setdefault((agent_id, day), AgentDailyMetrics(agent_id=agent_id, date=day))
+
+        for agent_id, day, views in DailyProfileView.objects.filter(date__gte=start).values_list('agent_id', 'date', 'views'):
+            row(agent_id, day).views = views
+
+        leads = (Lead.objects.filter(created_at__date__gte=start)
+                 .annotate(day=TruncDate('created_at')).values('agent_id', 'day')
+                 .annotate(n=Count('id')).values_list('agent_id', 'day', 'n'))
+        for agent_id, day, n in leads:
+            row(agent_id, day).leads = n
+
+        # vCard downloads were only ever kept as a lifetime total, so history isn't rebuilt
+        AgentDailyMetrics.objects.bulk_create(
+            rows.values(), batch_size=options['batch_size'],
+            update_conflicts=True, unique_fields=['agent', 'date'], update_fields=['views', 'leads'],
+        )
+
+        agents = Agent.objects.all()
+        for agent in agents.iterator():
+            refresh_events_due(agent, today)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {len(rows)} agent-days since {start} and today's events for {agents.count()} agents."
+        ))
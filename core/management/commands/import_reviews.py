@@ -5,6 +5,7 @@ from django.core.files.base import ContentFile
 from playwright.sync_api import sync_playwright
 from bs4 import BeautifulSoup
 from core.models import Agent, Testimonial
+from core.utils import save_testimonials, scrape_and_save_testimonials
 
 class Command(BaseCommand):
     help = 'Scrapes reviews + screenshots from a website using a CSS selector'
@@ -13,6 +14,8 @@ class Command(BaseCommand):
         parser.add_argument('slug', type=str, help='The slug of the Agent (e.g., ryan-siow)')
         parser.add_argument('url', type=str, help='The external URL (e.g., https://ryansiow.producer.today/)')
         parser.add_argument('selector', type=str, help='The CSS class of the review card (e.g., .card)')
+        parser.add_argument('--snapshot', action='store_true',
+                            help='Treat url as a saved HTML file or directory of pages and parse it offline (no browser, no screenshots)')
 
     def handle(self, *args, **options):
         agent_slug = options['slug']
@@ -26,6 +29,17 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f"❌ Agent with slug '{agent_slug}' not found."))
             return
 
+        if options['snapshot']:
+            if not os.path.exists(target_url):
+                self.stdout.write(self.style.ERROR(f"❌ Snapshot '{target_url}' not found."))
+                return
+            self.stdout.write(self.style.WARNING(f"📄 Parsing saved pages in: {target_url}"))
+            imported_count, found = scrape_and_save_testimonials(agent, css_selector=css_selector, snapshot_path=target_url)
+            if found > imported_count:
+                self.stdout.write(f"   Skipped {found - imported_count} reviews that were already imported.")
+            self.stdout.write(self.style.SUCCESS(f"\n🎉 DONE! Successfully imported {imported_count} testimonials."))
+            return
+
         self.stdout.write(self.style.WARNING(f"🚀 Launching browser to scrape: {target_url}"))
         self.stdout.write(f"   Looking for elements with class: {css_selector}")
 
@@ -53,8 +67,8 @@ class Command(BaseCommand):
 
             self.stdout.write(self.style.SUCCESS(f"✅ Found {count} potential reviews. Processing..."))
 
-            # 5. Extract & Save
-            imported_count = 0
+            # 5. Extract
+            scraped, cards = [], {}   # cards: id(testimonial) -> (element, index)
             for i, element in enumerate(elements):
                 try:
                     # --- A. Parse HTML for Text ---
@@ -84,28 +98,35 @@ class Command(BaseCommand):
                     if len(review_text) < 5:
                         continue
 
-                    # --- B. Capture Screenshot ---
-                    # We add some padding or white background if transparent
-                    screenshot_bytes = element.screenshot()
-                    
-                    # --- C. Save to Database ---
                     testimonial = Testimonial(
-                        agent=agent,
                         client_name=client_name[:100],
                         review_text=review_text,
                         is_featured=False # Safety: let user approve them first
                     )
-                    
-                    # Name the file
-                    file_name = f"imported_{agent.slug}_{int(time.time())}_{i}.png"
-                    testimonial.screenshot.save(file_name, ContentFile(screenshot_bytes))
-                    testimonial.save()
-
-                    self.stdout.write(f"   [{i+1}/{count}] Imported: {client_name}")
-                    imported_count += 1
+                    cards[id(testimonial)] = (element, i)
+                    scraped.append(testimonial)
 
                 except Exception as e:
                     self.stdout.write(self.style.WARNING(f"   ⚠️ Failed to capture #{i+1}: {e}"))
 
+            # 6. Save the new ones in one INSERT (reviews already imported are skipped), only
+            #    screenshotting cards that will actually be stored
+            def attach_screenshot(testimonial):
+                element, i = cards[id(testimonial)]
+                try:
+                    # We add some padding or white background if transparent
+                    screenshot_bytes = element.screenshot()
+                    # Name the file
+                    file_name = f"imported_{agent.slug}_{int(time.time())}_{i}.png"
+                    testimonial.screenshot.save(file_name, ContentFile(screenshot_bytes), save=False)
+                except Exception as e:
+                    self.stdout.write(self.style.WARNING(f"   ⚠️ No screenshot for #{i+1}: {e}"))
+                self.stdout.write(f"   [{i+1}/{count}] Imported: {testimonial.client_name}")
+
+            imported_count = len(save_testimonials(agent, scraped, prepare=attach_screenshot))
+            skipped = len(scraped) - imported_count
+            if skipped:
+                self.stdout.write(f"   Skipped {skipped} reviews that were already imported.")
+
             browser.close()
             self.stdout.write(self.style.SUCCESS(f"\n🎉 DONE! Successfully imported {imported_count} testimonials."))
\ No newline at end of file
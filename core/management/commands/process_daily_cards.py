@@ -1,112 +1,130 @@
-from datetime import date
-from django.core.management.base import BaseCommand
-from django.core.mail import EmailMultiAlternatives, send_mail
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.utils import timezone
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.db import connection
 from django.db.models import Q
-from core.models import Agent, Subscriber, CardTemplate, CardLog
+from django.utils import timezone
+
+from core.events import birthday_window_q, festival_dates, next_birthday
+from core.models import Agent, Subscriber, SubscriberSearchToken, CardLog
+from core.services import get_template_index
+from core.tasks import build_card_email
+
+# Auto-send agents are mailed side by side; each worker thread gets its own DB connection
+CARD_SEND_WORKERS = 4
+
 
 class Command(BaseCommand):
-    help = 'Processes daily birthday cards based on Agent auto/manual preferences.'
-
-    def handle(self, *args, **kwargs):
-        today = date.today()
-        agents = Agent.objects.filter(is_public=True)
-        
-        for agent in agents:
-            birthdays = Subscriber.objects.filter(
-                agent=agent, is_active=True,
-                date_of_birth__month=today.month, date_of_birth__day=today.day
-            )
+    help = 'Processes daily birthday and festival cards based on Agent auto/manual preferences.'
 
-            if not birthdays.exists():
-                continue
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=CARD_SEND_WORKERS, help='Threads for auto-send agents')
 
-            pending_count = 0
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        started = time.monotonic()
+        agents = {a.pk: a for a in Agent.objects.filter(is_public=True).select_related('user')}
+        festivals = [tag for tag, fest_date in festival_dates(today).items() if fest_date == today]
 
-            for sub in birthdays:
-                # Deduplication logic
-                if CardLog.objects.filter(agent=agent, subscriber=sub, occasion='Birthday', scheduled_date=today).exists():
-                    continue
+        # 1. Everyone with an occasion today, in one query: birthday columns + festival tags
+        due = birthday_window_q(today, 0)
+        for festival in festivals:
+            due |= Q(pk__in=SubscriberSearchToken.matching(list(agents), 'tags', festival))
+        subscribers = (Subscriber.objects
+                       .filter(agent_id__in=agents, is_active=True, is_subscribed=True)
+                       .filter(due)
+                       .decrypted('name', 'email', 'dob', 'gender', 'tags'))
 
-                age = today.year - sub.date_of_birth.year
-                
-                # Exact demographic match
-                template = CardTemplate.objects.filter(
-                    agent=agent, occasion='Birthday', is_active=True
-                ).filter(Q(target_gender='A') | Q(target_gender=sub.gender)
-                ).filter(target_age_min__lte=age, target_age_max__gte=age).first()
+        # 2. Cards already logged today are never generated twice
+        already_logged = set(CardLog.objects.filter(scheduled_date=today).values_list('subscriber_id', 'occasion'))
 
-                if not template:
+        # 3. Match templates in memory
+        cards = defaultdict(list)   # agent pk -> [(subscriber, occasion, template)]
+        for sub in subscribers:
+            if not sub.email:
+                continue
+            matcher = get_template_index(agents[sub.agent_id])
+            occasions = []
+            if sub.birth_month and sub.birth_day and next_birthday(sub.birth_month, sub.birth_day, today) == today:
+                dob = sub.date_of_birth
+                occasions.append(('Birthday', today.year - dob.year if dob else None))
+            occasions += [(tag, sub.age) for tag in festivals if tag in sub.tag_list]
+
+            for occasion, age in occasions:
+                if (sub.pk, occasion) in already_logged:
                     continue
+                template = matcher.match(occasion, sub.gender, age)
+                if template:
+                    cards[sub.agent_id].append((sub, occasion, template))
+
+        # 4. Manual agents: queue for approval and send a digest
+        auto_agents = []
+        for agent_pk, agent_cards in cards.items():
+            agent = agents[agent_pk]
+            if agent.automation_mode == 'auto':
+                auto_agents.append((agent, agent_cards))
+            else:
+                self.queue_for_approval(agent, agent_cards, today)
+
+        # 5. Auto agents: send over a thread pool, logging per-agent timing
+        if options['workers'] > 1 and len(auto_agents) > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                for line in pool.map(lambda item: self.auto_send_in_thread(*item, today), auto_agents):
+                    self.stdout.write(line)
+        else:
+            for agent, agent_cards in auto_agents:
+                self.stdout.write(self.auto_send(agent, agent_cards, today))
+
+        total = sum(len(c) for c in cards.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Daily card processing complete: {total} cards for {len(cards)} agents in {time.monotonic() - started:.1f}s."
+        ))
+
+    def queue_for_approval(self, agent, agent_cards, today):
+        CardLog.objects.bulk_create([
+            CardLog(agent=agent, subscriber=sub, card_template=template, occasion=occasion,
+                    status='pending', scheduled_date=today)
+            for sub, occasion, template in agent_cards
+        ], ignore_conflicts=True)
+
+        # DISPATCH DIGEST EMAIL
+        target_email = agent.notification_email if agent.notification_email else (agent.user.email if agent.user else None)
+        if target_email:
+            pending_count = len(agent_cards)
+            send_mail(
+                subject=f"Action Required: {pending_count} Client Cards Today",
+                message=f"Good morning {agent.name},\n\nYou have {pending_count} client birthday/festival cards waiting today. Please log in to your Skandage dashboard to review and send them:\n\nhttps://app.skandage.com/dashboard/crm/pending/",
+                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'updates@skandage.com'),
+                recipient_list=[target_email],
+                fail_silently=True,
+            )
+            self.stdout.write(self.style.NOTICE(f"Queued {pending_count} cards and sent manual digest to {agent.name} at {target_email}"))
+
+    def auto_send_in_thread(self, agent, agent_cards, today):
+        try:
+            return self.auto_send(agent, agent_cards, today)
+        finally:
+            connection.close()   # thread-local connection, not reused by the pool
+
+    def auto_send(self, agent, agent_cards, today):
+        """Sends one agent's cards and logs them in bulk; returns the agent's timing line."""
+        started = time.monotonic()
+        site_url = getattr(settings, 'SITE_URL', 'https://skandage.com').rstrip('/')
+        logs = []
+        for sub, occasion, template in agent_cards:
+            log = CardLog(agent=agent, subscriber=sub, card_template=template, occasion=occasion, scheduled_date=today)
+            try:
+                build_card_email(agent, sub, template, occasion, '', site_url).send(fail_silently=False)
+                log.status, log.sent_at = 'sent', timezone.now()
+            except Exception as e:
+                log.status, log.error_message = 'failed', str(e)
+            logs.append(log)
+        CardLog.objects.bulk_create(logs, ignore_conflicts=True)
 
-                # --- AUTO SEND MODE ---
-                if agent.automation_mode == 'auto':
-                    if sub.email:
-                        subject = f"Happy Birthday, {sub.name}!"
-                        # 1. Get the base site URL (Make sure SITE_URL is set in your production settings.py!)
-                        site_url = getattr(settings, 'SITE_URL', 'https://skandage.com').rstrip('/')
-
-                        # 2. Smart URL Builder for the Card Image
-                        card_image_url = ""
-                        if template and template.image:
-                            card_image_url = template.image.url
-                            # If using local storage, prepend the domain. If using S3, it already has 'http'
-                            if not card_image_url.startswith('http'):
-                                card_image_url = f"{site_url}{card_image_url}"
-
-                        # 3. Smart URL Builder for the Agent Headshot
-                        agent_headshot_url = ""
-                        if agent.headshot:
-                            agent_headshot_url = agent.headshot.url
-                            if not agent_headshot_url.startswith('http'):
-                                agent_headshot_url = f"{site_url}{agent_headshot_url}"
-
-                        # 4. Pass them to the template
-                        context = {
-                            'client_name': sub.name,
-                            'agent': agent,
-                            'occasion': getattr(log, 'occasion', 'Birthday'), # Handles both view and cron job
-                            'message': template.default_message,
-                            'card_image_url': card_image_url,
-                            'agent_headshot_url': agent_headshot_url,
-                            'occasion_emoji': '🎂'
-}
-                        
-                        html_content = render_to_string('core/emails/card_email.html', context)
-                        text_content = strip_tags(html_content)
-                        
-                        msg = EmailMultiAlternatives(subject=subject, body=text_content, from_email=f"{agent.name} <updates@skandage.com>", to=[sub.email])
-                        msg.attach_alternative(html_content, "text/html")
-                        
-                        try:
-                            msg.send(fail_silently=False)
-                            CardLog.objects.create(agent=agent, subscriber=sub, card_template=template, occasion='Birthday', status='sent', scheduled_date=today, sent_at=timezone.now())
-                            self.stdout.write(self.style.SUCCESS(f"Auto-sent birthday card to {sub.name} for {agent.name}"))
-                        except Exception as e:
-                            self.stdout.write(self.style.ERROR(f"Failed to auto-send to {sub.name}: {e}"))
-                            CardLog.objects.create(agent=agent, subscriber=sub, card_template=template, occasion='Birthday', status='failed', scheduled_date=today, error_message=str(e))
-                
-                # --- MANUAL APPROVAL MODE ---
-                else:
-                    if sub.email:
-                        pending_count += 1
-                        CardLog.objects.create(agent=agent, subscriber=sub, card_template=template, occasion='Birthday', status='pending', scheduled_date=today)
-
-            # DISPATCH DIGEST EMAIL
-            if agent.automation_mode == 'manual' and pending_count > 0:
-                target_email = agent.notification_email if agent.notification_email else (agent.user.email if agent.user else None)
-                
-                if target_email:
-                    send_mail(
-                        subject=f"Action Required: {pending_count} Client Birthdays Today",
-                        message=f"Good morning {agent.name},\n\nYou have {pending_count} client birthdays today. Please log in to your Skandage dashboard to review and send their cards:\n\nhttps://app.skandage.com/dashboard/crm/pending/",
-                        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'updates@skandage.com'),
-                        recipient_list=[target_email],
-                        fail_silently=True,
-                    )
-                    self.stdout.write(self.style.NOTICE(f"Sent manual digest to {agent.name} at {target_email}"))
-
-        self.stdout.write(self.style.SUCCESS("Daily card processing complete."))
\ No newline at end of file
+        sent = sum(1 for log in logs if log.status == 'sent')
+        style = self.style.SUCCESS if sent == len(logs) else self.style.WARNING
+        return style(f"⏱ {agent.name}: auto-sent {sent}/{len(logs)} cards in {time.monotonic() - started:.1f}s")
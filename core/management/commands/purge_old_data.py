@@ -1,44 +1,73 @@
 import uuid
 from datetime import timedelta
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
-from core.models import Subscriber
+from core.models import Subscriber, SubscriberSearchToken
+
+# Each batch is its own short transaction, so a large purge never holds locks for long
+PURGE_BATCH_SIZE = 1000
+
 
 class Command(BaseCommand):
     help = 'Anonymizes soft-deleted client records older than 7 years (PDPA Compliance).'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Records anonymized per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be purged without changing anything')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+
         # Calculate the cutoff date (7 years ago)
         # Using 365.25 days to account for leap years
         cutoff_date = timezone.now() - timedelta(days=365.25 * 7)
-        
+
         # Find records that are archived, not yet anonymized, and older than the cutoff
         records_to_purge = Subscriber.objects.filter(
             is_active=False,
             is_anonymized=False,
             archived_at__lte=cutoff_date
         )
-        
+
         count = records_to_purge.count()
         if count == 0:
             self.stdout.write(self.style.SUCCESS("No records require purging today."))
             return
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Dry run: {count} expired records would be anonymized."))
+            return
+
+        # Plain UPDATEs by primary key: Subscriber.save() would decrypt and re-encrypt tags
+        # for every row only to throw the PII away.
+        done, last_pk = 0, 0
+        while True:
+            batch = list(records_to_purge.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1]
+
+            with transaction.atomic():
+                # 1. Mathematically destroy the encrypted payloads and mark as complete
+                done += records_to_purge.filter(pk__in=batch).update(
+                    encrypted_name=b'',
+                    encrypted_email=b'',
+                    encrypted_phone=b'',
+                    encrypted_address=b'',
+                    encrypted_dob=b'',
+                    encrypted_notes=b'',
+                    is_anonymized=True,
+                )
+
+                # 2. Randomize the hashes to break any database linking
+                Subscriber.objects.bulk_update([
+                    Subscriber(pk=pk, email_hash=f"scrubbed_{uuid.uuid4().hex}", name_hash=f"scrubbed_{uuid.uuid4().hex}")
+                    for pk in batch
+                ], ['email_hash', 'name_hash'])
+
+                # 3. Drop their blind search index tokens
+                SubscriberSearchToken.objects.filter(subscriber_id__in=batch).delete()
+
+            self.stdout.write(f"Anonymized {done}/{count} records...")
 
-        for sub in records_to_purge:
-            # 1. Mathematically destroy the encrypted payloads
-            sub.encrypted_name = b''
-            sub.encrypted_email = b''
-            sub.encrypted_phone = b''
-            sub.encrypted_address = b''
-            sub.encrypted_dob = b''
-            sub.encrypted_notes = b''
-            
-            # 2. Randomize the hashes to break any database linking
-            sub.email_hash = f"scrubbed_{uuid.uuid4().hex}"
-            sub.name_hash = f"scrubbed_{uuid.uuid4().hex}"
-            
-            # 3. Mark as complete
-            sub.is_anonymized = True
-            sub.save()
-
-        self.stdout.write(self.style.SUCCESS(f"Successfully anonymized {count} expired records."))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f"Successfully anonymized {done} expired records."))
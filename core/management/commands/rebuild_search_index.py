@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from core.models import Subscriber, SubscriberSearchToken
+
+class Command(BaseCommand):
+    help = 'Builds the blind search index for vault clients (only clients with no tokens unless --all).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild every client, not just unindexed ones')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        subscribers = Subscriber.objects.filter(is_anonymized=False)
+        if not options['all']:
+            subscribers = subscribers.filter(search_tokens__isnull=True)
+
+        batch_size = options['batch_size']
+        batch = []
+        indexed = 0
+        for sub in subscribers.decrypted('name', 'tags').iterator(chunk_size=batch_size):
+            batch.append(sub)
+            if len(batch) >= batch_size:
+                SubscriberSearchToken.index_subscribers(batch)
+                indexed += len(batch)
+                batch = []
+        SubscriberSearchToken.index_subscribers(batch)
+        indexed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} client records."))
@@ -0,0 +1,40 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (newsletters, bulk emails, lead notifications).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit instead of polling forever")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait between polls when the queue is empty")
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(self.style.SUCCESS(f"👷 Worker {worker} started."))
+
+        while True:
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            self.stdout.write(f"▶️  Running {job}")
+            job = run_job(job)
+            if job.status == 'done':
+                self.stdout.write(self.style.SUCCESS(f"✅ {job}: {job.result}"))
+            elif job.status == 'queued':
+                self.stdout.write(self.style.WARNING(f"🔁 {job} failed (attempt {job.attempts}), retrying after {job.run_after:%H:%M:%S}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"❌ {job} gave up after {job.attempts} attempts"))
+
+        self.stdout.write(self.style.SUCCESS("Queue drained."))
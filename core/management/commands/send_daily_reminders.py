@@ -1,85 +1,114 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
 from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
 from django.utils import timezone
-from core.models import Agent, Subscriber
-from core.festivals import FESTIVALS_2026
+from core.models import Agent, Subscriber, SubscriberSearchToken
+from core.events import birthday_window_q, next_birthday
+from core.festivals import get_festivals_for_date
 from django.core.mail import send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 
+# Digests are rendered and mailed side by side; each worker thread gets its own DB connection
+REMINDER_WORKERS = 4
+
+
 class Command(BaseCommand):
     help = 'Sends a consolidated daily email summary of CRM events (Birthdays, Reviews, Festivals) to all active agents.'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=REMINDER_WORKERS, help='Threads for rendering and sending digests')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
         today = timezone.now().date()
-        today_str = today.strftime('%Y-%m-%d')
-        
+
         # Determine if today is a festival
-        today_festivals = [name for name, date in FESTIVALS_2026.items() if date == today_str]
-        
-        agents = Agent.objects.filter(is_public=True)
-        emails_sent = 0
+        today_festivals = get_festivals_for_date(today.strftime('%Y-%m-%d'))
 
-        for agent in agents:
+        agents = {}
+        for agent in Agent.objects.filter(is_public=True).select_related('user'):
             # Check if agent has a notification email setup, else fallback to their login user email
-            recipient_email = getattr(agent, 'notification_email', None)
-            if not recipient_email and agent.user:
-                recipient_email = agent.user.email
-                
-            if not recipient_email:
+            if agent.notification_email or (agent.user and agent.user.email):
+                agents[agent.pk] = agent
+            else:
                 self.stdout.write(self.style.WARNING(f"Agent {agent.name} has no email configured. Skipping."))
-                continue
-
-            subscribers = agent.subscribers.filter(is_active=True)
-            
-            birthdays_today = []
-            reviews_today = []
-            festive_today = []
-
-            for sub in subscribers:
-                # 1. Check Birthdays
-                if sub.birth_month == today.month and sub.birth_day == today.day:
-                    birthdays_today.append(sub)
-                
-                # 2. Check Reviews
-                if sub.next_review_date == today:
-                    reviews_today.append(sub)
-                
-                # 3. Check Festivals (compare sub.tag_list with today_festivals)
-                if today_festivals:
-                    sub_tags = sub.tag_list
-                    matched_fests = [f for f in today_festivals if f in sub_tags]
-                    if matched_fests:
-                        festive_today.append({'subscriber': sub, 'festivals': matched_fests})
-
-            # If there's an event for exactly this agent today, send the consolidated email
-            if birthdays_today or reviews_today or festive_today:
-                
-                context = {
-                    'agent': agent,
-                    'date': today,
-                    'birthdays': birthdays_today,
-                    'reviews': reviews_today,
-                    'festivals': festive_today,
-                    'domain': agent.agency_site.domain if hasattr(agent, 'agency_site') and agent.agency_site else getattr(settings, 'SITE_URL', 'https://skandage.com')
-                }
-
-                html_message = render_to_string('core/emails/daily_crm_reminder.html', context)
-                plain_message = strip_tags(html_message)
-                subject = f"🔔 Your Daily Skandage CRM Summary ({today.strftime('%d %b %Y')})"
-                
-                try:
-                    send_mail(
-                        subject,
-                        plain_message,
-                        settings.DEFAULT_FROM_EMAIL,
-                        [recipient_email],
-                        html_message=html_message,
-                        fail_silently=False,
-                    )
-                    emails_sent += 1
-                    self.stdout.write(self.style.SUCCESS(f"Sent summary email to {agent.name} ({recipient_email})"))
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"Failed to send email to {agent.name}: {e}"))
-
-        self.stdout.write(self.style.SUCCESS(f"Successfully finished sending {emails_sent} CRM daily reminder emails."))
+
+        # 1. Only clients with an event today, across every agent, in one query. Birthdays and
+        #    reviews are plaintext columns; festival tags come from the blind index.
+        due = birthday_window_q(today, 0) | Q(next_review_date=today)
+        for festival in today_festivals:
+            due |= Q(pk__in=SubscriberSearchToken.matching(list(agents), 'tags', festival))
+        subscribers = (Subscriber.objects
+                       .filter(agent_id__in=agents, is_active=True)
+                       .filter(due)
+                       .decrypted('name', 'email', 'phone', 'tags'))
+
+        # 2. Sort them into each agent's digest
+        events = defaultdict(lambda: {'birthdays': [], 'reviews': [], 'festivals': []})
+        for sub in subscribers:
+            digest = events[sub.agent_id]
+            if sub.birth_month and sub.birth_day and next_birthday(sub.birth_month, sub.birth_day, today) == today:
+                digest['birthdays'].append(sub)
+            if sub.next_review_date == today:
+                digest['reviews'].append(sub)
+            if today_festivals:
+                matched_fests = [f for f in today_festivals if f in sub.tag_list]
+                if matched_fests:
+                    digest['festivals'].append({'subscriber': sub, 'festivals': matched_fests})
+
+        # 3. Render and send each digest from a thread pool
+        jobs = [(agents[pk], digest, today) for pk, digest in events.items() if any(digest.values())]
+        if options['workers'] > 1 and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(lambda job: self.send_digest_in_thread(*job), jobs))
+        else:
+            results = [self.send_digest(*job) for job in jobs]
+
+        emails_sent = 0
+        for sent, line in results:
+            emails_sent += sent
+            self.stdout.write(line)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully finished sending {emails_sent} CRM daily reminder emails "
+            f"({len(agents)} agents checked in {time.monotonic() - started:.1f}s)."
+        ))
+
+    def send_digest_in_thread(self, agent, digest, today):
+        try:
+            return self.send_digest(agent, digest, today)
+        finally:
+            connection.close()   # thread-local connection, not reused by the pool
+
+    def send_digest(self, agent, digest, today):
+        """Returns (1 if sent else 0, output line)."""
+        recipient_email = agent.notification_email or agent.user.email
+        context = {
+            'agent': agent,
+            'date': today,
+            **digest,
+            'domain': agent.agency_site.domain if hasattr(agent, 'agency_site') and agent.agency_site else getattr(settings, 'SITE_URL', 'https://skandage.com')
+        }
+
+        html_message = render_to_string('core/emails/daily_crm_reminder.html', context)
+        plain_message = strip_tags(html_message)
+        subject = f"🔔 Your Daily Skandage CRM Summary ({today.strftime('%d %b %Y')})"
+
+        try:
+            send_mail(
+                subject,
+                plain_message,
+                settings.DEFAULT_FROM_EMAIL,
+                [recipient_email],
+                html_message=html_message,
+                fail_silently=False,
+            )
+            return 1, self.style.SUCCESS(f"Sent summary email to {agent.name} ({recipient_email})")
+        except Exception as e:
+            return 0, self.style.ERROR(f"Failed to send email to {agent.name}: {e}")
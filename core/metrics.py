@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .events import birthday_window_q
+from .festivals import FESTIVALS_2026
+from .models import AgentDailyMetrics, Lead, Subscriber
+
+
+# ==========================================
+# DAILY METRICS ROLLUP
+# ==========================================
+# AgentDailyMetrics is bumped where views, leads and vCard downloads happen; events_due is
+# a snapshot taken when the dashboard (or the backfill) computes it.
+METRIC_WINDOWS = (7, 30, 90, 365)
+
+
+def events_due_count(agent, day):
+    """
+    Active clients with a birthday, policy review or tagged festival on `day`. Birthdays and
+    reviews are counted in SQL; festival tags are narrowed through the blind index and only
+    those candidates are decrypted, since 'New Year' also matches 'Lunar New Year' there.
+    """
+    active = agent.subscribers.filter(is_active=True)
+    due = birthday_window_q(day, 0) | Q(next_review_date=day)
+    count = active.filter(due).count()
+
+    day_str = day.strftime('%Y-%m-%d')
+    festivals = [name for name, d in FESTIVALS_2026.items() if d == day_str]
+    if festivals:
+        tagged = Q()
+        for festival in festivals:
+            tagged |= Q(pk__in=Subscriber.objects.search(agent, festival, fields=('tags',)).values('pk'))
+        candidates = active.filter(tagged).exclude(due).decrypted('tags')
+        count += sum(1 for sub in candidates if any(f in sub.tag_list for f in festivals))
+    return count
+
+
+def refresh_events_due(agent, day=None):
+    """Stores today's events_due snapshot, writing only when the count has changed."""
+    day = day or timezone.now().date()
+    count = events_due_count(agent, day)
+    stored = AgentDailyMetrics.objects.filter(agent=agent, date=day).values_list('events_due', flat=True).first()
+    if stored != count:
+        AgentDailyMetrics.objects.update_or_create(agent=agent, date=day, defaults={'events_due': count})
+    return count
+
+
+def metrics_series(agent, days, today=None):
+    """One AgentDailyMetrics per day for the last `days` days (oldest first); gaps are zero rows."""
+    today = today or timezone.now().date()
+    start = today - timedelta(days=days - 1)
+    stored = {m.date: m for m in AgentDailyMetrics.objects.filter(agent=agent, date__range=(start, today))}
+    return [
+        stored.get(day) or AgentDailyMetrics(agent=agent, date=day)
+        for day in (start + timedelta(days=i) for i in range(days))
+    ]
+
+
+@receiver(post_save, sender=Lead)
+def count_new_lead(sender, instance, created, **kwargs):
+    if created:
+        AgentDailyMetrics.bump(instance.agent, instance.created_at.date(), leads=1)
@@ -31,4 +31,14 @@ class AutoLogoutMiddleware:
             request.session['last_activity'] = current_time
 
         response = self.get_response(request)
-        return response
\ No newline at end of file
+        return response
+
+class TenantMiddleware:
+    """Attaches request.tenant from the in-memory host map (see core/tenants.py)."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from .tenants import get_host_map
+        request.tenant = get_host_map().resolve(request.get_host())
+        return self.get_response(request)
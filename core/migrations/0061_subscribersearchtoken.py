@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0060_agent_skip_passkey_prompt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriberSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=10)),
+                ('token', models.CharField(max_length=32)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.agent')),
+                ('subscriber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='core.subscriber')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['agent', 'field', 'token'], name='core_subscr_agent_i_83df36_idx')],
+                'unique_together': {('subscriber', 'field', 'token')},
+            },
+        ),
+    ]
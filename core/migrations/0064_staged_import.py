@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0063_newsletterdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('needs_freq_prompt', models.BooleanField(default=False)),
+                ('summary', models.JSONField(default=dict, help_text='Counts for the preview header (new, duplicate, race breakdown)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_imports', to='core.agent')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StagedImportRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('action', models.CharField(choices=[('add', 'Add New'), ('replace', 'Overwrite Existing'), ('skip', 'Skip')], default='skip', max_length=10)),
+                ('encrypted_payload', models.BinaryField()),
+                ('staged_import', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='core.stagedimport')),
+            ],
+            options={
+                'ordering': ['position'],
+                'unique_together': {('staged_import', 'position')},
+            },
+        ),
+    ]
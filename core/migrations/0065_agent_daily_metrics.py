@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-18 07:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0064_staged_import'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentDailyMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('leads', models.PositiveIntegerField(default=0)),
+                ('vcard_downloads', models.PositiveIntegerField(default=0)),
+                ('events_due', models.PositiveIntegerField(default=0, help_text='Birthdays, reviews and festivals due (snapshot)')),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_metrics', to='core.agent')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('agent', 'date')},
+            },
+        ),
+    ]
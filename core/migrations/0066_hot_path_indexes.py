@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0065_agent_daily_metrics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cardlog',
+            index=models.Index(fields=['agent', 'status', 'scheduled_date'], name='cardlog_agent_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cardlog',
+            index=models.Index(fields=['scheduled_date'], name='cardlog_scheduled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['agent', 'is_subscribed'], name='sub_agent_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['agent', 'name_hash'], name='sub_agent_name_hash_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['agent', 'next_review_date'], name='sub_agent_review_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['birth_month', 'birth_day'], name='sub_active_birthday_idx'),
+        ),
+    ]
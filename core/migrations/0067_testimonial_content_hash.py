@@ -0,0 +1,40 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:40
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_testimonials(apps, schema_editor):
+    # Mirrors core.models.testimonial_hash. Repeats already in the table keep a NULL hash,
+    # which the unique constraint ignores.
+    Testimonial = apps.get_model('core', 'Testimonial')
+    seen, hashed = set(), []
+    for t in Testimonial.objects.order_by('pk').only('pk', 'agent_id', 'client_name', 'review_text'):
+        normalized = '\n'.join(' '.join(str(part or '').lower().split()) for part in (t.client_name, t.review_text))
+        content_hash = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        if (t.agent_id, content_hash) not in seen:
+            seen.add((t.agent_id, content_hash))
+            t.content_hash = content_hash
+            hashed.append(t)
+    Testimonial.objects.bulk_update(hashed, ['content_hash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0066_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testimonial',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(hash_existing_testimonials, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='testimonial',
+            constraint=models.UniqueConstraint(fields=('agent', 'content_hash'), name='unique_testimonial_per_agent'),
+        ),
+    ]
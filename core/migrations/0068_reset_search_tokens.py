@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:10
+
+from django.db import migrations
+
+
+def drop_search_tokens(apps, schema_editor):
+    # Short queries now match 1-2 character substrings instead of word prefixes, so every
+    # client needs new tokens; rebuild_search_index (run on deploy) reindexes clients with none.
+    apps.get_model('core', 'SubscriberSearchToken').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0067_testimonial_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_tokens, migrations.RunPython.noop),
+    ]
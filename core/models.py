@@ -1,8 +1,11 @@
 import uuid
+import json
 from django.db import models
+from django.db.models.query import ModelIterable
 from django.utils.text import slugify
 from django.contrib.auth.models import User
 import hashlib
+import hmac
 from cryptography.fernet import Fernet
 from django.conf import settings
 from django.utils import timezone
@@ -14,6 +17,11 @@ from django.contrib.auth.models import User
 from django.utils.text import slugify
 from datetime import timedelta
 fernet = Fernet(settings.ENCRYPTION_KEY.encode() if isinstance(settings.ENCRYPTION_KEY, str) else settings.ENCRYPTION_KEY)
+# Keyed-HMAC secret for the vault search blind index. Derived from the Fernet key
+# (domain-separated) unless BLIND_INDEX_KEY is set explicitly.
+_blind_index_key = getattr(settings, 'BLIND_INDEX_KEY', None) or hashlib.sha256(
+    b'skandage-blind-index:' + (settings.ENCRYPTION_KEY.encode() if isinstance(settings.ENCRYPTION_KEY, str) else settings.ENCRYPTION_KEY)
+).digest()
 class Agent(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
@@ -122,6 +130,35 @@ class Testimonial(models.Model):
     is_featured = models.BooleanField(default=False)
     is_published = models.BooleanField(default=True)
     submission_date = models.DateTimeField(auto_now_add=True, null=True)
+    # Normalized client name + review text, so re-running an import can't add the same review twice
+    content_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['agent', 'content_hash'], name='unique_testimonial_per_agent'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_content = (instance.__dict__.get('client_name'), instance.__dict__.get('review_text'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Only rehash when the content changes: older duplicates kept a NULL hash in the
+        # backfill, and recomputing it on an unrelated edit would trip the unique constraint.
+        content = (self.client_name, self.review_text)
+        if content != getattr(self, '_loaded_content', None):
+            self.content_hash = testimonial_hash(*content)
+        super().save(*args, **kwargs)
+        self._loaded_content = content
+
+    def is_duplicate(self):
+        """True if another of the agent's testimonials has the same client and text."""
+        return Testimonial.objects.filter(
+            agent_id=self.agent_id, content_hash=testimonial_hash(self.client_name, self.review_text)
+        ).exclude(pk=self.pk).exists()
+
     def __str__(self):
         return f"{self.client_name}"
 
@@ -236,16 +273,97 @@ class Newsletter(models.Model):
     content = models.TextField(help_text="HTML content of the newsletter")
     attachment = models.FileField(upload_to='newsletters/attachments/', blank=True, null=True, help_text="Optional PDF attachment")
     html_file = models.FileField(upload_to='newsletters/html/', blank=True, null=True, help_text="Upload a custom HTML template")
-    status = models.CharField(max_length=20, choices=[('draft', 'Draft'), ('sent', 'Sent')], default='draft')
+    status = models.CharField(max_length=20, choices=[('draft', 'Draft'), ('sending', 'Sending'), ('sent', 'Sent')], default='draft')
     sent_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    def delivery_counts(self):
+        """{status: count} from the delivery ledger in one indexed GROUP BY — cheap enough to poll."""
+        rows = self.deliveries.values('status').annotate(n=models.Count('pk')).order_by()
+        counts = {status: 0 for status, _ in NewsletterDelivery.STATUS_CHOICES}
+        counts.update({row['status']: row['n'] for row in rows})
+        counts['total'] = sum(counts.values())
+        return counts
+
     def __str__(self):
         return self.subject
     
 def hash_email(email):
     return hashlib.sha256(email.lower().strip().encode('utf-8')).hexdigest()
 
+def testimonial_hash(client_name, review_text):
+    normalized = '\n'.join(' '.join(str(part or '').lower().split()) for part in (client_name, review_text))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+# ==========================================
+# BLIND INDEX (Encrypted Vault Search)
+# ==========================================
+def _normalise_search_text(text):
+    return ' '.join(str(text or '').lower().split())
+
+def search_grams(text):
+    """Every 1-, 2- and 3-character substring, so queries of any length match anywhere."""
+    text = _normalise_search_text(text)
+    return {text[i:i + n] for n in (1, 2, 3) for i in range(len(text) - n + 1)}
+
+def query_grams(query):
+    """Grams a record must contain to match `query` (its trigrams, or the query itself if < 3 chars)."""
+    query = _normalise_search_text(query)
+    if len(query) >= 3:
+        return {query[i:i + 3] for i in range(len(query) - 2)}
+    return {query} if query else set()
+
+def blind_index_token(agent_id, field, gram):
+    message = f"{agent_id}:{field}:{gram}".encode()
+    return hmac.new(_blind_index_key, message, hashlib.sha256).hexdigest()[:32]
+
+
+class DecryptedModelIterable(ModelIterable):
+    """Yields Subscribers with their encrypted payloads already decrypted (once per row)."""
+    def __iter__(self):
+        fields = self.queryset._decrypt_fields
+        for obj in super().__iter__():
+            obj.prime_decrypted(fields)
+            yield obj
+
+
+class SubscriberQuerySet(models.QuerySet):
+    _decrypt_fields = ()
+
+    def decrypted(self, *fields):
+        """
+        Bulk decryption API: every row's Fernet payloads are decrypted exactly once
+        as the row is loaded, then served from the per-instance cache.
+        Pass logical names (e.g. 'name', 'tags') to limit which payloads are decrypted.
+        """
+        unknown = set(fields) - set(Subscriber.ENCRYPTED_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown encrypted field(s): {', '.join(sorted(unknown))}")
+        clone = self._chain()
+        clone._iterable_class = DecryptedModelIterable
+        clone._decrypt_fields = fields or tuple(Subscriber.ENCRYPTED_FIELDS)
+        return clone
+
+    def search(self, agent, query, fields=None):
+        """
+        Blind-index search over name and tags (or just `fields`), answered entirely in SQL.
+        Trigram matching can return rare false positives, so callers should confirm
+        the substring on the (already small) decrypted result.
+        """
+        if not query_grams(query):
+            return self.none()
+        match = models.Q()
+        for field in fields or SubscriberSearchToken.SEARCH_FIELDS:
+            match |= models.Q(pk__in=SubscriberSearchToken.matching([agent.pk], field, query))
+        return self.filter(agent=agent).filter(match)
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._decrypt_fields = self._decrypt_fields
+        return clone
+
+
 class Subscriber(models.Model):
     agent = models.ForeignKey('Agent', on_delete=models.CASCADE, related_name='subscribers')
     archived_at = models.DateTimeField(null=True, blank=True, help_text="When the agent soft-deleted this record")
@@ -282,8 +400,34 @@ class Subscriber(models.Model):
     source = models.CharField(max_length=100, default='manual')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = SubscriberQuerySet.as_manager()
+
+    # Logical property name -> encrypted column
+    ENCRYPTED_FIELDS = {
+        'name': 'encrypted_name',
+        'email': 'encrypted_email',
+        'dob': 'encrypted_dob',
+        'race': 'encrypted_race',
+        'gender': 'encrypted_gender',
+        'tags': 'encrypted_tags',
+        'phone': 'encrypted_phone',
+        'address': 'encrypted_address',
+        'notes': 'encrypted_notes',
+    }
+
     class Meta:
-        unique_together = ('agent', 'email_hash')
+        unique_together = ('agent', 'email_hash')   # also serves (agent, email_hash) lookups
+        indexes = [
+            # Vault lists, exports and campaign recipients. Django filters booleans as a bare
+            # column test, which databases won't seek on, so is_active is the index condition.
+            models.Index(fields=['agent', 'is_subscribed'], condition=models.Q(is_active=True),
+                         name='sub_agent_active_idx'),
+            models.Index(fields=['agent', 'name_hash'], name='sub_agent_name_hash_idx'),
+            models.Index(fields=['agent', 'next_review_date'], name='sub_agent_review_idx'),
+            # Nightly birthday sweeps run across every agent, over active clients only
+            models.Index(fields=['birth_month', 'birth_day'], condition=models.Q(is_active=True),
+                         name='sub_active_birthday_idx'),
+        ]
 
     # ==========================================
     # SECURE PROPERTIES (Transparent Decryption)
@@ -301,6 +445,42 @@ class Subscriber(models.Model):
     def _encrypt_field(self, string_val):
         if not string_val: return b''
         return fernet.encrypt(str(string_val).encode())
+
+    # --- DECRYPTION CACHE ---
+    # Each entry is (ciphertext, plaintext). The ciphertext is compared by identity,
+    # so any direct assignment to an encrypted_* column (or refresh_from_db) misses the cache.
+    @property
+    def _decrypted_cache(self):
+        return self.__dict__.setdefault('_decrypted', {})
+
+    def _cached_decrypt(self, column):
+        raw = getattr(self, column)
+        entry = self._decrypted_cache.get(column)
+        if entry is not None and entry[0] is raw:
+            return entry[1]
+        value = self._decrypt_field(raw)
+        self._decrypted_cache[column] = (raw, value)
+        return value
+
+    def _set_encrypted(self, column, string_val):
+        """Encrypts into `column` and replaces the cached plaintext (setters never go stale)."""
+        encrypted = self._encrypt_field(string_val)
+        setattr(self, column, encrypted)
+        self._decrypted_cache[column] = (encrypted, str(string_val) if string_val else "")
+        if column in ('encrypted_name', 'encrypted_tags'):
+            self._search_dirty = True
+
+    def prime_decrypted(self, fields=None):
+        """Decrypt the given logical fields (default: all) into the cache in one pass."""
+        for field in fields or self.ENCRYPTED_FIELDS:
+            self._cached_decrypt(self.ENCRYPTED_FIELDS[field])
+
+    def __getstate__(self):
+        # Never let plaintext leak into pickles (cache backends, sessions)
+        state = super().__getstate__()
+        state.pop('_decrypted', None)
+        return state
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Remember the original race when the object is loaded from the database
@@ -308,47 +488,47 @@ class Subscriber(models.Model):
     # --- NAME ---
     @property
     def name(self):
-        return self._decrypt_field(self.encrypted_name)
+        return self._cached_decrypt('encrypted_name')
 
     @name.setter
     def name(self, value):
         val = value.strip() if value else ""
-        self.encrypted_name = self._encrypt_field(val)
+        self._set_encrypted('encrypted_name', val)
         self.name_hash = hashlib.sha256(val.lower().encode()).hexdigest() if val else ""
 
     # --- EMAIL ---
     @property
     def email(self):
-        return self._decrypt_field(self.encrypted_email)
+        return self._cached_decrypt('encrypted_email')
     @property
-    def phone(self): return self._decrypt_field(self.encrypted_phone)
+    def phone(self): return self._cached_decrypt('encrypted_phone')
     @phone.setter
-    def phone(self, value): self.encrypted_phone = self._encrypt_field(value)
+    def phone(self, value): self._set_encrypted('encrypted_phone', value)
 
     @property
-    def address(self): return self._decrypt_field(self.encrypted_address)
+    def address(self): return self._cached_decrypt('encrypted_address')
     @address.setter
-    def address(self, value): self.encrypted_address = self._encrypt_field(value)
+    def address(self, value): self._set_encrypted('encrypted_address', value)
 
     @property
-    def notes(self): return self._decrypt_field(self.encrypted_notes)
+    def notes(self): return self._cached_decrypt('encrypted_notes')
     @notes.setter
-    def notes(self, value): self.encrypted_notes = self._encrypt_field(value)
-    
+    def notes(self, value): self._set_encrypted('encrypted_notes', value)
+
     @email.setter
     def email(self, value):
         if value:
             clean_email = value.strip().lower()
             self.email_hash = hash_email(clean_email)
-            self.encrypted_email = self._encrypt_field(clean_email)
+            self._set_encrypted('encrypted_email', clean_email)
         else:
             self.email_hash = f"empty_{uuid.uuid4().hex}"
-            self.encrypted_email = b''
+            self._set_encrypted('encrypted_email', '')
 
     # --- DATE OF BIRTH ---
     @property
     def date_of_birth(self):
-        raw_date = self._decrypt_field(self.encrypted_dob)
+        raw_date = self._cached_decrypt('encrypted_dob')
         if raw_date:
             try: return datetime.strptime(raw_date, '%Y-%m-%d').date()
             except ValueError: return None
@@ -360,26 +540,26 @@ class Subscriber(models.Model):
             # Default to 1 Jan 2000 when no DOB is provided
             value = datetime(2000, 1, 1).date()
         # Store full date encrypted
-        self.encrypted_dob = self._encrypt_field(value.strftime('%Y-%m-%d'))
+        self._set_encrypted('encrypted_dob', value.strftime('%Y-%m-%d'))
         # Store harmless metadata for the SQL cron job
         self.birth_month = value.month
         self.birth_day = value.day
 
     # --- RACE, GENDER, TAGS ---
     @property
-    def race(self): return self._decrypt_field(self.encrypted_race) or 'O'
+    def race(self): return self._cached_decrypt('encrypted_race') or 'O'
     @race.setter
-    def race(self, value): self.encrypted_race = self._encrypt_field(value)
+    def race(self, value): self._set_encrypted('encrypted_race', value)
 
     @property
-    def gender(self): return self._decrypt_field(self.encrypted_gender) or 'U'
+    def gender(self): return self._cached_decrypt('encrypted_gender') or 'U'
     @gender.setter
-    def gender(self, value): self.encrypted_gender = self._encrypt_field(value)
+    def gender(self, value): self._set_encrypted('encrypted_gender', value)
 
     @property
-    def tags(self): return self._decrypt_field(self.encrypted_tags)
+    def tags(self): return self._cached_decrypt('encrypted_tags')
     @tags.setter
-    def tags(self, value): self.encrypted_tags = self._encrypt_field(value)
+    def tags(self, value): self._set_encrypted('encrypted_tags', value)
 
     @property
     def tag_list(self):
@@ -403,7 +583,11 @@ class Subscriber(models.Model):
         today = datetime.today().date()
         return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
 
-    def save(self, *args, **kwargs):
+    def apply_festival_tags(self):
+        """
+        Universal + race festival tags for a new client, or a race-tag swap when an existing
+        client's race changed. Called by save(); bulk writers must call it themselves.
+        """
         current_tags = self.tag_list
         race_tags_map = {
             'C': ['Lunar New Year', 'Mid-Autumn Festival'],
@@ -436,22 +620,183 @@ class Subscriber(models.Model):
                 if fest not in current_tags:
                     current_tags.append(fest)
 
-        # Repackage the tags into the encrypted string
-        self.tags = ", ".join(current_tags)
-        
+        # Repackage the tags into the encrypted string (skip re-encrypting if unchanged)
+        new_tags = ", ".join(current_tags)
+        if new_tags != self.tags:
+            self.tags = new_tags
+
         # Update the original race tracker so subsequent saves in the same session work
         self._original_race = self.race
 
+    def save(self, *args, **kwargs):
+        self.apply_festival_tags()
+        is_new = self.pk is None
+
         # --- ENCRYPTION SAFETY FALLBACK ---
         if not getattr(self, 'email_hash', ''):
             self.email_hash = f"empty_{uuid.uuid4().hex}"
 
         super().save(*args, **kwargs)
 
+        # --- BLIND INDEX MAINTENANCE ---
+        if is_new or self.__dict__.pop('_search_dirty', False):
+            SubscriberSearchToken.index_subscribers([self])
+
     def __str__(self):
         return self.name or "Unknown Encrypted Client"
+
+
+class SubscriberSearchToken(models.Model):
+    """
+    Blind index for vault search: keyed-HMAC tokens of name/tag 1-3 character substrings.
+    Tokens are salted per agent, so no plaintext (or cross-agent frequency) reaches the DB.
+    """
+    SEARCH_FIELDS = ('name', 'tags')
+
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='+')
+    subscriber = models.ForeignKey(Subscriber, on_delete=models.CASCADE, related_name='search_tokens')
+    field = models.CharField(max_length=10)
+    token = models.CharField(max_length=32)
+
+    class Meta:
+        unique_together = ('subscriber', 'field', 'token')
+        indexes = [models.Index(fields=['agent', 'field', 'token'])]
+
+    @classmethod
+    def tokens_for(cls, subscriber):
+        return [
+            cls(agent_id=subscriber.agent_id, subscriber=subscriber, field=field,
+                token=blind_index_token(subscriber.agent_id, field, gram))
+            for field in cls.SEARCH_FIELDS
+            for gram in search_grams(getattr(subscriber, field))
+        ]
+
+    @classmethod
+    def matching(cls, agent_ids, field, query):
+        """
+        Subquery of subscriber ids whose `field` holds every gram of `query`, for several
+        agents in one go (each agent's tokens are salted differently, so none cross over).
+        """
+        from django.db.models import Count
+        grams = query_grams(query)
+        tokens = {blind_index_token(agent_id, field, g) for agent_id in agent_ids for g in grams}
+        return (cls.objects
+                .filter(agent_id__in=agent_ids, field=field, token__in=tokens)
+                .values('subscriber_id')
+                .annotate(hits=Count('token', distinct=True))
+                .filter(hits=len(grams))
+                .values('subscriber_id'))
+
+    @classmethod
+    def index_subscribers(cls, subscribers, batch_size=1000):
+        """(Re)builds the tokens for the given saved subscribers in bulk."""
+        subscribers = list(subscribers)
+        if not subscribers:
+            return
+        cls.objects.filter(subscriber__in=[s.pk for s in subscribers]).delete()
+        rows = [token for sub in subscribers for token in cls.tokens_for(sub)]
+        cls.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
     
 
+class StagedImport(models.Model):
+    """
+    A parsed CSV/Excel upload waiting for the agent to review it. The rows live in
+    StagedImportRow, so the session only carries this id while the preview is open.
+    """
+    agent = models.ForeignKey('Agent', on_delete=models.CASCADE, related_name='staged_imports')
+    filename = models.CharField(max_length=255, blank=True)
+    needs_freq_prompt = models.BooleanField(default=False)
+    summary = models.JSONField(default=dict, help_text="Counts for the preview header (new, duplicate, race breakdown)")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def stage(cls, agent, parsed_rows, needs_freq_prompt=False, filename='', batch_size=500):
+        """Stores the parsed rows (encrypted), replacing any earlier unfinished import."""
+        cls.objects.filter(agent=agent).delete()
+        summary = {'total': len(parsed_rows), 'new': 0, 'duplicate': 0, 'C': 0, 'M': 0, 'I': 0, 'O': 0}
+        for row in parsed_rows:
+            if row.get('status') in ('new', 'duplicate'):
+                summary[row['status']] += 1
+            summary[row.get('race') if row.get('race') in ('C', 'M', 'I') else 'O'] += 1
+
+        staged = cls.objects.create(agent=agent, filename=filename[:255], needs_freq_prompt=needs_freq_prompt, summary=summary)
+        StagedImportRow.objects.bulk_create([
+            StagedImportRow(
+                staged_import=staged, position=i, action=row.get('action', 'skip'),
+                encrypted_payload=fernet.encrypt(json.dumps(row, default=str).encode()),
+            )
+            for i, row in enumerate(parsed_rows)
+        ], batch_size=batch_size)
+        return staged
+
+    def __str__(self):
+        return f"{self.agent} import #{self.pk} ({self.summary.get('total', 0)} rows)"
+
+
+class StagedImportRow(models.Model):
+    ACTION_CHOICES = [
+        ('add', 'Add New'),
+        ('replace', 'Overwrite Existing'),
+        ('skip', 'Skip'),
+    ]
+
+    staged_import = models.ForeignKey(StagedImport, on_delete=models.CASCADE, related_name='rows')
+    position = models.PositiveIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, default='skip')
+    encrypted_payload = models.BinaryField()   # the parsed row dict as JSON, Fernet-encrypted
+
+    class Meta:
+        unique_together = ('staged_import', 'position')
+        ordering = ['position']
+
+    @property
+    def data(self):
+        payload = self.encrypted_payload
+        if isinstance(payload, memoryview):
+            payload = bytes(payload)
+        return json.loads(fernet.decrypt(payload))
+
+
+class NewsletterDelivery(models.Model):
+    """
+    Per-recipient ledger for a broadcast. Rows are created up front for the whole audience,
+    so a resumed send only picks up the 'queued' ones and nobody gets the email twice.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('bounced', 'Bounced'),
+    ]
+
+    newsletter = models.ForeignKey(Newsletter, on_delete=models.CASCADE, related_name='deliveries')
+    subscriber = models.ForeignKey(Subscriber, on_delete=models.CASCADE, related_name='newsletter_deliveries')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    error = models.CharField(max_length=255, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('newsletter', 'subscriber')
+        indexes = [models.Index(fields=['newsletter', 'status'])]
+
+    @classmethod
+    def queue_audience(cls, newsletter, batch_size=1000):
+        """Bulk-insert a 'queued' row for every subscribed client; safe to call twice."""
+        audience = newsletter.agent.subscribers.filter(is_active=True, is_subscribed=True)
+        pks = audience.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+        batch = []
+        for pk in pks:
+            batch.append(cls(newsletter=newsletter, subscriber_id=pk))
+            if len(batch) >= batch_size:
+                cls.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            cls.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def __str__(self):
+        return f"{self.newsletter} -> {self.subscriber_id} ({self.status})"
+
+
 class CardTemplate(models.Model):
     """
     Phase 3: Asset Matrix — each card design has targeting rules.
@@ -554,6 +899,11 @@ class CardLog(models.Model):
         unique_together = ('subscriber', 'occasion', 'scheduled_date')
         # REMOVED 'subscriber__name' because the name is now fully encrypted
         ordering = ['-scheduled_date']
+        indexes = [
+            # Sent-card lookups for the event calendar, and the daily run's "already logged today"
+            models.Index(fields=['agent', 'status', 'scheduled_date'], name='cardlog_agent_status_idx'),
+            models.Index(fields=['scheduled_date'], name='cardlog_scheduled_idx'),
+        ]
 
     def __str__(self):
         return f"{self.occasion} for {self.subscriber.name} ({self.status})"
@@ -669,6 +1019,34 @@ class DailyProfileView(models.Model):
         unique_together = ('agent', 'date')
         ordering = ['-date']
 
+class AgentDailyMetrics(models.Model):
+    """
+    One row per agent per day, bumped by the write paths (profile views, leads, vCard
+    downloads) so the stats dashboard reads any window with a single range query.
+    """
+    COUNTERS = ('views', 'leads', 'vcard_downloads')
+
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='daily_metrics')
+    date = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    leads = models.PositiveIntegerField(default=0)
+    vcard_downloads = models.PositiveIntegerField(default=0)
+    events_due = models.PositiveIntegerField(default=0, help_text="Birthdays, reviews and festivals due (snapshot)")
+
+    class Meta:
+        unique_together = ('agent', 'date')
+        ordering = ['-date']
+
+    @classmethod
+    def bump(cls, agent, day=None, **deltas):
+        """Atomically add to today's (or `day`'s) counters, e.g. bump(agent, views=1)."""
+        day = day or timezone.now().date()
+        row, _ = cls.objects.get_or_create(agent=agent, date=day)
+        cls.objects.filter(pk=row.pk).update(**{name: models.F(name) + n for name, n in deltas.items()})
+
+    def __str__(self):
+        return f"{self.agent} {self.date}"
+
 class PasskeyCredential(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='passkeys')
     name = models.CharField(max_length=255, help_text="e.g. 'iPhone 15' or 'MacBook Pro'")
@@ -680,4 +1058,66 @@ class PasskeyCredential(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.user.username} - {self.name}"
\ No newline at end of file
+        return f"{self.user.username} - {self.name}"
+
+# ==========================================
+# BACKGROUND JOB QUEUE
+# ==========================================
+class BackgroundJob(models.Model):
+    """
+    A unit of work (mostly outbound email) picked up by `manage.py run_worker`,
+    so views never hold a request open while talking to SMTP.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='jobs', null=True, blank=True)
+    kind = models.CharField(max_length=50, help_text="Registered handler name, e.g. 'send_newsletter'")
+    payload = models.JSONField(default=dict, blank=True)
+    state = models.JSONField(default=dict, blank=True, help_text="Handler checkpoint so retries resume instead of restarting")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    result = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    @property
+    def percent(self):
+        if not self.progress_total:
+            return 100 if self.status == 'done' else 0
+        return min(100, int(self.progress_done * 100 / self.progress_total))
+
+    def set_progress(self, done, total=None, **state):
+        """
+        Record progress (and optionally a resume checkpoint) from inside a handler. Also a
+        heartbeat: refreshing locked_at keeps a long run from being reclaimed as stale.
+        """
+        self.progress_done = done
+        if total is not None:
+            self.progress_total = total
+        self.state.update(state)
+        self.locked_at = timezone.now()
+        BackgroundJob.objects.filter(pk=self.pk).update(
+            progress_done=self.progress_done, progress_total=self.progress_total, state=self.state,
+            locked_at=self.locked_at,
+        )
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
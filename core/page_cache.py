@@ -0,0 +1,115 @@
+import re
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .counters import count_profile_view
+from .models import Agent, Article, Credential, Service, Testimonial
+
+
+# ==========================================
+# PUBLIC MICROSITE PAGE CACHE
+# ==========================================
+# Anonymous GETs of an agent's public pages are served from the cache. Entries are keyed by
+# host + path under a per-agent (or per-article) generation token; saving or deleting the
+# agent or any of their testimonials, services, credentials or articles drops the token,
+# which orphans every cached page for that agent at once. Theme and bespoke-template
+# switches are Agent saves, so they invalidate too.
+#
+# With the default per-process LocMemCache, other workers only notice after
+# PAGE_CACHE_SECONDS; point CACHES at a shared backend for instant invalidation.
+CSRF_PLACEHOLDER = b'__page_cache_csrf__'
+CSRF_INPUT = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+def _generation(scope):
+    return cache.get_or_set(f'page-gen:{scope}', lambda: uuid.uuid4().hex, None)
+
+
+def _cacheable(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # A pending flash message ("Your message has been sent") must be rendered, not a stale page
+    return 'messages' not in request.COOKIES and '_messages' not in request.session
+
+
+def cached_public_page(scope, count_views=False):
+    """
+    scope(kwargs) names the invalidation group, e.g. 'agent:<slug>'.
+    count_views=True keeps agent_profile's once-per-session view counting on cache hits.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable(request):
+                return view(request, *args, **kwargs)
+
+            key = f"page:{_generation(scope(kwargs))}:{request.get_host().lower()}:{request.get_full_path()}"
+            entry = cache.get(key)
+            if entry is not None:
+                if count_views and entry['agent_id'] and not request.session.get(f"viewed_agent_{entry['agent_id']}"):
+                    count_profile_view(entry['agent_id'])
+                    request.session[f"viewed_agent_{entry['agent_id']}"] = True
+                content = entry['content']
+                if CSRF_PLACEHOLDER in content:
+                    content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+                return HttpResponse(content, content_type=entry['content_type'])
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                content = response.content
+                # The form token belongs to this visitor; cache a placeholder instead
+                match = CSRF_INPUT.search(content)
+                if match:
+                    content = content.replace(match.group(1), CSRF_PLACEHOLDER)
+                agent_id = None
+                if count_views:
+                    agent_id = Agent.objects.filter(slug=kwargs.get('slug')).values_list('pk', flat=True).first()
+                cache.set(key, {
+                    'content': content, 'content_type': response['Content-Type'], 'agent_id': agent_id,
+                }, getattr(settings, 'PAGE_CACHE_SECONDS', 300))
+            return response
+        return wrapper
+    return decorator
+
+
+def agent_scope(kwargs):
+    return f"agent:{kwargs['slug']}"
+
+
+def article_scope(kwargs):
+    return f"article:{kwargs['slug']}"
+
+
+def invalidate_agent_pages(agent_id):
+    agent = Agent.objects.filter(pk=agent_id).values_list('slug', flat=True).first()
+    scopes = [f'agent:{agent}'] if agent else []
+    scopes += [f'article:{slug}' for slug in Article.objects.filter(agent_id=agent_id).values_list('slug', flat=True)]
+    cache.delete_many([f'page-gen:{scope}' for scope in scopes])
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def invalidate_agent(sender, instance, **kwargs):
+    cache.delete(f'page-gen:agent:{instance.slug}')
+    invalidate_agent_pages(instance.pk)
+
+
+@receiver(post_save, sender=Testimonial)
+@receiver(post_delete, sender=Testimonial)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Credential)
+@receiver(post_delete, sender=Credential)
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+def invalidate_agent_content(sender, instance, **kwargs):
+    if sender is Article:
+        cache.delete(f'page-gen:article:{instance.slug}')
+    invalidate_agent_pages(instance.agent_id)
@@ -0,0 +1,62 @@
+from datetime import date
+
+import numpy as np
+from django.db import transaction
+
+from .models import Subscriber
+
+
+# ==========================================
+# REVIEW SCHEDULE ENGINE
+# ==========================================
+# Rescheduling a whole vault only touches plaintext columns (last_review_date,
+# review_freq_months, next_review_date), so nothing is decrypted or re-encrypted: the
+# rows are read as tuples, the dates computed in one numpy pass, and written back with
+# chunked bulk_update.
+REVIEW_BATCH_SIZE = 1000
+
+
+def add_months(dates, months):
+    """
+    Vectorized add_months_to_date: each date plus its months, clamped to the end of the
+    target month (31 Jan + 1 -> 28/29 Feb). `months` may be a scalar or one per date.
+    Returns a list of datetime.date.
+    """
+    days = np.asarray(dates, dtype='datetime64[D]')
+    if not days.size:
+        return []
+    month_start = days.astype('datetime64[M]')
+    target = month_start + np.asarray(months, dtype='int64')
+    target_start = target.astype('datetime64[D]')
+    month_length = (target + 1).astype('datetime64[D]') - target_start
+    offset = np.minimum(days - month_start.astype('datetime64[D]'), month_length - np.timedelta64(1, 'D'))
+    return list((target_start + offset).astype(object))
+
+
+def reschedule_reviews(subscribers, freq_months=None, today=None, batch_size=REVIEW_BATCH_SIZE):
+    """
+    Recomputes next_review_date = (last_review_date or today) + frequency for every row of
+    the `subscribers` queryset. With freq_months, that frequency is also stored on every
+    row; without it, each row keeps its own review_freq_months (rows without one are left
+    alone). Returns the number of subscribers updated.
+    """
+    today = today or date.today()
+    rows = subscribers.values_list('pk', 'last_review_date', 'review_freq_months')
+    if freq_months is None:
+        rows = rows.filter(review_freq_months__gt=0)
+    rows = list(rows)
+    if not rows:
+        return 0
+
+    pks, last_reviews, freqs = zip(*rows)
+    if freq_months is not None:
+        freqs = [freq_months] * len(pks)
+    next_reviews = add_months([last or today for last in last_reviews], freqs)
+
+    updates = [
+        Subscriber(pk=pk, review_freq_months=freq, next_review_date=next_review)
+        for pk, freq, next_review in zip(pks, freqs, next_reviews)
+    ]
+    with transaction.atomic():
+        Subscriber.objects.bulk_update(updates, ['review_freq_months', 'next_review_date'], batch_size=batch_size)
+    return len(updates)
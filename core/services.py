@@ -0,0 +1,64 @@
+import time
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import CardTemplate
+
+
+# ==========================================
+# CARD MATCHMAKER
+# ==========================================
+# Each worker keeps a per-agent index of active templates. Saving or deleting a template
+# drops that agent's index; the TTL bounds staleness in other worker processes, which do
+# not see the signal.
+TEMPLATE_INDEX_TTL_SECONDS = 300
+
+_template_indexes = {}
+
+
+class TemplateIndex:
+    """Active templates for one agent, keyed by occasion and gender, most specific first."""
+
+    def __init__(self, templates):
+        self.built_at = time.monotonic()
+        self.slots = {}
+        for template in templates:
+            self.slots.setdefault((template.occasion, template.target_gender), []).append(template)
+        for candidates in self.slots.values():
+            # Narrower age band beats wider; name keeps the order stable
+            candidates.sort(key=lambda t: (t.target_age_max - t.target_age_min, t.target_age_min, t.name))
+
+    def match(self, occasion, gender, age=None):
+        """Best template for the demographics, or None. An unknown age matches any band."""
+        slots = [(occasion, gender)] if gender in ('M', 'F') else []
+        slots.append((occasion, 'A'))  # gender-specific beats 'Any Gender'
+        for slot in slots:
+            for template in self.slots.get(slot, ()):
+                if age is None or template.target_age_min <= age <= template.target_age_max:
+                    return template
+        return None
+
+
+def get_template_index(agent):
+    index = _template_indexes.get(agent.pk)
+    if index is None or time.monotonic() - index.built_at > TEMPLATE_INDEX_TTL_SECONDS:
+        index = TemplateIndex(CardTemplate.objects.filter(agent=agent, is_active=True))
+        _template_indexes[agent.pk] = index
+    return index
+
+
+def get_best_card_for_subscriber(agent, subscriber, occasion, age=None):
+    """
+    Picks the card template that best fits a subscriber for an occasion.
+    Pass age to override the subscriber's current age (e.g. the age they are turning).
+    """
+    if age is None:
+        age = subscriber.age
+    return get_template_index(agent).match(occasion, subscriber.gender, age)
+
+
+@receiver(post_save, sender=CardTemplate)
+@receiver(post_delete, sender=CardTemplate)
+def invalidate_template_index(sender, instance, **kwargs):
+    _template_indexes.pop(instance.agent_id, None)
@@ -0,0 +1,397 @@
+import smtplib
+from datetime import datetime
+from email.mime.application import MIMEApplication
+
+from django.conf import settings
+from django.core.mail import get_connection, EmailMultiAlternatives
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .jobs import job
+from .models import Article, CardLog, CardTemplate, Lead, Newsletter, NewsletterDelivery, Subscriber
+
+PROGRESS_EVERY = 25   # progress writes are batched so the job row isn't updated per email
+
+
+def absolute_url(site_url, url):
+    """Media URLs are relative on local storage and absolute on S3."""
+    if url and not url.startswith('http'):
+        return f"{site_url}{url}"
+    return url or ""
+
+
+# ==========================================
+# EMAIL BUILDERS (shared by views and jobs)
+# ==========================================
+def build_card_email(agent, sub, template, occasion_type, custom_message, site_url):
+    if occasion_type == 'Birthday':
+        subject = f"Happy Birthday, {sub.name}!"
+        emoji = '🎂'
+    else:
+        subject = f"Happy {occasion_type}, {sub.name}!"
+        from core.views import OCCASION_DEMOGRAPHIC_MAP
+        emoji = OCCASION_DEMOGRAPHIC_MAP.get(occasion_type, {}).get('emoji', '🎉')
+
+    context = {
+        'client_name': sub.name,
+        'agent': agent,
+        'occasion': occasion_type,
+        'message': custom_message or template.default_message,
+        'card_image_url': absolute_url(site_url, template.image.url if template.image else ""),
+        'agent_headshot_url': absolute_url(site_url, agent.headshot.url if agent.headshot else ""),
+        'occasion_emoji': emoji
+    }
+    html_content = render_to_string('core/emails/card_email.html', context)
+
+    msg = EmailMultiAlternatives(
+        subject=subject, body=strip_tags(html_content),
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', f"{agent.name} <updates@skandage.com>"),
+        to=[sub.email]
+    )
+    msg.attach_alternative(html_content, "text/html")
+    return msg
+
+
+def build_review_reminder_email(agent, sub, site_url):
+    context = {
+        'client_name': sub.name,
+        'agent': agent,
+        'next_review_date': sub.next_review_date,
+        'agent_headshot_url': absolute_url(site_url, agent.headshot.url if agent.headshot else ""),
+        'site_url': site_url,
+    }
+    html_content = render_to_string('core/emails/review_reminder_email.html', context)
+    msg = EmailMultiAlternatives(
+        subject=f"Your Annual Review is Coming Up — {sub.name}",
+        body=strip_tags(html_content),
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', f"{agent.name} <updates@skandage.com>"),
+        to=[sub.email]
+    )
+    msg.attach_alternative(html_content, "text/html")
+    return msg
+
+
+# ==========================================
+# NEWSLETTER PIPELINE
+# ==========================================
+# Recipients are streamed from the DB, rendered and sent in bounded chunks over one SMTP
+# connection, so memory stays flat regardless of audience size. Outcomes go to the
+# NewsletterDelivery ledger after every chunk; a retry only sends the rows still 'queued'.
+NEWSLETTER_CHUNK_SIZE = 100
+
+# Errors that only concern one recipient; anything else (dropped connection, auth) aborts the
+# run and lets the job retry with whatever is still queued.
+RECIPIENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read_newsletter_file(field_file):
+    if not field_file:
+        return None
+    try:
+        field_file.open()
+        try: return field_file.read()
+        finally: field_file.close()
+    except Exception as e:
+        print(f"Newsletter File Read Error: {e}")
+        return None
+
+
+def newsletter_messages(newsletter, subscribers, site_url, pdf_url=""):
+    """Yields (subscriber, message) lazily; the PDF part is built once and shared."""
+    agent = newsletter.agent
+    from_email = f"{agent.name} <updates@skandage.com>"
+
+    pdf_part = None
+    file_content = _read_newsletter_file(newsletter.attachment)
+    if file_content:
+        # Inline disposition triggers Apple Mail's native preview
+        pdf_part = MIMEApplication(file_content, _subtype="pdf")
+        pdf_part.add_header('Content-Disposition', 'inline', filename=newsletter.attachment.name.split('/')[-1])
+
+    html_bytes = _read_newsletter_file(newsletter.html_file)
+    custom_html_template = html_bytes.decode('utf-8', errors='ignore') if html_bytes else ""
+
+    # If there's a PDF, generate a massive, beautiful button
+    pdf_button_html = ""
+    if pdf_url:
+        pdf_button_html = f"""
+        <div style="text-align: center; margin: 30px 0;">
+            <a href="{pdf_url}" target="_blank" style="background-color: #2563eb; color: #ffffff; padding: 16px 32px; text-decoration: none; border-radius: 8px; font-weight: bold; font-size: 16px; display: inline-block; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
+                📄 View Full PDF Newsletter
+            </a>
+        </div>
+        """
+
+    for sub in subscribers:
+        client_name = sub.name or "there"
+        unsub_url = f"{site_url}{reverse('unsubscribe', args=[sub.unsubscribe_token])}"
+
+        # --- LOGIC: CHOOSE BETWEEN HTML FILE OR TEXT EDITOR ---
+        if custom_html_template:
+            html_message = custom_html_template.replace('{{ client_name }}', client_name)
+            if pdf_button_html:
+                html_message += pdf_button_html
+        else:
+            # Standard Text Editor fallback with the PDPA footer
+            html_message = f"""
+            <div style="font-family: sans-serif; max-width: 600px; margin: 0 auto; color: #1c1917; line-height: 1.6;">
+                <p>Hi {client_name},</p>
+                {newsletter.content}
+                {pdf_button_html}
+                <br>
+                <p>Best regards,<br><strong>{agent.name}</strong><br>{agent.title} at {agent.company}</p>
+
+                <hr style="border: 0; border-top: 1px solid #e5e7eb; margin-top: 40px; margin-bottom: 20px;">
+                <p style="font-size: 11px; color: #9ca3af; text-align: center;">
+                    You are receiving this email because you are a registered client of {agent.name}.<br>
+                    <a href="{unsub_url}" style="color: #6b7280; text-decoration: underline;">Unsubscribe from future updates</a>
+                </p>
+            </div>
+            """
+
+        msg = EmailMultiAlternatives(
+            subject=newsletter.subject,
+            body=strip_tags(html_message),
+            from_email=from_email,
+            to=[sub.email]
+        )
+        msg.attach_alternative(html_message, "text/html")
+        if pdf_part is not None:
+            msg.attach(pdf_part)
+        yield sub, msg
+
+
+def _record_deliveries(newsletter, sent_ids, failures):
+    """Flush one chunk's outcomes to the ledger: one UPDATE for the sent rows, one per failure."""
+    deliveries = NewsletterDelivery.objects.filter(newsletter=newsletter)
+    if sent_ids:
+        deliveries.filter(subscriber_id__in=sent_ids).update(status='sent', sent_at=timezone.now())
+    for sub_id, status, error in failures:
+        deliveries.filter(subscriber_id=sub_id).update(status=status, error=error[:255])
+
+
+@job('send_newsletter')
+def send_newsletter_job(job, newsletter_id, site_url, pdf_url=""):
+    newsletter = Newsletter.objects.select_related('agent').get(pk=newsletter_id)
+    if newsletter.status == 'sent':
+        return "Already sent"
+
+    # First run fixes the audience in the ledger; a resumed run just continues with it
+    if newsletter.status == 'draft':
+        NewsletterDelivery.queue_audience(newsletter)
+        newsletter.status = 'sending'
+        newsletter.save(update_fields=['status'])
+
+    pending = Subscriber.objects.filter(
+        newsletter_deliveries__newsletter=newsletter, newsletter_deliveries__status='queued'
+    ).order_by('pk')
+    stream = pending.decrypted('name', 'email').iterator(chunk_size=NEWSLETTER_CHUNK_SIZE)
+
+    with get_connection() as connection:
+        for chunk in chunked(newsletter_messages(newsletter, stream, site_url, pdf_url), NEWSLETTER_CHUNK_SIZE):
+            sent_ids, failures = [], []
+            try:
+                for sub, msg in chunk:
+                    try:
+                        connection.send_messages([msg])
+                        sent_ids.append(sub.pk)
+                    except smtplib.SMTPRecipientsRefused as e:
+                        failures.append((sub.pk, 'bounced', str(e)))
+                    except RECIPIENT_ERRORS as e:
+                        failures.append((sub.pk, 'failed', str(e)))
+            finally:
+                # Record what went out even if the connection dies mid-chunk
+                _record_deliveries(newsletter, sent_ids, failures)
+                counts = newsletter.delivery_counts()
+                job.set_progress(counts['total'] - counts['queued'], counts['total'])
+
+    counts = newsletter.delivery_counts()
+    job.set_progress(counts['total'] - counts['queued'], counts['total'])
+    newsletter.status = 'sent'
+    newsletter.sent_at = timezone.now()
+    newsletter.save(update_fields=['status', 'sent_at'])
+
+    undelivered = counts['failed'] + counts['bounced']
+    if undelivered:
+        return f"Sent to {counts['sent']} clients; {undelivered} failed."
+    return f"Sent to {counts['sent']} clients."
+
+
+# ==========================================
+# JOB HANDLERS
+# ==========================================
+@job('email_article')
+def email_article_job(job, article_id, site_url):
+    article = Article.objects.select_related('agent').get(pk=article_id)
+    agent = article.agent
+    article_url = f"{site_url}{reverse('article_detail', args=[article.slug])}"
+
+    subscribers = agent.subscribers.filter(is_active=True, pk__gt=job.state.get('last_pk', 0)).order_by('pk')
+    total = job.progress_total or subscribers.count()
+    done = job.progress_done
+    sent_count = job.state.get('sent', 0)
+
+    # Each chunk goes out as one send_messages() call so a pooled backend can pipeline it
+    connection = get_connection(fail_silently=True)
+    stream = subscribers.decrypted('name', 'email').iterator(chunk_size=PROGRESS_EVERY)
+    for chunk in chunked(stream, PROGRESS_EVERY):
+        batch = []
+        for sub in chunk:
+            if not sub.email:
+                continue
+            client_name = sub.name or "there"
+
+            # Create a simple, clean HTML email template dynamically
+            html_content = f"""
+            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; color: #333;">
+                <p>Hi {client_name},</p>
+                <p>I just published a new article that I thought you might find valuable:</p>
+                <h2 style="color: #2563eb;">{article.title}</h2>
+                <p style="color: #666; font-style: italic;">{strip_tags(article.content)[:200]}...</p>
+                <div style="margin-top: 30px; text-align: center;">
+                    <a href="{article_url}" style="background-color: #2563eb; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">Read Full Article</a>
+                </div>
+                <hr style="margin-top: 40px; border: 0; border-top: 1px solid #eee;">
+                <p style="font-size: 12px; color: #999;">Sent by {agent.name} via Skandage</p>
+            </div>
+            """
+            msg = EmailMultiAlternatives(
+                subject=f"New Article: {article.title}",
+                body=strip_tags(html_content),
+                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', f"{agent.name} <updates@skandage.com>"),
+                to=[sub.email]
+            )
+            msg.attach_alternative(html_content, "text/html")
+            batch.append(msg)
+
+        sent_count += connection.send_messages(batch)
+        done += len(chunk)
+        job.set_progress(done, total, last_pk=chunk[-1].pk, sent=sent_count)
+
+    job.set_progress(done, total, sent=sent_count)
+    return f"Article emailed to {sent_count} clients."
+
+
+@job('review_reminders')
+def review_reminders_job(job, subscriber_ids, site_url):
+    agent = job.agent
+    subscribers = Subscriber.objects.filter(
+        pk__in=subscriber_ids, agent=agent, is_active=True, pk__gt=job.state.get('last_pk', 0)
+    ).order_by('pk')
+    # Selected clients that were since deleted, archived or moved aren't part of the total
+    total = job.progress_total or subscribers.count()
+    done = job.progress_done
+    sent = job.state.get('sent', 0)
+    failed = job.state.get('failed', 0)
+
+    # Each chunk goes out as one send_messages() call. Clients without an email, or whose
+    # email can't be built or delivered, count as failed.
+    connection = get_connection(fail_silently=True)
+    stream = subscribers.decrypted('name', 'email').iterator(chunk_size=PROGRESS_EVERY)
+    for chunk in chunked(stream, PROGRESS_EVERY):
+        batch = []
+        for sub in chunk:
+            if sub.email:
+                try:
+                    batch.append(build_review_reminder_email(agent, sub, site_url))
+                except Exception:
+                    continue
+        delivered = connection.send_messages(batch) if batch else 0
+        sent += delivered
+        failed += len(chunk) - delivered
+        done += len(chunk)
+        job.set_progress(done, total, last_pk=chunk[-1].pk, sent=sent, failed=failed)
+
+    result = f"Review reminders sent to {sent} client(s)"
+    if failed:
+        result += f"; {failed} could not be emailed"
+    missing = len(subscriber_ids) - total
+    if missing > 0:
+        result += f"; {missing} selected client(s) are no longer active"
+    return result + "."
+
+
+@job('send_cards')
+def send_cards_job(job, items, custom_message, site_url):
+    """items: [sub_id, template_id, occasion, 'YYYY-MM-DD'] rows from the upcoming events page."""
+    agent = job.agent
+    start = job.progress_done
+    sent_count = job.state.get('sent', 0)
+
+    for i, (sub_id, temp_id, occasion_type, event_date_str) in enumerate(items[start:], start=start):
+        try:
+            sub = Subscriber.objects.get(pk=sub_id, agent=agent)
+            template = CardTemplate.objects.get(pk=temp_id, agent=agent)
+            scheduled_date = datetime.strptime(event_date_str, '%Y-%m-%d').date() if event_date_str else timezone.localdate()
+
+            if sub.email and not CardLog.objects.filter(subscriber=sub, occasion=occasion_type, scheduled_date=scheduled_date, status='sent').exists():
+                build_card_email(agent, sub, template, occasion_type, custom_message, site_url).send(fail_silently=False)
+                CardLog.objects.create(
+                    agent=agent, subscriber=sub, card_template=template,
+                    occasion=occasion_type, status='sent', scheduled_date=scheduled_date,
+                    sent_at=timezone.now()
+                )
+                sent_count += 1
+        except Exception as e:
+            print(f"Batch Send Error: {e}")
+        job.set_progress(i + 1, len(items), sent=sent_count)
+
+    return f"Sent {sent_count} personalized cards."
+
+
+@job('lead_notification')
+def lead_notification_job(job, lead_id, domain):
+    lead = Lead.objects.select_related('agent__user').get(pk=lead_id)
+    html_body = render_to_string('core/emails/new_lead.html', {'lead': lead, 'domain': domain})
+
+    notification = EmailMultiAlternatives(
+        subject=f"New Lead: {lead.name} just inquired on your profile!",
+        body=strip_tags(html_body),
+        from_email=f"Skandage <updates@skandage.com>",
+        to=[lead.agent.user.email],
+    )
+    notification.attach_alternative(html_body, "text/html")
+    notification.send(fail_silently=False)
+    return f"Notified {lead.agent.name}."
+
+
+@job('coverage_report')
+def coverage_report_job(job, client_email, client_name, figures, site_url):
+    agent = job.agent
+    context = dict(figures, agent=agent, client_name=client_name, site_url=site_url)
+    html_content = render_to_string('core/emails/coverage_report.html', context)
+
+    msg = EmailMultiAlternatives(
+        subject=f"Your Coverage Gap Analysis - {agent.name}",
+        body=strip_tags(html_content),
+        from_email=f"{agent.name} <reports@skandage.com>",
+        to=[client_email]
+    )
+    msg.attach_alternative(html_content, "text/html")
+    msg.send(fail_silently=False)
+    return f"Coverage report sent to {client_email}."
+
+
+@job('import_testimonials')
+def import_testimonials_job(job, target_url, css_selector):
+    from .utils import scrape_and_save_testimonials
+
+    saved, found = scrape_and_save_testimonials(job.agent, target_url, css_selector, progress=job.set_progress)
+    if found == 0:
+        return "Found 0 reviews. Check the CSS selector."
+    if saved < found:
+        return f"Imported {saved} testimonials; {found - saved} were already on your profile."
+    return f"Imported {saved} testimonials."
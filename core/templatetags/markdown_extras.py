@@ -1,10 +1,34 @@
+import threading
+from functools import lru_cache
+
 from django import template
 from django.template.defaultfilters import stringfilter
 import markdown as md
 
 register = template.Library()
 
+# Building a Markdown pipeline (extension loading, regex compilation) costs more than
+# converting a bio, so each thread keeps one and resets it between documents. Rendered
+# HTML is memoised by source text, so an unchanged bio is only converted once per process.
+MARKDOWN_EXTENSIONS = ['markdown.extensions.fenced_code']
+MARKDOWN_CACHE_SIZE = 512
+
+_thread = threading.local()
+
+
+def _converter():
+    converter = getattr(_thread, 'converter', None)
+    if converter is None:
+        converter = _thread.converter = md.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return converter
+
+
+@lru_cache(maxsize=MARKDOWN_CACHE_SIZE)
+def render_markdown(value):
+    return _converter().reset().convert(value)
+
+
 @register.filter()
 @stringfilter
 def markdown(value):
-    return md.markdown(value, extensions=['markdown.extensions.fenced_code'])
\ No newline at end of file
+    return render_markdown(value)
@@ -0,0 +1,106 @@
+import time
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Agency, Agent
+
+
+# ==========================================
+# HOST -> TENANT RESOLUTION
+# ==========================================
+# Every public request used to query Agency/Agent by domain before picking a view. The
+# host map below is built once per process (two small queries), dropped whenever an Agent
+# or Agency is saved or deleted, and rebuilt after TENANT_MAP_TTL_SECONDS so other worker
+# processes, which don't see the signal, catch up.
+TENANT_MAP_TTL_SECONDS = 300
+
+PLATFORM_HOSTS = {'skandage.com', 'localhost', '127.0.0.1'}
+PLATFORM_DOMAIN = 'skandage.com'
+# <slug>.<suffix> agent subdomains that belong to the platform (local dev uses *.localhost)
+PLATFORM_SUBDOMAIN_SUFFIXES = ('.' + PLATFORM_DOMAIN, '.localhost')
+
+_host_map = None
+
+
+def normalize_host(host):
+    host = (host or '').split(':')[0].strip().lower().rstrip('.')
+    return host[4:] if host.startswith('www.') else host
+
+
+class Tenant:
+    """
+    What a host points at. kind is one of:
+      'app' / 'onboarding'  - platform subdomains
+      'platform'            - the marketing site, localhost, LAN dev hosts
+      'agency'              - an agency landing domain (agency_id, agent_ids = its team)
+      'agent'               - an agent's custom domain or a <slug>.skandage.com subdomain
+    """
+    def __init__(self, host, kind, slug=None, agency_id=None, agent_ids=()):
+        self.host = host
+        self.kind = kind
+        self.slug = slug
+        self.agency_id = agency_id
+        self.agent_ids = frozenset(agent_ids)
+
+    @property
+    def is_platform(self):
+        """Platform hosts may show any public agent; custom domains only their own agents."""
+        return self.kind in ('platform', 'app', 'onboarding') or (self.kind == 'agent' and self.host.endswith(PLATFORM_SUBDOMAIN_SUFFIXES))
+
+    def allows_agent(self, agent):
+        return self.is_platform or agent.pk in self.agent_ids
+
+    def __repr__(self):
+        return f"<Tenant {self.kind} {self.host}>"
+
+
+class HostMap:
+    def __init__(self):
+        self.built_at = time.monotonic()
+        self.agencies = {normalize_host(domain): pk for pk, domain in Agency.objects.values_list('pk', 'domain')}
+        self.custom_domains = {}   # normalized custom_domain -> [(agent pk, slug)] of public agents
+        agents = Agent.objects.filter(is_public=True).exclude(custom_domain__isnull=True).exclude(custom_domain='')
+        for pk, slug, domain in agents.order_by('pk').values_list('pk', 'slug', 'custom_domain'):
+            self.custom_domains.setdefault(normalize_host(domain), []).append((pk, slug))
+
+    def resolve(self, raw_host):
+        host = normalize_host(raw_host)
+        subdomain = host.split('.')[0]
+
+        if subdomain in ('app', 'onboarding'):
+            return Tenant(host, subdomain)
+        if host in PLATFORM_HOSTS or host.startswith('192.168.'):
+            return Tenant(host, 'platform')
+
+        team = self.custom_domains.get(host, [])
+        if host in self.agencies:
+            return Tenant(host, 'agency', agency_id=self.agencies[host], agent_ids=[pk for pk, _ in team])
+        if len(team) == 1:
+            return Tenant(host, 'agent', slug=team[0][1], agent_ids=[team[0][0]])
+        # <slug>.skandage.com, <slug>.localhost (or an unknown domain): the first label is the agent slug
+        return Tenant(host, 'agent', slug=subdomain, agent_ids=[pk for pk, _ in team])
+
+
+def get_host_map():
+    global _host_map
+    if _host_map is None or time.monotonic() - _host_map.built_at > TENANT_MAP_TTL_SECONDS:
+        _host_map = HostMap()
+    return _host_map
+
+
+def get_tenant(request):
+    """request.tenant, resolving it here when the request didn't pass through the middleware."""
+    tenant = getattr(request, 'tenant', None)
+    if tenant is None:
+        tenant = request.tenant = get_host_map().resolve(request.get_host())
+    return tenant
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+@receiver(post_save, sender=Agency)
+@receiver(post_delete, sender=Agency)
+def invalidate_host_map(sender, **kwargs):
+    global _host_map
+    _host_map = None
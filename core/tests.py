@@ -1,8 +1,10 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
-from .models import Agent, Subscriber, CardTemplate, CardLog
+from .models import Agent, Subscriber, CardTemplate, CardLog, hash_email
 from .services import get_best_card_for_subscriber
 from datetime import date, timedelta
+import io
+import json
 
 class CardEngineTests(TestCase):
     def setUp(self):
@@ -88,3 +90,1019 @@ class CardEngineTests(TestCase):
         """Should not return Birthday card for Christmas."""
         best_card = get_best_card_for_subscriber(self.agent, self.sub_male_30, "Christmas")
         self.assertIsNone(best_card)
+
+    def test_matchmaker_prefers_narrower_age_band(self):
+        """A tighter age band beats a wider one for the same gender."""
+        narrow = CardTemplate.objects.create(
+            agent=self.agent, name="Male Late Twenties", occasion="Birthday",
+            target_gender='M', target_age_min=25, target_age_max=34
+        )
+        self.assertEqual(get_best_card_for_subscriber(self.agent, self.sub_male_30, "Birthday"), narrow)
+
+    def test_matchmaker_lookup_is_in_memory_and_invalidated(self):
+        """Repeat lookups hit the index; editing a template rebuilds it."""
+        get_best_card_for_subscriber(self.agent, self.sub_male_30, "Birthday")
+        with self.assertNumQueries(0):
+            get_best_card_for_subscriber(self.agent, self.sub_male_30, "Birthday")
+        self.card_male_only.is_active = False
+        self.card_male_only.save()
+        self.assertEqual(get_best_card_for_subscriber(self.agent, self.sub_male_30, "Birthday"), self.card_generic)
+
+
+class SubscriberDecryptionCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cacheagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Cache Agent")
+        sub = Subscriber(agent=self.agent, name="Mary Tan", race='C', gender='F')
+        sub.email = "mary@example.com"
+        sub.save()
+        self.pk = sub.pk
+
+    def test_properties_decrypt_once(self):
+        from unittest import mock
+        from . import models as core_models
+        sub = Subscriber.objects.get(pk=self.pk)
+        with mock.patch.object(core_models.fernet, 'decrypt', wraps=core_models.fernet.decrypt) as spy:
+            for _ in range(3):
+                self.assertEqual(sub.name, "Mary Tan")
+                self.assertEqual(sub.gender, 'F')
+            self.assertEqual(spy.call_count, 2)
+
+    def test_setter_invalidates_cache(self):
+        sub = Subscriber.objects.get(pk=self.pk)
+        self.assertEqual(sub.name, "Mary Tan")
+        sub.name = "Mary Lim"
+        self.assertEqual(sub.name, "Mary Lim")
+        sub.encrypted_name = b''
+        self.assertEqual(sub.name, "")
+
+    def test_decrypted_queryset_primes_every_field(self):
+        from unittest import mock
+        from . import models as core_models
+        subs = list(Subscriber.objects.filter(agent=self.agent).decrypted('name', 'tags'))
+        with mock.patch.object(core_models.fernet, 'decrypt') as spy:
+            self.assertEqual(subs[0].name, "Mary Tan")
+            self.assertIn('Lunar New Year', subs[0].tag_list)
+            spy.assert_not_called()
+
+
+class BlindIndexSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='searchagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Search Agent")
+        self.sub = Subscriber(agent=self.agent, name="Ryan Siow", race='M')
+        self.sub.email = "ryan@example.com"
+        self.sub.save()
+        other = Subscriber(agent=self.agent, name="Alice Wong", race='C')
+        other.email = "alice@example.com"
+        other.save()
+
+    def test_search_by_name_and_tag(self):
+        qs = Subscriber.objects.filter(is_active=True)
+        self.assertEqual(list(qs.search(self.agent, "siow")), [self.sub])
+        self.assertEqual(list(qs.search(self.agent, "hari raya")), [self.sub])
+        # Short queries match inside words too, not just at the start ('an' in 'Ryan')
+        self.assertEqual(list(qs.search(self.agent, "an")), [self.sub])
+        self.assertEqual(list(qs.search(self.agent, "ow")), [self.sub])
+        self.assertEqual(qs.search(self.agent, "r").count(), 2)
+        self.assertFalse(qs.search(self.agent, "zzz").exists())
+
+    def test_index_tracks_renames_and_stores_no_plaintext(self):
+        from .models import SubscriberSearchToken
+        self.sub.name = "Benedict Lee"
+        self.sub.save()
+        qs = Subscriber.objects.all()
+        self.assertFalse(qs.search(self.agent, "siow").exists())
+        self.assertEqual(list(qs.search(self.agent, "benedict")), [self.sub])
+        tokens = SubscriberSearchToken.objects.values_list('token', flat=True)
+        self.assertFalse(any('ben' in t for t in tokens))
+
+
+class EventCalendarTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='calendaragent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Calendar Agent")
+        self.today = date(2026, 12, 20)
+        self.template = CardTemplate.objects.create(agent=self.agent, name="Any", occasion='Birthday', target_gender='A')
+
+    def _add(self, name, dob, race='O'):
+        sub = Subscriber(agent=self.agent, name=name, race=race, gender='M', date_of_birth=dob)
+        sub.email = f"{name.lower()}@example.com"
+        sub.save()
+        return sub
+
+    def test_birthday_window_wraps_new_year(self):
+        from .events import build_event_calendar
+        soon = self._add("Soon", date(1990, 1, 5))
+        self._add("Later", date(1990, 3, 5))
+        upcoming, _, occasions = build_event_calendar(self.agent, self.today)
+        birthdays = [e for e in upcoming if e['occasion'] == 'Birthday']
+        self.assertEqual([e['subscriber'] for e in birthdays], [soon])
+        self.assertEqual(birthdays[0]['event_date'], date(2027, 1, 5))
+        self.assertEqual(birthdays[0]['template'], self.template)
+        self.assertIn('Christmas', occasions)
+
+    def test_sent_cards_are_skipped(self):
+        from .events import build_event_calendar
+        sub = self._add("Sent", date(1990, 12, 22))
+        CardLog.objects.create(agent=self.agent, subscriber=sub, occasion='Birthday', status='sent', scheduled_date=date(2026, 12, 22))
+        upcoming, _, _ = build_event_calendar(self.agent, self.today)
+        self.assertNotIn('Birthday', [e['occasion'] for e in upcoming])
+
+    def test_query_count_is_constant(self):
+        from .events import build_event_calendar
+        for i in range(5):
+            self._add(f"Client{i}", date(1990, 12, 21 + i))
+        with self.assertNumQueries(3):
+            upcoming, _, _ = build_event_calendar(self.agent, self.today)
+        self.assertEqual(len([e for e in upcoming if e['occasion'] == 'Birthday']), 5)
+
+    def test_only_festival_tagged_clients_are_fetched(self):
+        from unittest import mock
+        from .events import build_event_calendar
+        festive = self._add("Festive", date(1990, 6, 1))
+        plain = self._add("Plain", date(1990, 6, 1))
+        plain.tags = "VIP"   # drop the default festival tags new clients get
+        plain.save()
+        with mock.patch.object(Subscriber, 'prime_decrypted', autospec=True,
+                               side_effect=Subscriber.prime_decrypted) as primed:
+            upcoming, _, _ = build_event_calendar(self.agent, self.today)
+        self.assertEqual([call.args[0] for call in primed.call_args_list], [festive])
+        self.assertIn('Christmas', [e['occasion'] for e in upcoming if e['subscriber'] == festive])
+
+
+class BackgroundJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='jobagent', password='password', email='agent@example.com')
+        self.agent = Agent.objects.create(user=self.user, name="Job Agent")
+        self.sub = Subscriber(agent=self.agent, name="Article Reader")
+        self.sub.email = "client@example.com"
+        self.sub.save()
+
+    def test_article_blast_is_queued_not_sent_inline(self):
+        from django.core import mail
+        from django.core.management import call_command
+        from .models import Article, BackgroundJob
+        article = Article.objects.create(agent=self.agent, title="Market Update", content="Rates are moving.")
+        self.client.force_login(self.user)
+        response = self.client.post(f'/dashboard/article/{article.pk}/email-all/')
+        job = BackgroundJob.objects.get()
+        self.assertRedirects(response, f'/dashboard/jobs/{job.pk}/', fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command('run_worker', '--once', stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((job.progress_done, job.progress_total), (1, 1))
+        self.assertEqual(mail.outbox[0].to, ["client@example.com"])
+
+        status = self.client.get(f'/dashboard/jobs/{job.pk}/?format=json').json()
+        self.assertEqual(status['percent'], 100)
+        self.assertContains(self.client.get(f'/dashboard/jobs/{job.pk}/'), "Article emailed to 1 clients.")
+
+    def test_failing_job_retries_with_backoff_then_fails(self):
+        from .jobs import JOB_HANDLERS, enqueue, claim_next_job, run_job
+
+        def explode(job):
+            raise RuntimeError("SMTP down")
+        JOB_HANDLERS['test_explode'] = explode
+        self.addCleanup(JOB_HANDLERS.pop, 'test_explode')
+
+        job = enqueue('test_explode', agent=self.agent, max_attempts=2)
+        job = run_job(claim_next_job())
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_after, job.created_at)
+        self.assertIsNone(claim_next_job())  # backing off
+
+        job.run_after = job.created_at
+        job.save()
+        job = run_job(claim_next_job())
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIn("SMTP down", job.last_error)
+
+
+    def test_progress_is_a_heartbeat(self):
+        from django.utils import timezone
+        from .jobs import STALE_AFTER, enqueue, claim_next_job
+        from .models import BackgroundJob
+        enqueue('email_article', agent=self.agent, article_id=0, site_url='')
+        job = claim_next_job()
+        BackgroundJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - STALE_AFTER * 2)
+        job.refresh_from_db()
+        job.set_progress(10, 100)
+        self.assertIsNone(claim_next_job())   # still alive, not reclaimed by another worker
+
+    def test_review_reminders_write_progress_per_chunk(self):
+        from unittest import mock
+        from .jobs import enqueue, claim_next_job, run_job
+        from .models import BackgroundJob
+        from django.core import mail
+        from django.core.mail import EmailMessage
+        from django.core.mail.backends.locmem import EmailBackend
+        ids = [self.sub.pk]
+        for i in range(4):
+            sub = Subscriber(agent=self.agent, name=f"Reminder {i}")
+            sub.email = f"reminder{i}@example.com" if i else ""
+            sub.save()
+            ids.append(sub.pk)
+        ids.append(max(ids) + 1000)   # deleted since it was selected
+        enqueue('review_reminders', agent=self.agent, subscriber_ids=ids, site_url='https://skandage.com')
+        with mock.patch('core.tasks.PROGRESS_EVERY', 2), \
+                mock.patch.object(BackgroundJob, 'set_progress', autospec=True,
+                                  side_effect=BackgroundJob.set_progress) as progress, \
+                mock.patch.object(EmailBackend, 'send_messages', autospec=True,
+                                  side_effect=EmailBackend.send_messages) as send, \
+                mock.patch('core.tasks.build_review_reminder_email',
+                           side_effect=lambda agent, sub, site_url: EmailMessage("Review", "Hi", to=[sub.email])):
+            job = run_job(claim_next_job())
+        self.assertEqual(progress.call_count, 3)
+        self.assertEqual(send.call_count, 3)   # one batch per chunk
+        self.assertEqual((job.status, job.progress_done, job.percent), ('done', 5, 100))
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(job.result, "Review reminders sent to 4 client(s); 1 could not be emailed; "
+                                     "1 selected client(s) are no longer active.")
+
+
+class NewsletterPipelineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='newsagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="News Agent")
+        for name in ("Ann", "Ben", "Cat"):
+            sub = Subscriber(agent=self.agent, name=name)
+            sub.email = f"{name.lower()}@example.com"
+            sub.save()
+        from .models import Newsletter
+        self.newsletter = Newsletter.objects.create(agent=self.agent, subject="Hello", content="<p>News</p>")
+
+    def _fake_connection(self, fail_on):
+        sent = []
+
+        class Connection:
+            def __enter__(self): return self
+            def __exit__(self, *exc): return False
+
+            def send_messages(self, messages):
+                to = messages[0].to[0]
+                if to in fail_on:
+                    raise fail_on[to]
+                sent.append(to)
+                return 1
+        return Connection(), sent
+
+    def test_ledger_is_created_once(self):
+        from .models import NewsletterDelivery
+        NewsletterDelivery.queue_audience(self.newsletter)
+        NewsletterDelivery.queue_audience(self.newsletter)
+        self.assertEqual(self.newsletter.deliveries.count(), 3)
+
+    def test_recipient_failure_does_not_abort_and_outage_resumes(self):
+        import smtplib
+        from unittest import mock
+        from .jobs import enqueue, claim_next_job, run_job
+        job = enqueue('send_newsletter', agent=self.agent, newsletter_id=self.newsletter.pk, site_url="https://x.com")
+
+        # Ann is refused, then the server drops before Cat: Ann/Ben are checkpointed
+        connection, sent = self._fake_connection({
+            "ann@example.com": smtplib.SMTPRecipientsRefused({}),
+            "cat@example.com": smtplib.SMTPServerDisconnected(),
+        })
+        with mock.patch('core.tasks.NEWSLETTER_CHUNK_SIZE', 1), mock.patch('core.tasks.get_connection', return_value=connection):
+            job = run_job(claim_next_job())
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(sent, ["ben@example.com"])
+        counts = self.newsletter.delivery_counts()
+        self.assertEqual((counts['sent'], counts['bounced'], counts['queued']), (1, 1, 1))
+
+        job.run_after = job.created_at
+        job.save()
+        connection, sent = self._fake_connection({})
+        with mock.patch('core.tasks.get_connection', return_value=connection):
+            job = run_job(claim_next_job())
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(sent, ["cat@example.com"])
+        self.assertEqual((job.progress_done, job.progress_total), (3, 3))
+        self.newsletter.refresh_from_db()
+        self.assertEqual(self.newsletter.status, 'sent')
+
+        self.client.force_login(self.user)
+        progress = self.client.get(f'/dashboard/broadcasts/{self.newsletter.pk}/progress/').json()
+        self.assertEqual((progress['sent'], progress['bounced'], progress['total']), (2, 1, 3))
+        self.assertContains(self.client.get('/dashboard/broadcasts/'), "2/3")
+
+
+class PooledEmailBackendTests(TestCase):
+    def _fake_smtp(self, drop_first_send=False, refuse=False):
+        import smtplib
+        opened, delivered, attempts = [], [], []
+
+        class FakeSMTP:
+            def __init__(self, fail_silently=False):
+                self.connection = None
+                self.dropped = not drop_first_send
+
+            def open(self):
+                self.connection = object()
+                opened.append(self)
+
+            def close(self):
+                self.connection = None
+
+            def send_messages(self, messages):
+                attempts.extend(m.to[0] for m in messages)
+                if refuse:
+                    raise smtplib.SMTPRecipientsRefused({messages[0].to[0]: (550, b'No such user')})
+                if not self.dropped:
+                    self.dropped = True
+                    raise smtplib.SMTPServerDisconnected()
+                delivered.extend(m.to[0] for m in messages)
+                return len(messages)
+        self.attempts = attempts
+        return FakeSMTP, opened, delivered
+
+    def _messages(self, n):
+        from django.core.mail import EmailMessage
+        return [EmailMessage("Hi", "Body", "a@skandage.com", [f"c{i}@example.com"]) for i in range(n)]
+
+    def test_connections_are_reused_across_sends(self):
+        from unittest import mock
+        from . import mail as pooled
+        FakeSMTP, opened, delivered = self._fake_smtp()
+        with mock.patch.object(pooled, 'SMTPBackend', FakeSMTP), mock.patch.object(pooled, '_pool', None), \
+                self.settings(EMAIL_POOL_SIZE=2):
+            backend = pooled.PooledEmailBackend()
+            self.assertEqual(backend.send_messages(self._messages(10)), 10)
+            for msg in self._messages(3):
+                pooled.PooledEmailBackend().send_messages([msg])
+            stats = pooled.get_pool().throughput()
+        self.assertLessEqual(len(opened), 2)
+        self.assertEqual(len(delivered), 13)
+        self.assertEqual(stats['sent'], 13)
+
+    def test_dropped_connection_is_reopened(self):
+        from unittest import mock
+        from . import mail as pooled
+        FakeSMTP, opened, delivered = self._fake_smtp(drop_first_send=True)
+        with mock.patch.object(pooled, 'SMTPBackend', FakeSMTP), mock.patch.object(pooled, '_pool', None), \
+                self.settings(EMAIL_POOL_SIZE=1):
+            self.assertEqual(pooled.PooledEmailBackend().send_messages(self._messages(1)), 1)
+            self.assertEqual(pooled.get_pool().throughput()['reconnects'], 1)
+        self.assertEqual(len(opened), 2)
+
+    def test_refused_recipient_is_not_retried(self):
+        import smtplib
+        from unittest import mock
+        from . import mail as pooled
+        FakeSMTP, opened, delivered = self._fake_smtp(refuse=True)
+        with mock.patch.object(pooled, 'SMTPBackend', FakeSMTP), mock.patch.object(pooled, '_pool', None), \
+                self.settings(EMAIL_POOL_SIZE=1):
+            with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                pooled.PooledEmailBackend().send_messages(self._messages(1))
+            self.assertEqual(pooled.get_pool().throughput()['reconnects'], 0)
+        self.assertEqual(self.attempts, ["c0@example.com"])
+        self.assertEqual(len(opened), 1)
+
+
+class SmartParseClientsTests(TestCase):
+    def _csv(self, text):
+        f = io.BytesIO(text.encode())
+        f.name = 'clients.csv'
+        return f
+
+    def test_parses_columns_and_dedupes(self):
+        from .utils_import import smart_parse_clients
+        rows = smart_parse_clients(self._csv(
+            "Name,Email,DOB,Race,Gender,Review Freq\n"
+            "Ann Lee,ANN@x.com,15/01/1990,Chinese,F,12 months\n"
+            "Ann Again,ann@x.com,1990-01-15,Indian,M,6\n"
+            "Raj,,44927,tamil,Mr,\n"
+            "raj,,,,,\n"
+            ",bob.tan@x.com,garbage,,,\n"
+        ))
+        self.assertEqual([r['email'] for r in rows], ['ann@x.com', '', 'bob.tan@x.com'])
+        ann, raj, bob = rows
+        self.assertEqual((ann['dob_db'], ann['race'], ann['gender'], ann['review_freq']), ('1990-01-15', 'C', 'F', '12'))
+        self.assertEqual((raj['dob_db'], raj['race'], raj['gender']), ('2023-01-01', 'I', 'M'))
+        self.assertEqual(bob['name'], 'Bob Tan')
+        self.assertIsNone(bob['dob_db'])
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Import Agent")
+        self.existing = Subscriber(agent=self.agent, name="Wei Ling", race='C')
+        self.existing.email = "wei@example.com"
+        self.existing.save()
+
+    def test_adds_replaces_and_skips_in_bulk(self):
+        from .importer import bulk_import_subscribers
+        rows = [
+            {'name': 'Siti Aminah', 'email': 'siti@example.com', 'race': 'M', 'gender': 'F', 'dob_db': '1985-04-02',
+             'last_review': '2026-01-31', 'review_freq': '1'},
+            {'name': 'Dup', 'email': 'WEI@example.com', 'race': 'O'},
+            {'name': 'Wei Ling Tan', 'email': 'wei@example.com', 'race': 'I'},
+            {'name': 'Ignored', 'email': 'ignored@example.com'},
+        ]
+        with self.assertNumQueries(8):  # preload, fetch replaced, savepoint, insert, update, 2x index, release
+            result = bulk_import_subscribers(self.agent, rows, ['add', 'add', 'replace', 'skip'])
+        self.assertEqual(result, (1, 1, 2))
+
+        siti = Subscriber.objects.get(agent=self.agent, email_hash=hash_email('siti@example.com'))
+        self.assertEqual((siti.name, siti.gender, siti.birth_month), ('Siti Aminah', 'F', 4))
+        self.assertEqual(siti.next_review_date, date(2026, 2, 28))
+        self.assertIn('Hari Raya Haji', siti.tag_list)
+        self.assertIn('Christmas', siti.tag_list)
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.name, 'Wei Ling Tan')
+        self.assertIn('Deepavali', self.existing.tag_list)
+        self.assertNotIn('Lunar New Year', self.existing.tag_list)
+        self.assertEqual(list(Subscriber.objects.search(self.agent, 'aminah')), [siti])
+        self.assertEqual(list(Subscriber.objects.search(self.agent, 'tan')), [self.existing])
+
+
+class StagedImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='stagingagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Staging Agent")
+        self.client.login(username='stagingagent', password='password')
+
+    def test_upload_review_and_commit(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.urls import reverse
+        from .models import StagedImport
+        upload = SimpleUploadedFile('clients.csv', b"Name,Email,Race\nAnn Lee,ann@x.com,Chinese\nRaj,raj@x.com,Indian\n")
+        response = self.client.post(reverse('manage_subscribers'), {'import_csv': '1', 'csv_file': upload})
+        self.assertRedirects(response, reverse('preview_import'), fetch_redirect_response=False)
+
+        staged = StagedImport.objects.get(agent=self.agent)
+        self.assertEqual(self.client.session['staged_import_id'], staged.pk)
+        self.assertNotIn('pending_import', self.client.session)
+        self.assertNotIn(b'ann@x.com', bytes(staged.rows.first().encrypted_payload))
+        self.assertEqual((staged.summary['new'], staged.summary['C']), (2, 1))
+
+        response = self.client.get(reverse('preview_import'))
+        self.assertContains(response, 'Ann Lee')
+
+        response = self.client.post(reverse('update_import_row', args=[staged.pk, 1]), {'action': 'skip'})
+        self.assertEqual(response.json()['action'], 'skip')
+        self.assertEqual(self.client.post(reverse('update_import_row', args=[staged.pk, 1]), {'action': 'drop'}).status_code, 400)
+
+        self.client.post(reverse('commit_import', args=[staged.pk]))
+        self.assertEqual([s.name for s in Subscriber.objects.filter(agent=self.agent).decrypted('name')], ['Ann Lee'])
+        self.assertFalse(StagedImport.objects.exists())
+        self.assertNotIn('staged_import_id', self.client.session)
+
+    def test_untouched_duplicates_overwrite_by_default(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.urls import reverse
+        from .models import StagedImport
+        existing = Subscriber(agent=self.agent, name="Ann (old)")
+        existing.email = "ann@x.com"
+        existing.save()
+        upload = SimpleUploadedFile('clients.csv', b"Name,Email\nAnn Lee,ann@x.com\n")
+        self.client.post(reverse('manage_subscribers'), {'import_csv': '1', 'csv_file': upload})
+        staged = StagedImport.objects.get(agent=self.agent)
+        self.assertEqual(staged.rows.get().action, 'replace')
+
+        self.client.post(reverse('commit_import', args=[staged.pk]))
+        existing.refresh_from_db()
+        self.assertEqual(existing.name, "Ann Lee")
+
+
+class VaultExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exportagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Export Agent", slug='export-agent')
+        for name, email in [("Ann Lee", "ann@x.com"), ("Raj Kumar", "raj@x.com")]:
+            sub = Subscriber(agent=self.agent, name=name, race='I')
+            sub.email = email
+            sub.date_of_birth = date(1990, 5, 6)
+            sub.save()
+        self.client.login(username='exportagent', password='password')
+
+    def test_csv_streams_and_is_audited(self):
+        from django.urls import reverse
+        from .models import AuditLog
+        response = self.client.get(reverse('export_subscribers'))
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(2):  # one SELECT for the rows, one audit INSERT
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Name,Email,Phone,Date of Birth,Race,Gender,Tags,Next Review Date')
+        self.assertTrue(lines[1].startswith('Ann Lee,ann@x.com,,1990-05-06,Indian,Unspecified,'))
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(AuditLog.objects.get(agent=self.agent).target_info, 'Exported 2 active records to CSV')
+
+    def test_xlsx_export(self):
+        from django.urls import reverse
+        from openpyxl import load_workbook
+        response = self.client.get(reverse('export_subscribers'), {'format': 'xlsx'})
+        sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(rows[2][:2], ('Raj Kumar', 'raj@x.com'))
+
+
+class DailyMetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='metricsagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Metrics Agent", slug='metrics-agent')
+        self.client.login(username='metricsagent', password='password')
+
+    def test_write_paths_feed_rollup_and_backfill_matches(self):
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import AgentDailyMetrics, DailyProfileView, Lead
+        today = timezone.now().date()
+        Lead.objects.create(agent=self.agent, name="Lead", email="lead@x.com", message="Hi")
+        Lead.objects.create(agent=self.agent, name="Lead 2", email="lead2@x.com", message="Hi")
+        AgentDailyMetrics.bump(self.agent, views=5)
+        DailyProfileView.objects.create(agent=self.agent, views=5)
+        sub = Subscriber(agent=self.agent, name="Due Today")
+        sub.email = "due@x.com"
+        sub.next_review_date = today
+        sub.save()
+
+        call_command('backfill_daily_metrics', days=30, stdout=io.StringIO())
+        row = AgentDailyMetrics.objects.get(agent=self.agent, date=today)
+        self.assertEqual((row.views, row.leads, row.events_due), (5, 2, 1))
+
+    def test_festival_tags_must_match_exactly(self):
+        from datetime import date
+        from unittest import mock
+        from .metrics import events_due_count, refresh_events_due
+        for name, tags in (("Lunar Only", "Lunar New Year"), ("New Year", "VIP, New Year"), ("Both", "New Year")):
+            sub = Subscriber(agent=self.agent, name=name)
+            sub.email = f"{name.replace(' ', '').lower()}@x.com"
+            sub.next_review_date = date(2026, 1, 1) if name == "Both" else None
+            sub.save()
+            sub.tags = tags   # replace the default festival tags new clients get
+            sub.save()
+
+        new_year = date(2026, 1, 1)
+        self.assertEqual(events_due_count(self.agent, new_year), 2)
+        self.assertEqual(refresh_events_due(self.agent, new_year), 2)
+        with mock.patch('core.metrics.AgentDailyMetrics.objects.update_or_create') as write:
+            refresh_events_due(self.agent, new_year)
+        write.assert_not_called()
+
+    def test_dashboard_cost_does_not_grow_with_window(self):
+        from django.urls import reverse
+        self.client.get(reverse('dashboard'))   # warm-up: session/agent lookups
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        counts = []
+        for days in (7, 365):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('dashboard'), {'days': days})
+            counts.append(len(ctx))
+            self.assertEqual(len(json.loads(response.context['views_data'])), days)
+        self.assertEqual(counts[0], counts[1])
+
+
+class BufferedCounterTests(TestCase):
+    def setUp(self):
+        from . import counters
+        self.counters = counters
+        self.addCleanup(counters.buffer.flush)   # write leftovers while this test's rows exist
+        self.user = User.objects.create_user(username='counteragent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Counter Agent", slug='counter-agent')
+
+    def test_hits_are_buffered_then_flushed_in_batches(self):
+        from .models import AgentDailyMetrics, DailyProfileView
+        with self.settings(COUNTER_FLUSH_SECONDS=3600), self.assertNumQueries(0):
+            for _ in range(3):
+                self.counters.count_profile_view(self.agent.pk)
+            self.counters.count_vcard_download(self.agent.pk)
+
+        self.counters.buffer.flush()
+        self.counters.count_profile_view(self.agent.pk)
+        self.counters.buffer.flush()
+
+        self.agent.refresh_from_db()
+        self.assertEqual((self.agent.profile_views, self.agent.vcard_downloads), (4, 1))
+        self.assertEqual(DailyProfileView.objects.get(agent=self.agent).views, 4)
+        metrics = AgentDailyMetrics.objects.get(agent=self.agent)
+        self.assertEqual((metrics.views, metrics.vcard_downloads), (4, 1))
+
+    def test_idle_buffer_is_flushed_by_a_timer(self):
+        from unittest import mock
+        with self.settings(COUNTER_FLUSH_SECONDS=3600), mock.patch('threading.Timer') as timer:
+            self.counters.count_profile_view(self.agent.pk)
+            self.counters.count_profile_view(self.agent.pk)
+        timer.assert_called_once_with(3600, self.counters.buffer._timed_flush)
+        timer.return_value.start.assert_called_once()
+
+        self.counters.buffer.flush()
+        timer.return_value.cancel.assert_called_once()
+        self.assertIsNone(self.counters.buffer.timer)
+
+
+class PublicPageCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from . import counters
+        cache.clear()
+        self.addCleanup(counters.buffer.flush)
+        self.user = User.objects.create_user(username='cachedagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Cached Agent", slug='cached-agent', is_public=True)
+
+    def _get(self, client=None, name='agent_bio'):
+        from django.urls import reverse
+        return (client or self.client).get(reverse(name, args=[self.agent.slug]), HTTP_HOST='localhost')
+
+    def test_hits_skip_the_database_until_content_changes(self):
+        from .models import Credential
+        first = self._get()
+        with self.assertNumQueries(0):
+            second = self._get()
+        self.assertEqual(first.content, second.content)
+
+        Credential.objects.create(agent=self.agent, title="Million Dollar Round Table")
+        self.assertContains(self._get(), "Million Dollar Round Table")
+
+    def test_profile_views_still_count_on_cache_hits(self):
+        from django.test import Client
+        from . import counters
+        self._get(name='agent_profile')
+        response = self._get(Client(), name='agent_profile')   # a new visitor, served from cache
+        self.assertIn(b'csrfmiddlewaretoken', response.content)
+        self.assertNotIn(b'__page_cache_csrf__', response.content)
+        counters.buffer.flush()
+        self.agent.refresh_from_db()
+        self.assertEqual(self.agent.profile_views, 2)
+
+
+class TenantResolutionTests(TestCase):
+    def setUp(self):
+        from .models import Agency
+        owner = User.objects.create_user(username='agencyowner', password='password')
+        self.agency = Agency.objects.create(owner=owner, domain='yq-partners.com', name="YQ Partners")
+        self.user = User.objects.create_user(username='tenantagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Tenant Agent", slug='tenant-agent',
+                                          is_public=True, custom_domain='tenantagent.sg')
+        from . import counters
+        self.addCleanup(counters.buffer.flush)
+
+    def test_hosts_resolve_from_memory(self):
+        from .tenants import get_host_map
+        get_host_map()
+        with self.assertNumQueries(0):
+            resolve = get_host_map().resolve
+            self.assertEqual(resolve('app.skandage.com').kind, 'app')
+            self.assertEqual(resolve('www.skandage.com:443').kind, 'platform')
+            agency = resolve('WWW.yq-partners.com')
+            self.assertEqual((agency.kind, agency.agency_id), ('agency', self.agency.pk))
+            custom = resolve('www.tenantagent.sg')
+            self.assertEqual((custom.kind, custom.slug), ('agent', 'tenant-agent'))
+            self.assertTrue(custom.allows_agent(self.agent))
+            self.assertTrue(resolve('ryan.skandage.com').is_platform)
+            self.assertTrue(resolve('ryan.localhost:8000').allows_agent(self.agent))
+            self.assertEqual(resolve('ryan.localhost').slug, 'ryan')
+            self.assertFalse(resolve('other.sg').allows_agent(self.agent))
+
+    def test_saves_invalidate_the_map(self):
+        from .tenants import get_host_map
+        self.assertEqual(get_host_map().resolve('new-domain.sg').slug, 'new-domain')
+        self.agent.custom_domain = 'new-domain.sg'
+        self.agent.save()
+        self.assertEqual(get_host_map().resolve('new-domain.sg').slug, 'tenant-agent')
+
+    def test_custom_domain_serves_its_agent(self):
+        response = self.client.get('/', HTTP_HOST='tenantagent.sg')
+        self.assertContains(response, 'Tenant Agent')
+
+
+class DailyCardCommandTests(TestCase):
+    def setUp(self):
+        from django.utils import timezone
+        self.today = timezone.localdate()
+        self.manual = Agent.objects.create(user=User.objects.create_user(username='manualagent', password='password'),
+                                           name="Manual Agent", slug='manual-agent', is_public=True,
+                                           notification_email='manual@example.com')
+        self.auto = Agent.objects.create(user=User.objects.create_user(username='autoagent', password='password'),
+                                         name="Auto Agent", slug='auto-agent', is_public=True, automation_mode='auto')
+        for agent in (self.manual, self.auto):
+            CardTemplate.objects.create(agent=agent, name="Birthday", occasion="Birthday",
+                                        target_gender='A', target_age_min=0, target_age_max=120)
+            for name, dob in (("Today", date(1992, self.today.month, self.today.day)),
+                              ("Tomorrow", date(1992, 1, 1) if self.today.month != 1 or self.today.day != 1 else date(1992, 6, 1))):
+                sub = Subscriber(agent=agent, name=f"{name} {agent.slug}", gender='F', date_of_birth=dob)
+                sub.email = f"{name.lower()}@{agent.slug}.com"
+                sub.save()
+
+    def run_command(self):
+        from django.core.management import call_command
+        out = io.StringIO()
+        call_command('process_daily_cards', workers=1, stdout=out)
+        return out.getvalue()
+
+    def test_birthdays_are_queued_or_sent_once(self):
+        from django.core import mail
+        output = self.run_command()
+        self.assertIn('Auto Agent: auto-sent 1/1', output)
+
+        pending = CardLog.objects.get(agent=self.manual)
+        self.assertEqual((pending.status, pending.subscriber.name), ('pending', 'Today manual-agent'))
+        sent = CardLog.objects.get(agent=self.auto)
+        self.assertEqual(sent.status, 'sent')
+        self.assertIn('today@auto-agent.com', [m.to[0] for m in mail.outbox])
+
+        self.run_command()
+        self.assertEqual(CardLog.objects.count(), 2)
+
+
+class DailyReminderCommandTests(TestCase):
+    def setUp(self):
+        from django.utils import timezone
+        self.today = timezone.now().date()
+        self.agent = Agent.objects.create(user=User.objects.create_user(username='reminderagent', password='password'),
+                                          name="Reminder Agent", is_public=True, notification_email='agent@example.com')
+        quiet_day = date(1990, 1, 1) if (self.today.month, self.today.day) != (1, 1) else date(1990, 6, 1)
+        for name, race, dob, review in (
+            ("Birthday Client", 'C', date(1992, self.today.month, self.today.day), None),
+            ("Review Client", 'C', quiet_day, self.today),
+            ("Deepavali Client", 'I', quiet_day, None),
+            ("Quiet Client", 'C', quiet_day, self.today + timedelta(days=3)),
+        ):
+            sub = Subscriber(agent=self.agent, name=name, race=race, date_of_birth=dob, next_review_date=review)
+            sub.email = f"{name.split()[0].lower()}@example.com"
+            sub.save()
+
+    def test_digest_lists_only_todays_events(self):
+        from unittest import mock
+        from django.core import mail
+        from django.core.management import call_command
+        with mock.patch('core.management.commands.send_daily_reminders.get_festivals_for_date', return_value=['Deepavali']):
+            call_command('send_daily_reminders', workers=1, stdout=io.StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['agent@example.com'])
+        body = mail.outbox[0].body
+        for name in ("Birthday Client", "Review Client", "Deepavali Client"):
+            self.assertIn(name, body)
+        self.assertNotIn("Quiet Client", body)
+
+
+class HotQueryIndexTests(TestCase):
+    """Query-plan regression checks: each hot predicate must be served by its index."""
+
+    def setUp(self):
+        self.agent = Agent.objects.create(user=User.objects.create_user(username='planagent', password='password'),
+                                          name="Plan Agent")
+
+    def assertUsesIndex(self, queryset, index_name):
+        from django.db import connection
+        if connection.vendor == 'postgresql':
+            # Test tables are tiny; make the planner show which index it would pick at scale
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"{index_name} not used:\n{plan}")
+
+    def unique_index_name(self, model, columns):
+        """The database's name for the unique_together index over `columns`."""
+        from django.db import connection
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        names = [name for name, info in constraints.items() if info['unique'] and info['columns'] == columns]
+        self.assertEqual(len(names), 1, constraints)
+        return names[0]
+
+    def test_subscriber_predicates(self):
+        from .events import birthday_window_q
+        today = date(2026, 10, 18)
+        subs = Subscriber.objects.filter(agent=self.agent)
+        self.assertUsesIndex(subs.filter(is_active=True), 'sub_agent_active_idx')
+        self.assertUsesIndex(subs.filter(is_active=True, is_subscribed=True), 'sub_agent_active_idx')
+        self.assertUsesIndex(subs.filter(email_hash=hash_email('a@example.com')),
+                             self.unique_index_name(Subscriber, ['agent_id', 'email_hash']))
+        self.assertUsesIndex(subs.filter(name_hash='0' * 64), 'sub_agent_name_hash_idx')
+        self.assertUsesIndex(subs.filter(next_review_date=today), 'sub_agent_review_idx')
+        self.assertUsesIndex(Subscriber.objects.filter(is_active=True).filter(birthday_window_q(today, 0)),
+                             'sub_active_birthday_idx')
+
+    def test_card_log_predicates(self):
+        today = date(2026, 10, 18)
+        self.assertUsesIndex(
+            CardLog.objects.filter(agent=self.agent, status='sent', scheduled_date__range=(today, today + timedelta(days=30))),
+            'cardlog_agent_status_idx',
+        )
+        self.assertUsesIndex(CardLog.objects.filter(scheduled_date=today), 'cardlog_scheduled_idx')
+
+
+class PurgeOldDataTests(TestCase):
+    def setUp(self):
+        from django.utils import timezone
+        self.agent = Agent.objects.create(user=User.objects.create_user(username='purgeagent', password='password'),
+                                          name="Purge Agent")
+        subs = []
+        for i in range(5):
+            sub = Subscriber(agent=self.agent, name=f"Old Client {i}", race='C')
+            sub.email = f"old{i}@example.com"
+            sub.save()
+            subs.append(sub.pk)
+        self.expired, self.recent = subs[:4], subs[4]
+        Subscriber.objects.filter(pk__in=self.expired).update(
+            is_active=False, archived_at=timezone.now() - timedelta(days=365 * 8))
+        Subscriber.objects.filter(pk=self.recent).update(is_active=False, archived_at=timezone.now())
+
+    def purge(self, *args):
+        from django.core.management import call_command
+        out = io.StringIO()
+        call_command('purge_old_data', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        self.assertIn('4 expired records would be anonymized', self.purge('--dry-run'))
+        self.assertFalse(Subscriber.objects.filter(is_anonymized=True).exists())
+
+    def test_purge_scrubs_in_batches(self):
+        from .models import SubscriberSearchToken
+        output = self.purge('--batch-size', '3')
+        self.assertIn('Anonymized 3/4', output)
+        self.assertIn('Successfully anonymized 4', output)
+
+        purged = Subscriber.objects.filter(pk__in=self.expired)
+        self.assertTrue(all(s.is_anonymized and s.name == '' for s in purged))
+        hashes = [h for s in purged for h in (s.email_hash, s.name_hash)]
+        self.assertTrue(all(h.startswith('scrubbed_') for h in hashes))
+        self.assertEqual(len(set(hashes)), 8)
+        self.assertFalse(SubscriberSearchToken.objects.filter(subscriber_id__in=self.expired).exists())
+
+        recent = Subscriber.objects.get(pk=self.recent)
+        self.assertEqual((recent.is_anonymized, recent.name), (False, "Old Client 4"))
+        self.assertTrue(SubscriberSearchToken.objects.filter(subscriber_id=self.recent).exists())
+
+
+class ReviewScheduleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reviewagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Review Agent")
+        self.subs = []
+        for i, last in enumerate((date(2026, 1, 31), date(2025, 8, 31), None)):
+            sub = Subscriber(agent=self.agent, name=f"Review Client {i}", last_review_date=last, review_freq_months=12)
+            sub.email = f"review{i}@example.com"
+            sub.save()
+            self.subs.append(sub)
+
+    def test_add_months_matches_scalar_helper(self):
+        from .reviews import add_months
+        from .utils_import import add_months_to_date
+        dates = [date(2026, 1, 31), date(2024, 2, 29), date(2025, 12, 15), date(2026, 3, 31)]
+        for months in (1, 6, 12, 25):
+            expected = [date.fromisoformat(add_months_to_date(d.isoformat(), months)) for d in dates]
+            self.assertEqual(add_months(dates, months), expected)
+        self.assertEqual(add_months(dates[:2], [1, 12]), [date(2026, 2, 28), date(2025, 2, 28)])
+
+    def test_mass_update_reschedules_without_saving_each_row(self):
+        from unittest import mock
+        self.client.login(username='reviewagent', password='password')
+        with mock.patch.object(Subscriber, 'save') as save:
+            self.client.post('/dashboard/audience/mass-update-freq/', {'new_freq': '1'})
+        save.assert_not_called()
+
+        first, second, never = Subscriber.objects.filter(pk__in=[s.pk for s in self.subs]).order_by('pk')
+        self.assertEqual((first.review_freq_months, first.next_review_date), (1, date(2026, 2, 28)))
+        self.assertEqual(second.next_review_date, date(2025, 9, 30))
+        from .utils_import import add_months_to_date
+        self.assertEqual(never.next_review_date.isoformat(), add_months_to_date(date.today().isoformat(), 1))
+
+
+class TestimonialScraperTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='scrapeagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Scrape Agent")
+
+    def test_parse_card(self):
+        from .utils import parse_card
+        pinned = parse_card('<h3 class="pinned-card-title">Great</h3><div class="pinned-card-full">Very<br>helpful</div>'
+                            '<span class="pinned-card-author">Mei Ling</span>', True, 0)
+        self.assertEqual(pinned, {'title': 'Great', 'client_name': 'Mei Ling', 'review_text': 'Very\nhelpful',
+                                  'is_featured': True})
+        fallback = parse_card('<p>Short</p><p>Explained every policy clearly to us.</p>', False, 4)
+        self.assertEqual((fallback['client_name'], fallback['review_text']),
+                         ('Client #5', 'Explained every policy clearly to us.'))
+
+    def test_import_runs_as_a_background_job(self):
+        from unittest import mock
+        from .jobs import claim_next_job, run_job
+        from .models import BackgroundJob, Testimonial
+        self.client.login(username='scrapeagent', password='password')
+        response = self.client.post('/dashboard/testimonials/import/', {'target_url': 'https://example.com/reviews'})
+        job = BackgroundJob.objects.get(kind='import_testimonials')
+        self.assertRedirects(response, f'/dashboard/jobs/{job.pk}/', fetch_redirect_response=False)
+
+        cards = [('<div class="content-full">Helped with my claim.</div><b class="card-author">Ahmad</b>', False),
+                 ('<div></div>', False)]
+        with mock.patch('core.utils.browser_pool.run', return_value=cards) as run:
+            job = run_job(claim_next_job())
+        self.assertEqual(run.call_args.args[1:3], ('https://example.com/reviews', '.card'))
+        self.assertEqual((job.status, job.result, job.progress_done, job.progress_total),
+                         ('done', 'Imported 1 testimonials.', 1, 1))
+        self.assertEqual(Testimonial.objects.get(agent=self.agent).client_name, 'Ahmad')
+
+    def test_collect_cards_waits_for_lazy_loaded_cards(self):
+        from unittest import mock
+        from playwright.sync_api import TimeoutError as PlaywrightTimeout
+        from .utils import collect_cards
+        page = mock.Mock()
+        page.locator.return_value.count.side_effect = [3, 5]
+        # One scroll loads two more cards, the next loads nothing; expanding settles at once
+        page.wait_for_function.side_effect = [None, PlaywrightTimeout('no more cards'), None]
+        page.eval_on_selector_all.side_effect = [None, [('<p>a</p>', False)] * 5]
+        counts = []
+
+        self.assertEqual(len(collect_cards(page, 'https://example.com/reviews', '.card', counts.append)), 5)
+        self.assertEqual(counts, [3, 5])
+        self.assertEqual([c.kwargs['arg'] for c in page.wait_for_function.call_args_list],
+                         [['.card', 3], ['.card', 5], '.card'])
+        page.wait_for_load_state.assert_not_called()
+
+    def test_repeat_imports_are_idempotent(self):
+        from .models import Testimonial
+        from .utils import save_testimonials
+        Testimonial.objects.create(agent=self.agent, client_name="Ahmad", review_text="Helped with my claim.")
+        batch = lambda: [Testimonial(client_name="ahmad", review_text="Helped  with my claim. "),
+                         Testimonial(client_name="Mei", review_text="Quick and patient."),
+                         Testimonial(client_name="Mei", review_text="quick and patient.")]
+
+        with self.assertNumQueries(4):   # existing-hash lookup, one INSERT, page-cache slugs (2)
+            new = save_testimonials(self.agent, batch())
+        self.assertEqual([t.client_name for t in new], ["Mei"])
+        with self.assertNumQueries(1):
+            self.assertEqual(save_testimonials(self.agent, batch()), [])
+        self.assertEqual(self.agent.testimonials.count(), 2)
+
+    def test_legacy_duplicates_can_still_be_edited(self):
+        from django.urls import reverse
+        from .models import Testimonial
+        self.agent.can_upload_testimonials = True
+        self.agent.save()
+        Testimonial.objects.create(agent=self.agent, client_name="Ahmad", review_text="Helped with my claim.")
+        legacy = Testimonial.objects.create(agent=self.agent, client_name="Ahmad", review_text="Placeholder")
+        # Duplicates from before content hashing were backfilled with a NULL hash
+        Testimonial.objects.filter(pk=legacy.pk).update(review_text="Helped with my claim.", content_hash=None)
+        self.client.login(username='scrapeagent', password='password')
+        url = reverse('edit_testimonial', args=[legacy.pk])
+
+        self.client.post(url, {'title': 'Hidden', 'client_name': 'Ahmad', 'review_text': 'Helped with my claim.'})
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.title, legacy.is_published, legacy.content_hash), ('Hidden', False, None))
+
+        self.client.post(url, {'title': 'Hidden', 'client_name': 'Ahmad', 'review_text': 'Helped with my claim!!'})
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.review_text, 'Helped with my claim!!')
+        self.assertIsNotNone(legacy.content_hash)
+
+
+class ReviewSnapshotTests(TestCase):
+    PAGE = """<html><body><nav class="menu">Skip this navigation block entirely</nav>
+        <div class="card pinned-card"><h3 class="pinned-card-title">Top advisor</h3>
+            <div class="pinned-card-full">Sorted out our family's coverage.</div><span class="pinned-card-author">Priya</span></div>
+        <div class="card"><h3 class="card-title">Patient</h3><div class="content-full">Answered every question.</div>
+            <span class="card-author">Wei Jie</span></div>
+    </body></html>"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='snapshotagent', password='password')
+        self.agent = Agent.objects.create(user=self.user, name="Snapshot Agent", slug='snapshot-agent')
+
+    def test_snapshot_cards_match_simple_and_complex_selectors(self):
+        from .utils import snapshot_cards, parse_card
+        cards = snapshot_cards(self.PAGE, '.card')
+        self.assertEqual(len(cards), 2)
+        self.assertEqual(parse_card(cards[1], False, 1)['client_name'], 'Wei Jie')
+        self.assertEqual(len(snapshot_cards(self.PAGE, 'body > div.card.pinned-card')), 1)
+
+    def test_import_reviews_from_snapshot_directory(self):
+        import os
+        import tempfile
+        from django.core.management import call_command
+        with tempfile.TemporaryDirectory() as folder:
+            for name in ('page1.html', 'page2.htm', 'notes.txt'):
+                with open(os.path.join(folder, name), 'w') as f:
+                    f.write(self.PAGE)
+            out = io.StringIO()
+            call_command('import_reviews', 'snapshot-agent', folder, '.card', snapshot=True, stdout=out)
+
+        self.assertIn('Skipped 2 reviews', out.getvalue())
+        reviews = self.agent.testimonials.order_by('client_name')
+        self.assertEqual([(t.client_name, t.is_featured) for t in reviews], [('Priya', True), ('Wei Jie', False)])
+
+
+class MarkdownFilterTests(TestCase):
+    def test_reuses_one_pipeline_and_caches_output(self):
+        from unittest import mock
+        import markdown as md
+        from .templatetags import markdown_extras
+        markdown_extras.render_markdown.cache_clear()
+        bio = "**Ten years** advising families.\n\n```\ncode\n```"
+        expected = md.markdown(bio, extensions=['markdown.extensions.fenced_code'])
+
+        self.assertEqual(markdown_extras.markdown(bio), expected)
+        with mock.patch.object(md, 'Markdown') as build, \
+                mock.patch.object(markdown_extras._thread.converter, 'convert', wraps=markdown_extras._thread.converter.convert) as convert:
+            self.assertEqual(markdown_extras.markdown(bio), expected)
+            self.assertEqual(markdown_extras.markdown("*Other*"), "<p><em>Other</em></p>")
+        build.assert_not_called()
+        self.assertEqual(convert.call_count, 1)   # only the new text was converted
@@ -95,6 +95,8 @@ urlpatterns = [
     # --- AUDIENCE & BROADCASTS ---
     path('dashboard/audience/', views.manage_subscribers, name='manage_subscribers'),
     path('dashboard/audience/import-preview/', views.preview_import, name='preview_import'),
+    path('dashboard/audience/import-preview/<int:pk>/rows/<int:position>/', views.update_import_row, name='update_import_row'),
+    path('dashboard/audience/import-preview/<int:pk>/commit/', views.commit_import, name='commit_import'),
     path('dashboard/audience/subscriber/<int:pk>/edit/', views.edit_subscriber, name='edit_subscriber'),
     path('dashboard/audience/subscriber/<int:pk>/delete/', views.delete_subscriber, name='delete_subscriber'),
     path('dashboard/audience/mass-update-freq/', views.mass_update_review_freq, name='mass_update_review_freq'),
@@ -103,6 +105,7 @@ urlpatterns = [
     path('dashboard/broadcasts/', views.newsletter_dashboard, name='newsletter_dashboard'),
     path('dashboard/broadcasts/compose/', views.compose_newsletter, name='compose_newsletter'),
     path('dashboard/broadcasts/send/<int:pk>/', views.send_newsletter, name='send_newsletter'),
+    path('dashboard/broadcasts/<int:pk>/progress/', views.newsletter_progress, name='newsletter_progress'),
 
     # --- CRM: CARDS & REMINDERS ---
     path('dashboard/crm/', views.manage_cards, name='manage_cards'),
@@ -112,6 +115,10 @@ urlpatterns = [
     path('dashboard/crm/review-reminder/<int:pk>/send/', views.send_review_reminder, name='send_review_reminder'),
     path('dashboard/crm/review-reminders/bulk/', views.send_bulk_review_reminders, name='send_bulk_review_reminders'),
 
+    # --- BACKGROUND JOBS ---
+    path('dashboard/jobs/', views.job_list, name='job_list'),
+    path('dashboard/jobs/<int:pk>/', views.job_status, name='job_status'),
+
     # --- MISC ROUTES ---
     path('logout/', views.logout_view, name='logout'),
     path('agent/<slug:slug>/testimonials/', views.agent_testimonials, name='agent_testimonials'),
@@ -1,123 +1,282 @@
-import time
+import atexit
+import itertools
+import os
+import re
+import threading
 from concurrent.futures import ThreadPoolExecutor
-from playwright.sync_api import sync_playwright
-from bs4 import BeautifulSoup
-from .models import Testimonial
+from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+from django.db import connections
+from .models import Testimonial, testimonial_hash
+from .page_cache import invalidate_agent_pages
 
-def scrape_data_in_thread(target_url, css_selector):
+
+# ==========================================
+# TESTIMONIAL SCRAPER
+# ==========================================
+# Chromium takes a few seconds to start, so each worker process keeps SCRAPER_BROWSERS
+# browsers alive and gives every scrape a fresh, isolated context in one of them.
+# Playwright's sync API is bound to the thread that started it, so each browser lives on
+# its own single-thread executor. Waits are event-driven (network idle, selector
+# visible, more cards in the DOM, cards expanded) rather than fixed sleeps, and all
+# cards are expanded and read back in one page.evaluate each.
+SCRAPER_BROWSERS = 1
+GOTO_TIMEOUT_MS = 60000
+SELECTOR_TIMEOUT_MS = 15000
+MAX_SCROLL_ROUNDS = 10
+# How long a scroll may take to lazy-load more cards before the list counts as complete
+SCROLL_TIMEOUT_MS = 3000
+EXPAND_TIMEOUT_MS = 3000
+
+MORE_CARDS_JS = "([selector, seen]) => document.querySelectorAll(selector).length > seen"
+
+# Clicks every unpinned card's 'Read More' chevron in one round trip
+EXPAND_CARDS_JS = """(cards) => cards.forEach((card) => {
+    if (card.classList.contains('pinned-card')) return;
+    const button = card.querySelector('.chevron-down');
+    if (button && button.offsetParent !== null) button.click();
+})"""
+# True once every unpinned card's chevron is gone or its full text is showing
+CARDS_EXPANDED_JS = """(selector) => [...document.querySelectorAll(selector)].every((card) => {
+    if (card.classList.contains('pinned-card')) return true;
+    const button = card.querySelector('.chevron-down');
+    const full = card.querySelector('.content-full');
+    return !button || button.offsetParent === null || (full !== null && full.offsetParent !== null);
+})"""
+READ_CARDS_JS = "(cards) => cards.map((card) => [card.innerHTML, card.classList.contains('pinned-card')])"
+
+_thread = threading.local()
+
+
+def _thread_browser():
+    """This thread's browser, (re)launched if it was never started or has crashed."""
+    browser = getattr(_thread, 'browser', None)
+    if browser is None or not browser.is_connected():
+        if getattr(_thread, 'playwright', None) is None:
+            _thread.playwright = sync_playwright().start()
+        browser = _thread.browser = _thread.playwright.chromium.launch(headless=True)
+    return browser
+
+
+def _close_thread_browser():
+    if getattr(_thread, 'browser', None) is not None:
+        _thread.browser.close()
+    if getattr(_thread, 'playwright', None) is not None:
+        _thread.playwright.stop()
+    _thread.browser = _thread.playwright = None
+
+
+class BrowserPool:
+    def __init__(self, size=SCRAPER_BROWSERS):
+        self.size = size
+        self.lock = threading.Lock()
+        self.executors = []
+        self.turn = itertools.count()
+
+    def run(self, func, *args):
+        """Runs func(page, *args) on a pooled browser and returns its result."""
+        with self.lock:
+            if len(self.executors) < self.size:
+                self.executors.append(ThreadPoolExecutor(max_workers=1, thread_name_prefix='scraper'))
+            executor = self.executors[next(self.turn) % len(self.executors)]
+        return executor.submit(self._in_context, func, *args).result()
+
+    @staticmethod
+    def _in_context(func, *args):
+        context = _thread_browser().new_context(viewport={'width': 1280, 'height': 2000})
+        try:
+            return func(context.new_page(), *args)
+        finally:
+            context.close()
+            connections.close_all()   # opened by progress callbacks on this long-lived thread
+
+    def close(self):
+        with self.lock:
+            executors, self.executors = self.executors, []
+        for executor in executors:
+            executor.submit(_close_thread_browser).result()
+            executor.shutdown()
+
+
+browser_pool = BrowserPool()
+atexit.register(browser_pool.close)
+
+
+def collect_cards(page, target_url, css_selector, on_cards=None):
     """
-    Scrapes Text, Name, AND Title. No longer takes screenshots.
+    Loads the page and returns [(card inner HTML, is_pinned)] for every matching card.
+    on_cards(count) is called each time lazy loading brings more cards in.
     """
-    scraped_items = []
-    
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page(viewport={'width': 1280, 'height': 2000}) 
-        
+    print(f"--- Scraping {target_url} ---")
+    page.goto(target_url, timeout=GOTO_TIMEOUT_MS, wait_until='networkidle')
+    try:
+        page.wait_for_selector(css_selector, state='visible', timeout=SELECTOR_TIMEOUT_MS)
+    except PlaywrightTimeout:
+        print(f"No '{css_selector}' cards appeared on {target_url}")
+        return []
+
+    # Scroll until lazy loading stops adding cards
+    cards = page.locator(css_selector)
+    seen = cards.count()
+    for _ in range(MAX_SCROLL_ROUNDS):
+        if on_cards:
+            on_cards(seen)
+        page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
         try:
-            print(f"--- Scraping {target_url} ---")
-            page.goto(target_url, timeout=60000)
-            
-            # Scroll to ensure elements load
-            for _ in range(3):
-                page.evaluate("window.scrollBy(0, 1000)")
-                time.sleep(1)
-
-            elements = page.query_selector_all(css_selector)
-            print(f"Found {len(elements)} cards.")
-            
-            for i, element in enumerate(elements):
-                try:
-                    # 1. Pinned Check
-                    class_attr = element.get_attribute("class") or ""
-                    is_pinned = "pinned-card" in class_attr
-                    
-                    # 2. Expand Logic (Click 'Read More')
-                    if not is_pinned:
-                        expand_btn = element.query_selector('.chevron-down')
-                        if expand_btn and expand_btn.is_visible():
-                            element.scroll_into_view_if_needed()
-                            expand_btn.click()
-                            time.sleep(0.3) 
-                    
-                    # 3. Parse HTML
-                    html_content = element.inner_html()
-                    soup = BeautifulSoup(html_content, 'html.parser')
-
-                    # --- NEW: EXTRACT TITLE ---
-                    # Look for card-title (standard) or pinned-card-title
-                    title_node = soup.find(class_='card-title')
-                    if not title_node:
-                        title_node = soup.find(class_='pinned-card-title')
-                    
-                    review_title = title_node.get_text(strip=True) if title_node else ""
-
-                    # --- EXTRACT TEXT ---
-                    content_node = soup.find(class_='content-full')
-                    if not content_node:
-                        content_node = soup.find(class_='pinned-card-full')
-
-                    if content_node:
-                        review_text = content_node.get_text(separator="\n", strip=True)
-                    else:
-                        text_candidates = soup.find_all(['p', 'div', 'span'])
-                        valid_texts = [t.get_text(strip=True) for t in text_candidates if len(t.get_text(strip=True)) > 15]
-                        review_text = max(valid_texts, key=len) if valid_texts else ""
-
-                    # --- EXTRACT NAME ---
-                    author_node = soup.find(class_='card-author')
-                    if not author_node:
-                        author_node = soup.find(class_='pinned-card-author')
-                    
-                    client_name = author_node.get_text(strip=True) if author_node else f"Client #{i+1}"
-
-                    # Add to list (Note: No screenshot_bytes anymore)
-                    scraped_items.append({
-                        'title': review_title,
-                        'client_name': client_name,
-                        'review_text': review_text,
-                        'is_featured': is_pinned,
-                    })
-                    print(f"   + Scraped: {review_title} - {client_name}")
-                    
-                except Exception as e:
-                    print(f"   - Error scraping item #{i}: {e}")
-
-        except Exception as e:
-            print(f"Global Scrape Error: {e}")
-        finally:
-            browser.close()
-            
-    return scraped_items
+            page.wait_for_function(MORE_CARDS_JS, arg=[css_selector, seen], timeout=SCROLL_TIMEOUT_MS)
+        except PlaywrightTimeout:
+            break
+        seen = cards.count()
+
+    page.eval_on_selector_all(css_selector, EXPAND_CARDS_JS)
+    try:
+        page.wait_for_function(CARDS_EXPANDED_JS, arg=css_selector, timeout=EXPAND_TIMEOUT_MS)
+    except PlaywrightTimeout:
+        print("Some cards did not expand; reading them as they are.")
+    found = page.eval_on_selector_all(css_selector, READ_CARDS_JS)
+    print(f"Found {len(found)} cards.")
+    return found
+
+
+def parse_card(html_content, is_pinned, index):
+    """Title, client name and review text out of one card (its HTML, or an already parsed Tag)."""
+    soup = html_content if isinstance(html_content, Tag) else BeautifulSoup(html_content, 'html.parser')
+
+    # --- EXTRACT TITLE ---
+    # Look for card-title (standard) or pinned-card-title
+    title_node = soup.find(class_='card-title') or soup.find(class_='pinned-card-title')
+    review_title = title_node.get_text(strip=True) if title_node else ""
 
-def scrape_and_save_testimonials(agent, target_url, css_selector=".card"):
-    # 1. Run Scraper
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(scrape_data_in_thread, target_url, css_selector)
-        scraped_data = future.result()
+    # --- EXTRACT TEXT ---
+    content_node = soup.find(class_='content-full') or soup.find(class_='pinned-card-full')
+    if content_node:
+        review_text = content_node.get_text(separator="\n", strip=True)
+    else:
+        text_candidates = soup.find_all(['p', 'div', 'span'])
+        valid_texts = [t.get_text(strip=True) for t in text_candidates if len(t.get_text(strip=True)) > 15]
+        review_text = max(valid_texts, key=len) if valid_texts else ""
+
+    # --- EXTRACT NAME ---
+    author_node = soup.find(class_='card-author') or soup.find(class_='pinned-card-author')
+    client_name = author_node.get_text(strip=True) if author_node else f"Client #{index + 1}"
+
+    return {
+        'title': review_title,
+        'client_name': client_name,
+        'review_text': review_text,
+        'is_featured': is_pinned,
+    }
+
+
+def scrape_testimonials(target_url, css_selector=".card", on_cards=None):
+    cards = browser_pool.run(collect_cards, target_url, css_selector, on_cards)
+    return [parse_card(html, is_pinned, i) for i, (html, is_pinned) in enumerate(cards)]
+
+
+# ==========================================
+# OFFLINE SNAPSHOTS
+# ==========================================
+# Saved review pages (a file, or a directory of *.html) are parsed without a browser. For
+# simple selectors ('.card', 'div.card', '#reviews') a SoupStrainer keeps only the
+# matching elements, so a large page never becomes a full tree; anything else falls back
+# to parsing the whole page and a CSS select. No 'Read More' clicks happen offline: the
+# card HTML is used as saved.
+SNAPSHOT_EXTENSIONS = ('.html', '.htm')
+SIMPLE_SELECTOR = re.compile(r'^(?P<tag>[a-zA-Z][\w-]*)?(?:(?P<kind>[.#])(?P<value>[\w-]+))?$')
+
+
+def _strainer_for(css_selector):
+    match = SIMPLE_SELECTOR.match(css_selector.strip())
+    if not match or not (match['tag'] or match['value']):
+        return None
+    attrs = {}
+    if match['kind'] == '.':
+        # One class among several (class="card pinned-card"), whichever bs4 version matches it
+        attrs['class'] = re.compile(rf"(^|\s){re.escape(match['value'])}(\s|$)")
+    elif match['kind'] == '#':
+        attrs['id'] = match['value']
+    return SoupStrainer(match['tag'] or True, attrs=attrs)
+
+
+def snapshot_cards(html, css_selector=".card"):
+    """The card elements matching css_selector in one saved page, as BeautifulSoup Tags."""
+    soup = BeautifulSoup(html, 'html.parser', parse_only=_strainer_for(css_selector))
+    return soup.select(css_selector)
+
+
+def snapshot_files(path):
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(SNAPSHOT_EXTENSIONS)
+        )
+    return [path]
+
+
+def scrape_snapshot(path, css_selector=".card"):
+    """scrape_testimonials for a saved HTML file or a directory of them."""
+    cards = []
+    for file_path in snapshot_files(path):
+        with open(file_path, encoding='utf-8', errors='replace') as f:
+            found = snapshot_cards(f.read(), css_selector)
+        print(f"Found {len(found)} cards in {os.path.basename(file_path)}.")
+        cards.extend(found)
+    return [
+        parse_card(card, 'pinned-card' in (card.get('class') or []), i)
+        for i, card in enumerate(cards)
+    ]
+
+
+def save_testimonials(agent, testimonials, prepare=None):
+    """
+    Adds the unsaved `testimonials` the agent doesn't already have (same client name and
+    review text, ignoring case and spacing) in one bulk INSERT, so repeat imports are
+    no-ops. prepare(testimonial) runs on each new one just before the insert, e.g. to
+    attach a screenshot. Returns the testimonials that were new.
+    """
+    batch = {}
+    for testimonial in testimonials:
+        testimonial.agent = agent
+        testimonial.content_hash = testimonial_hash(testimonial.client_name, testimonial.review_text)
+        batch.setdefault(testimonial.content_hash, testimonial)
+
+    existing = set(agent.testimonials.filter(content_hash__in=batch).values_list('content_hash', flat=True))
+    new = [t for content_hash, t in batch.items() if content_hash not in existing]
+    if prepare:
+        for testimonial in new:
+            prepare(testimonial)
+    if new:
+        # A concurrent import may have added some since the check; the constraint drops those
+        Testimonial.objects.bulk_create(new, ignore_conflicts=True)
+        invalidate_agent_pages(agent.pk)   # bulk_create skips the post_save page-cache hook
+    return new
+
+
+def scrape_and_save_testimonials(agent, target_url=None, css_selector=".card", snapshot_path=None, progress=None):
+    """
+    Scrapes the agent's testimonials page (live, or from a saved snapshot_path instead);
+    returns (new reviews saved, reviews found). progress(done, total) is called as cards
+    are collected and once they are saved, e.g. BackgroundJob.set_progress.
+    """
+    progress = progress or (lambda done, total: None)
+
+    # 1. Run Scraper (skipping empty reviews)
+    if snapshot_path:
+        scraped_data = scrape_snapshot(snapshot_path, css_selector)
+    else:
+        scraped_data = scrape_testimonials(target_url, css_selector, on_cards=lambda count: progress(0, count))
+    scraped_data = [item for item in scraped_data if item['review_text']]
 
     # 2. Save to DB
     print(f"--- Saving {len(scraped_data)} items to DB ---")
-    saved_count = 0
-    
-    for item in scraped_data:
-        try:
-            # Skip empty reviews
-            if not item['review_text']:
-                continue
-
-            testimonial = Testimonial(
-                agent=agent,
-                title=item['title'][:200], # Save the title
-                client_name=item['client_name'][:100],
-                review_text=item['review_text'],
-                is_featured=item['is_featured']
-                # No screenshot saving here anymore
-            )
-            testimonial.save()
-            saved_count += 1
-            
-        except Exception as e:
-            print(f"DB Save Error: {e}")
-
-    return saved_count
\ No newline at end of file
+    progress(0, len(scraped_data))
+    new = save_testimonials(agent, [
+        Testimonial(
+            title=item['title'][:200],
+            client_name=item['client_name'][:100],
+            review_text=item['review_text'],
+            is_featured=item['is_featured'],
+        )
+        for item in scraped_data
+    ])
+    progress(len(scraped_data), len(scraped_data))
+    return len(new), len(scraped_data)
@@ -1,6 +1,7 @@
 import re
+import calendar
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, date
 from dateutil import parser as dateutil_parser
 
 
@@ -320,6 +321,87 @@ def _detect_header_row(file_obj):
     return 0  # Default: first row is the header
 
 
+# ---------------------------------------------------------------------------
+# VECTORISED COLUMN PARSERS — whole-column equivalents of the per-value helpers
+# above, so a 50k-row export is parsed with pandas string ops instead of iterrows().
+# ---------------------------------------------------------------------------
+EXCEL_EPOCH = pd.Timestamp(1899, 12, 30)
+
+DATE_FORMATS = [
+    '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y',        # DD/MM/YYYY
+    '%d/%m/%y', '%d-%m-%y', '%d.%m.%y',         # DD/MM/YY
+    '%m/%d/%Y', '%m-%d-%Y',                       # US fallback
+    '%d %b %Y', '%d %B %Y',                       # 15 Jan 2000
+    '%d-%b-%Y', '%d-%b-%y',                        # 15-Jan-2000
+    '%b %d, %Y', '%B %d, %Y',                     # Jan 15, 2000
+    '%Y%m%d',                                       # 20000115
+]
+
+GENDER_LOOKUP = {**{v: 'M' for v in GENDER_MALE}, **{v: 'F' for v in GENDER_FEMALE}}
+
+
+def _column(df, col):
+    """A whole column as stripped strings with null markers blanked ('' if the column is missing)."""
+    if col is None:
+        return pd.Series('', index=df.index, dtype=object)
+    values = df[col].astype(str).str.strip()
+    return values.mask(values.str.lower().isin(NULL_VALUES), '')
+
+
+def _parse_date_column(raw):
+    """
+    Vectorised _parse_date: returns (display DD/MM/YYYY, db YYYY-MM-DD) Series, None where
+    unparseable. Same precedence as _parse_date — Excel serials, ISO, then each explicit
+    format tried once over every still-unparsed row — and only the leftovers go row-wise
+    through _parse_date's dateutil fallback.
+    """
+    display = pd.Series(None, index=raw.index, dtype=object)
+    db = pd.Series(None, index=raw.index, dtype=object)
+    todo = raw != ''
+
+    def claim(dates):
+        dates = dates.dropna()
+        display[dates.index] = dates.dt.strftime('%d/%m/%Y')
+        db[dates.index] = dates.dt.strftime('%Y-%m-%d')
+        todo[dates.index] = False
+
+    # Excel serial date (e.g. 44927.0)
+    serial = pd.to_numeric(raw.where(todo), errors='coerce')
+    serial = serial[todo & (serial > 1000) & (serial < 100000)]
+    claim(EXCEL_EPOCH + pd.to_timedelta(serial, unit='D'))
+
+    # ISO format (YYYY-MM-DD) — unambiguous, so it goes before the DD/MM guesses
+    iso = raw[todo].str.extract(r'^(\d{4})[\-/](\d{1,2})[\-/](\d{1,2})$').dropna()
+    if len(iso):
+        parts = pd.DataFrame({'year': iso[0], 'month': iso[1], 'day': iso[2]}).astype(int)
+        claim(pd.to_datetime(parts, errors='coerce'))
+
+    for fmt in DATE_FORMATS:
+        if not todo.any():
+            break
+        claim(pd.to_datetime(raw[todo], format=fmt, errors='coerce'))
+
+    # Final fallback: dateutil, row-wise, for the few odd values left
+    for idx in raw.index[todo]:
+        display[idx], db[idx] = _parse_date(raw[idx])
+
+    return display, db
+
+
+def _parse_race_column(raw):
+    """Vectorised _parse_race: the first CMIO code (in RACE_KEYWORDS order) with a keyword match wins."""
+    lowered = raw.str.lower()
+    race = pd.Series('O', index=raw.index, dtype=object)
+    for code, keywords in reversed(list(RACE_KEYWORDS.items())):
+        race[lowered.str.contains('|'.join(map(re.escape, keywords)), regex=True)] = code
+    return race
+
+
+def _parse_gender_column(raw):
+    """Vectorised _parse_gender via a dict lookup."""
+    return raw.str.lower().map(GENDER_LOOKUP).fillna('U')
+
+
 def smart_parse_clients(file_obj):
     """
     Reads CSV/Excel, auto-detects columns, parses demographics, and deduplicates.
@@ -356,90 +438,77 @@ def smart_parse_clients(file_obj):
     next_review_col = _find_column(df.columns, NEXT_REVIEW_PRIORITY)
     review_freq_col = _find_column(df.columns, REVIEW_FREQ_PRIORITY)
 
-    # 5. Parse rows
-    parsed_clients = []
-    seen_emails = set()
-    seen_names = set()
-
-    for _, row in df.iterrows():
-        # --- EMAIL ---
-        email = _safe_val(row, email_col).lower()
-        # Validate: must contain @ to be a real email
-        if email and '@' not in email:
-            email = ''
-
-        # --- NAME ---
-        first_name = _safe_val(row, first_name_col)
-        last_name = _safe_val(row, last_name_col)
-        full_name = _safe_val(row, name_col)
-
-        if first_name or last_name:
-            name = f"{first_name} {last_name}".strip()
-        elif full_name:
-            name = full_name
-        else:
-            name = ''
-
-        # Skip rows with neither email nor name
-        if not email and not name:
-            continue
-
-        if not name:
-            name = email.split('@')[0].replace('.', ' ').replace('_', ' ').title()
-
-        # --- INTRA-FILE DEDUPLICATION ---
-        if email:
-            if email in seen_emails:
-                continue
-            seen_emails.add(email)
-        else:
-            if name.lower() in seen_names:
-                continue
-            seen_names.add(name.lower())
-
-        # --- DATE OF BIRTH ---
-        dob_raw = _safe_val(row, dob_col)
-        dob_display, dob_db = _parse_date(dob_raw)
-
-        # --- RACE & GENDER ---
-        race_code = _parse_race(_safe_val(row, race_col))
-        gender_code = _parse_gender(_safe_val(row, gender_col))
-
-        # --- HQ FIELDS ---
-        phone_raw = _safe_val(row, phone_col)
-        address_raw = _safe_val(row, address_col)
-        status_raw = _safe_val(row, status_col)
-
-        # --- REVIEW DATE FIELDS ---
-        # next_review: direct date (no calculation needed)
-        next_review_raw = _safe_val(row, next_review_col)
-
-        # last_review: date of last review — base for calculation
-        last_review_raw = _safe_val(row, last_review_col)
-
-        # review_freq: integer months until next review
-        review_freq_raw = _safe_val(row, review_freq_col)
-        # Normalise: strip any non-numeric suffix (e.g. "12 months" → "12")
-        if review_freq_raw:
-            import re as _re
-            _m = _re.match(r'^(\d+(?:\.\d+)?)', review_freq_raw.strip())
-            review_freq_raw = _m.group(1) if _m else review_freq_raw
-
-        parsed_clients.append({
-            'name': name,
-            'email': email,
-            'dob_display': dob_display,
-            'dob_db': dob_db,
-            'race': race_code,
-            'gender': gender_code,
-            # HQ fields
-            'phone': phone_raw,
-            'address': address_raw,
-            'status': status_raw,
-            # Review date fields (standardised lowercase keys)
-            'next_review_date': next_review_raw,   # direct value if column exists
-            'last_review': last_review_raw,         # base date for calculation
-            'review_freq': review_freq_raw,         # duration in months
-        })
-
-    return parsed_clients
+    # 5. Parse whole columns at once
+    email = _column(df, email_col).str.lower()
+    # Validate: must contain @ to be a real email
+    email = email.where(email.str.contains('@', regex=False), '')
+
+    first_name = _column(df, first_name_col)
+    last_name = _column(df, last_name_col)
+    name = (first_name + ' ' + last_name).str.strip()
+    name = name.where((first_name != '') | (last_name != ''), _column(df, name_col))
+
+    # Skip rows with neither email nor name
+    keep = (email != '') | (name != '')
+    df, email, name = df[keep], email[keep], name[keep]
+
+    fallback_name = (
+        email.str.split('@').str[0]
+        .str.replace('.', ' ', regex=False).str.replace('_', ' ', regex=False).str.title()
+    )
+    name = name.where(name != '', fallback_name)
+
+    # --- INTRA-FILE DEDUPLICATION ---
+    # Rows with an email dedupe on it; email-less rows dedupe on the lowercased name
+    dedupe_key = ('e:' + email).where(email != '', 'n:' + name.str.lower())
+    unique = dedupe_key.drop_duplicates().index
+    df, email, name = df.loc[unique], email[unique], name[unique]
+
+    # --- DATE OF BIRTH ---
+    dob_display, dob_db = _parse_date_column(_column(df, dob_col))
+
+    # --- REVIEW DATE FIELDS ---
+    # review_freq: integer months; strip any non-numeric suffix (e.g. "12 months" -> "12")
+    review_freq = _column(df, review_freq_col)
+    freq_number = review_freq.str.extract(r'^(\d+(?:\.\d+)?)', expand=False)
+    review_freq = freq_number.where(freq_number.notna(), review_freq)
+
+    parsed = pd.DataFrame({
+        'name': name,
+        'email': email,
+        'dob_display': dob_display,
+        'dob_db': dob_db,
+        'race': _parse_race_column(_column(df, race_col)),
+        'gender': _parse_gender_column(_column(df, gender_col)),
+        # HQ fields
+        'phone': _column(df, phone_col),
+        'address': _column(df, address_col),
+        'status': _column(df, status_col),
+        # Review date fields (standardised lowercase keys)
+        'next_review_date': _column(df, next_review_col),   # direct value if column exists
+        'last_review': _column(df, last_review_col),         # base date for calculation
+        'review_freq': review_freq,                           # duration in months
+    })
+    # Unparsed dates must come back as None (not NaN) for the session/JSON payload
+    parsed = parsed.astype(object).where(parsed.notna(), None)
+    return parsed.to_dict('records')
+
+
+def add_months_to_date(source_date_str, months):
+    """Calculates future review dates based on frequency."""
+    if not source_date_str or not months: return None
+    try:
+        # Standardize Excel/CSV date formats (e.g., 2026-03-04 or 04/03/2026)
+        for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y'):
+            try:
+                sourcedate = datetime.strptime(str(source_date_str).strip(), fmt).date()
+                break
+            except ValueError: continue
+        else: return None
+
+        month = sourcedate.month - 1 + int(float(months))
+        year = sourcedate.year + month // 12
+        month = month % 12 + 1
+        day = min(sourcedate.day, calendar.monthrange(year, month)[1])
+        return date(year, month, day).strftime('%Y-%m-%d')
+    except Exception: return None
@@ -11,9 +11,9 @@ from django.urls import reverse
 from .models import Agent, Testimonial, Lead, Article, Credential, Service, ReviewLink, Agency, AgencyImage, AgencyReview, PendingAgentOnboarding, DailyProfileView, PasskeyCredential
 from .forms import AgentProfileForm, TestimonialForm, LeadForm, ArticleForm, CredentialForm, UserUpdateForm, ServiceForm, ClientSubmissionForm, AgencySiteForm, AgencyReviewForm, AgencyImageForm
 from .themes import THEMES
-from django.http import HttpResponse, JsonResponse
-from django.db.models import F, Max
-from .utils import scrape_and_save_testimonials
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, FileResponse
+from django.core.paginator import Paginator
+from django.db.models import F, Max, Count
 from django.core.mail import send_mail
 from django.core.signing import Signer, BadSignature
 import csv
@@ -21,12 +21,22 @@ import io
 from django.core.mail import send_mass_mail
 from email.mime.application import MIMEApplication # <--- NEW IMPORT
 from django.utils import timezone
-from .models import Subscriber, Newsletter, CardTemplate, Feedback, AuditLog
+from .models import Subscriber, Newsletter, CardTemplate, Feedback, AuditLog, BackgroundJob, StagedImport, StagedImportRow
 from django.core.mail import get_connection, EmailMultiAlternatives
 from django.utils.html import strip_tags
 from .models import hash_email
 from django.template.loader import render_to_string
-from .utils_import import smart_parse_clients
+from .utils_import import smart_parse_clients, add_months_to_date
+from .importer import bulk_import_subscribers
+from .reviews import reschedule_reviews
+from .exports import export_rows, stream_csv, build_xlsx
+from .metrics import METRIC_WINDOWS, metrics_series, refresh_events_due
+from .counters import count_profile_view, count_vcard_download, count_agency_view
+from .page_cache import cached_public_page, agent_scope, article_scope
+from .tenants import get_tenant
+from .events import build_event_calendar, CARD_WINDOW_DAYS, REVIEW_WINDOW_DAYS
+from .jobs import enqueue
+from .tasks import build_card_email, build_review_reminder_email
 from datetime import datetime
 from datetime import date
 from django.db.models import Q
@@ -70,24 +80,6 @@ def log_audit_event(request, agent, action, target_info):
         target_info=target_info,
         ip_address=get_client_ip(request)
     )
-def add_months_to_date(source_date_str, months):
-    """Calculates future review dates based on frequency."""
-    if not source_date_str or not months: return None
-    try:
-        # Standardize Excel/CSV date formats (e.g., 2026-03-04 or 04/03/2026)
-        for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y'):
-            try:
-                sourcedate = datetime.strptime(str(source_date_str).strip(), fmt).date()
-                break
-            except ValueError: continue
-        else: return None
-
-        month = sourcedate.month - 1 + int(float(months))
-        year = sourcedate.year + month // 12
-        month = month % 12 + 1
-        day = min(sourcedate.day, calendar.monthrange(year, month)[1])
-        return date(year, month, day).strftime('%Y-%m-%d')
-    except Exception: return None
 # ==========================
 # VCARD DOWNLOAD VIEW
 # ==========================
@@ -95,8 +87,7 @@ def download_vcard(request, slug):
     agent = get_object_or_404(Agent, slug=slug, is_public=True)
     
     # --- NEW: Track the download ---
-    agent.vcard_downloads = F('vcard_downloads') + 1
-    agent.save(update_fields=['vcard_downloads'])
+    count_vcard_download(agent.pk)
     # -------------------------------
     
     vcard_data = [
@@ -237,25 +228,20 @@ def otp_verify(request):
 # PUBLIC ROUTER (The "Brain")
 # ==========================================
 def domain_router(request):
-    host = request.get_host().split(':')[0].lower()
-    subdomain = host.split('.')[0]
+    tenant = get_tenant(request)
 
-    if host.startswith('app.') or subdomain == 'app':
+    if tenant.kind == 'app':
         return redirect('login') 
-    if subdomain == 'onboarding':
+    if tenant.kind == 'onboarding':
         return onboarding_form_view(request)
-    if host in ['skandage.com', 'www.skandage.com', 'localhost', '127.0.0.1']:
+    if tenant.kind == 'platform':
         return render(request, 'core/index.html', {'brand': 'skandage'})
 
     # --- AGENCY SITE LOGIC ---
-    agency_site = Agency.objects.filter(domain__in=[host, f"www.{host}", host.replace('www.', '')]).first()
-    
-    if agency_site:
-        Agency.objects.filter(pk=agency_site.pk).update(page_views=F('page_views') + 1)
-        team_members = Agent.objects.filter(
-            custom_domain__in=[agency_site.domain, host, host.replace('www.', '')], 
-            is_public=True
-        )
+    if tenant.kind == 'agency':
+        agency_site = get_object_or_404(Agency, pk=tenant.agency_id)
+        count_agency_view(agency_site.pk)
+        team_members = Agent.objects.filter(pk__in=tenant.agent_ids, is_public=True)
         
         # NEW: Fetch Gallery & Reviews
         gallery = agency_site.gallery_images.all().order_by('-created_at')
@@ -268,7 +254,7 @@ def domain_router(request):
             'fc_reviews': fc_reviews
         })
 
-    return agent_profile(request, slug=subdomain)
+    return agent_profile(request, slug=tenant.slug)
 @login_required
 def manage_agency_site(request):
     try:
@@ -348,27 +334,18 @@ def delete_agency_review(request, pk):
     messages.success(request, "Review deleted.")
     return redirect('manage_agency_site')
 @xframe_options_sameorigin
+@cached_public_page(agent_scope, count_views=True)
 def agent_profile(request, slug):
     agent = get_object_or_404(Agent, slug=slug, is_public=True)
     
-    host = request.get_host().lower()
-    
-    # Domain Restriction Check
-    if 'skandage.com' not in host and 'localhost' not in host and '127.0.0.1' not in host and '192.168.' not in host:
-        # If agent has NO custom domain set, or the current host doesn't match their allowed domain
-        if not agent.custom_domain or (agent.custom_domain not in host):
-            return render(request, 'core/error.html', {'message': 'This profile is not available on this domain.'})
+    # Domain Restriction Check: custom domains only serve the agents mapped to them
+    if not get_tenant(request).allows_agent(agent):
+        return render(request, 'core/error.html', {'message': 'This profile is not available on this domain.'})
 
     session_key = f'viewed_agent_{agent.pk}'
     if not request.session.get(session_key, False):
-        agent.profile_views = F('profile_views') + 1
-        agent.save(update_fields=['profile_views'])
+        count_profile_view(agent.pk)   # buffered: totals and daily rows are flushed in batches
         request.session[session_key] = True
-        from django.utils import timezone
-        today = timezone.now().date()
-        daily_view, created = DailyProfileView.objects.get_or_create(agent=agent, date=today)
-        daily_view.views = F('views') + 1
-        daily_view.save()
     theme_config = THEMES.get(agent.theme, THEMES['luxe'])
     testimonials = agent.testimonials.filter(is_published=True).order_by('-is_featured', '-id')[:4]    
     services = agent.services.all()
@@ -400,58 +377,24 @@ def agent_profile(request, slug):
             CHAT_ID = agent.telegram_chat_id
             
             send_telegram_notification(BOT_TOKEN, CHAT_ID, telegram_msg)
-            # --- SEND NEW LEAD EMAIL NOTIFICATION TO AGENT ---
-            try:
-                email_context = {
-                    'lead': lead,
-                    'domain': request.get_host(),
-                }
-                html_body = render_to_string('core/emails/new_lead.html', email_context)
-                text_body = strip_tags(html_body)
-
-                notification = EmailMultiAlternatives(
-                    subject=f"New Lead: {lead.name} just inquired on your profile!",
-                    body=text_body,
-                    from_email=f"Skandage <updates@skandage.com>",
-                    to=[agent.user.email],
-                )
-                notification.attach_alternative(html_body, "text/html")
-                notification.send()
-            except Exception as e:
-                print(f"Failed to send new lead notification: {e}")
+            # --- QUEUE NEW LEAD EMAIL NOTIFICATION TO AGENT ---
+            enqueue('lead_notification', agent=agent, lead_id=lead.pk, domain=request.get_host())
             # ---------------------------
         is_calculator = request.POST.get('is_calculator')
         if is_calculator == 'true':
             client_name = request.POST.get('name', 'there').replace(' (Calculator Lead)', '')
-            client_email = request.POST.get('email')
-            
-            context = {
-                'agent': agent,
-                'client_name': client_name,
+            figures = {
                 'income': request.POST.get('calc_income'),
                 'dependents': request.POST.get('calc_dependents'),
                 'liabilities': request.POST.get('calc_liabilities'),
                 'existing': request.POST.get('calc_existing'),
                 'recommended': request.POST.get('calc_recommended'),
                 'gap': request.POST.get('calc_gap'),
-                'request': request,
             }
-            
-            html_content = render_to_string('core/emails/coverage_report.html', context)
-            text_content = strip_tags(html_content)
-            
-            msg = EmailMultiAlternatives(
-                subject=f"Your Coverage Gap Analysis - {agent.name}",
-                body=text_content,
-                from_email=f"{agent.name} <reports@skandage.com>",
-                to=[client_email]
+            enqueue(
+                'coverage_report', agent=agent, client_email=request.POST.get('email'),
+                client_name=client_name, figures=figures, site_url=f"{request.scheme}://{request.get_host()}",
             )
-            msg.attach_alternative(html_content, "text/html")
-            
-            try:
-                msg.send()
-            except Exception as e:
-                print(f"Failed to send calc report: {e}")
         # -----------------------------------
         
         messages.success(request, "Your message has been sent successfully!")
@@ -479,6 +422,7 @@ def agent_profile(request, slug):
         # Load the standard Skandage template for everyone else
         return render(request, 'core/agent_profile.html', context)
 
+@cached_public_page(article_scope)
 def article_detail(request, slug):
     article = get_object_or_404(Article, slug=slug, agent__is_public=True)
     agent = article.agent
@@ -536,7 +480,8 @@ def client_review_submission(request, token):
             testimonial.agent = agent
             testimonial.client_name = review_link.client_name
             testimonial.is_published = False # Pending approval
-            testimonial.save()
+            if not testimonial.is_duplicate():   # a resubmitted review is already with the agent
+                testimonial.save()
             
             review_link.is_used = True
             review_link.save()
@@ -585,54 +530,32 @@ def dashboard_stats(request):
     if agent.profile_views > 0:
         conversion_rate = round((leads.count() / agent.profile_views) * 100, 1)
 
-    from core.festivals import FESTIVALS_2026
-    from datetime import timedelta, date
-    from django.utils import timezone
-    
     today = timezone.now().date()
-    today_str = today.strftime('%Y-%m-%d')
-    today_festivals = [name for name, d in FESTIVALS_2026.items() if d == today_str]
-    
-    # --- CHART DATA ARRAYS (Renamed to match HTML exactly) ---
+    try:
+        window = int(request.GET.get('days', 7))
+    except ValueError:
+        window = 7
+    if window not in METRIC_WINDOWS:
+        window = 7
+
+    # --- CHART DATA ARRAYS (one range query over the daily rollup) ---
     chart_labels = []
     views_data = []
     leads_data = []
     conversion_data = []
     vcard_data = []
 
-    for i in range(6, -1, -1):
-        day = today - timedelta(days=i)
-        chart_labels.append(day.strftime('%a')) # 'Mon', 'Tue'
-
-        # Fetch Views
-        dv = agent.daily_views.filter(date=day).first()
-        day_views = dv.views if dv else 0
-        views_data.append(day_views)
-
-        # Fetch Leads
-        day_leads = leads.filter(created_at__date=day).count()
-        leads_data.append(day_leads)
-
+    label_format = '%a' if window == 7 else '%d %b'   # 'Mon' for a week, '03 Mar' beyond
+    for day in metrics_series(agent, window, today):
+        chart_labels.append(day.date.strftime(label_format))
+        views_data.append(day.views)
+        leads_data.append(day.leads)
         # Calculate Daily Conversion
-        day_conv = round((day_leads / day_views) * 100, 1) if day_views > 0 else 0
-        conversion_data.append(day_conv)
-        
-        # Placeholder for daily vCards (keeps the chart from breaking)
-        vcard_data.append(0) 
-
-    # Calculate CRM events due today
-    today_events_count = 0
-    for sub in agent.subscribers.filter(is_active=True):
-        is_event_today = False
-        if sub.birth_month == today.month and sub.birth_day == today.day:
-            is_event_today = True
-        elif sub.next_review_date == today:
-            is_event_today = True
-        elif today_festivals and any(f in sub.tag_list for f in today_festivals):
-            is_event_today = True
-            
-        if is_event_today:
-            today_events_count += 1
+        conversion_data.append(round((day.leads / day.views) * 100, 1) if day.views > 0 else 0)
+        vcard_data.append(day.vcard_downloads)
+
+    # CRM events due today (SQL count, snapshotted into today's rollup row)
+    today_events_count = refresh_events_due(agent, today)
 
     context = {
         'agent': agent,
@@ -650,7 +573,9 @@ def dashboard_stats(request):
         'leads_data': json.dumps(leads_data),
         'conversion_data': json.dumps(conversion_data),
         'vcard_data': json.dumps(vcard_data),
-        
+        'window': window,
+        'metric_windows': METRIC_WINDOWS,
+
         'total_leads_count': leads.count(),
     }
     return render(request, 'core/dashboard_stats.html', context)
@@ -791,6 +716,10 @@ def add_testimonial(request):
         if form.is_valid():
             testimonial = form.save(commit=False)
             testimonial.agent = agent
+            content_changed = {'client_name', 'review_text'} & set(form.changed_data)
+            if content_changed and testimonial.is_duplicate():
+                messages.warning(request, "This review is already on your profile.")
+                return redirect('manage_testimonials')
             testimonial.is_published = True
             testimonial.save()
             messages.success(request, "Review added successfully!")
@@ -822,6 +751,10 @@ def edit_testimonial(request, pk):
     if request.method == 'POST':
         form = TestimonialForm(request.POST, request.FILES, instance=testimonial)
         if form.is_valid():
+            content_changed = {'client_name', 'review_text'} & set(form.changed_data)
+            if content_changed and testimonial.is_duplicate():
+                messages.warning(request, "Another review on your profile already has this client and text.")
+                return redirect('manage_testimonials')
             form.save()
             messages.success(request, "Review updated.")
             return redirect('manage_testimonials')
@@ -844,53 +777,14 @@ def email_article_to_all(request, pk):
     article = get_object_or_404(Article, pk=pk, agent=agent)
     
     if request.method == 'POST':
-        subscribers = agent.subscribers.filter(is_active=True)
-        valid_subs = [sub for sub in subscribers if sub.email]
-        
-        if not valid_subs:
+        if not agent.subscribers.filter(is_active=True).exclude(email_hash__startswith='empty_').exists():
             messages.error(request, "You have no active clients with valid email addresses.")
             return redirect('manage_articles')
             
         site_url = getattr(settings, 'SITE_URL', request.build_absolute_uri('/')[:-1])
-        article_url = f"{site_url}{reverse('article_detail', args=[article.slug])}"
-        sent_count = 0
-        
-        for sub in valid_subs:
-            client_name = sub.name or "there"
-            subject = f"New Article: {article.title}"
-            
-            # Create a simple, clean HTML email template dynamically
-            html_content = f"""
-            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; color: #333;">
-                <p>Hi {client_name},</p>
-                <p>I just published a new article that I thought you might find valuable:</p>
-                <h2 style="color: #2563eb;">{article.title}</h2>
-                <p style="color: #666; font-style: italic;">{strip_tags(article.content)[:200]}...</p>
-                <div style="margin-top: 30px; text-align: center;">
-                    <a href="{article_url}" style="background-color: #2563eb; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">Read Full Article</a>
-                </div>
-                <hr style="margin-top: 40px; border: 0; border-top: 1px solid #eee;">
-                <p style="font-size: 12px; color: #999;">Sent by {agent.name} via Skandage</p>
-            </div>
-            """
-            text_content = strip_tags(html_content)
-            
-            msg = EmailMultiAlternatives(
-                subject=subject, 
-                body=text_content,
-                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', f"{agent.name} <updates@skandage.com>"),
-                to=[sub.email]
-            )
-            msg.attach_alternative(html_content, "text/html")
-            
-            try:
-                msg.send(fail_silently=False)
-                sent_count += 1
-            except Exception as e:
-                print(f"Error sending article email to {sub.email}: {e}")
-                
-        messages.success(request, f"Article successfully emailed to {sent_count} clients!")
-        return redirect('manage_articles')
+        job = enqueue('email_article', agent=agent, article_id=article.pk, site_url=site_url)
+        messages.success(request, "Article queued! Emails are going out in the background.")
+        return redirect('job_status', pk=job.pk)
         
     return redirect('manage_articles')
 
@@ -940,8 +834,9 @@ def account_settings(request):
 def logout_view(request):
     logout(request)
     return redirect('home')
-@xframe_options_sameorigin
 # Subpage Views
+@xframe_options_sameorigin
+@cached_public_page(agent_scope)
 def agent_testimonials(request, slug):
     agent = get_object_or_404(Agent, slug=slug, is_public=True)
     theme_config = THEMES.get(agent.theme, THEMES['luxe'])
@@ -962,13 +857,12 @@ def agent_testimonials(request, slug):
         
     return render(request, 'core/public_testimonials.html', context)
 @xframe_options_sameorigin
+@cached_public_page(agent_scope)
 def agent_bio(request, slug):
     agent = get_object_or_404(Agent, slug=slug, is_public=True)
     
-    host = request.get_host().lower()
-    if 'skandage.com' not in host and 'localhost' not in host and '127.0.0.1' not in host and '192.168.' not in host:
-        if not agent.custom_domain or (agent.custom_domain not in host):
-            return render(request, 'core/error.html', {'message': 'Profile not available.'})
+    if not get_tenant(request).allows_agent(agent):
+        return render(request, 'core/error.html', {'message': 'Profile not available.'})
             
     # VIP ARCHITECTURE INTERCEPT
     if getattr(agent, 'is_bespoke', False) and getattr(agent, 'bespoke_template_name', ''):
@@ -997,13 +891,12 @@ def agent_bio(request, slug):
 
 
 @xframe_options_sameorigin
+@cached_public_page(agent_scope)
 def agent_services(request, slug):
     agent = get_object_or_404(Agent, slug=slug, is_public=True)
     
-    host = request.get_host().lower()
-    if 'skandage.com' not in host and 'localhost' not in host and '127.0.0.1' not in host and '192.168.' not in host:
-        if not agent.custom_domain or (agent.custom_domain not in host):
-            return render(request, 'core/error.html', {'message': 'Profile not available.'})
+    if not get_tenant(request).allows_agent(agent):
+        return render(request, 'core/error.html', {'message': 'Profile not available.'})
             
     # VIP ARCHITECTURE INTERCEPT
     if getattr(agent, 'is_bespoke', False) and getattr(agent, 'bespoke_template_name', ''):
@@ -1025,6 +918,7 @@ def agent_services(request, slug):
         })
     except TemplateDoesNotExist:
         return redirect('agent_profile', slug=agent.slug)
+@cached_public_page(agent_scope)
 def single_testimonial(request, slug, pk):
     agent = get_object_or_404(Agent, slug=slug, is_public=True) # Check Public
     testimonial = get_object_or_404(Testimonial, pk=pk, agent=agent)
@@ -1113,15 +1007,12 @@ def import_testimonials(request):
         if not target_url:
             messages.error(request, "Please provide a valid URL.")
             return redirect('manage_testimonials')
-        try:
-            count = scrape_and_save_testimonials(request.user.agent, target_url, selector)
-            if count > 0:
-                messages.success(request, f"Success! Imported {count} testimonials.")
-            else:
-                messages.warning(request, "Found 0 reviews. Check the CSS selector.")
-        except Exception as e:
-            print(f"Import Error: {e}")
-            messages.error(request, "An error occurred during import.")
+        # Scraping runs on the worker's browser pool, not inside this request. Imports are
+        # deduplicated by content hash, so a retried job can't add the same review twice.
+        job = enqueue('import_testimonials', agent=request.user.agent,
+                      target_url=target_url, css_selector=selector)
+        messages.success(request, "Importing testimonials in the background.")
+        return redirect('job_status', pk=job.pk)
     return redirect('manage_testimonials')
 
 @login_required
@@ -1198,7 +1089,7 @@ def manage_subscribers(request):
                         client['existing_dob'] = existing_sub.date_of_birth.strftime('%d/%m/%Y') if existing_sub.date_of_birth else '—'
                         client['existing_race'] = race_display.get(existing_sub.race, 'Others')
                         client['existing_gender'] = gender_display.get(existing_sub.gender, 'Unspecified')
-                        client['action'] = 'skip'
+                        client['action'] = 'replace'   # matches the preview's default selection
                     else:
                         client['status'] = 'new'
                         client['action'] = 'add'
@@ -1245,9 +1136,9 @@ def manage_subscribers(request):
                         needs_freq_prompt = True
                         client['last_updated_for_calc'] = last_updated
 
-                # Pass data and flags to the preview session
-                request.session['pending_import'] = parsed_data
-                request.session['needs_freq_prompt'] = needs_freq_prompt
+                # Stage the rows in the DB; the session only carries the handle
+                staged = StagedImport.stage(agent, parsed_data, needs_freq_prompt, filename=file_obj.name)
+                request.session['staged_import_id'] = staged.pk
                 return redirect('preview_import')
 
             except Exception as e:
@@ -1257,12 +1148,12 @@ def manage_subscribers(request):
     # --- GET: SEARCH & RENDER ---
     query = request.GET.get('q', '').strip().lower()
     # Fetch active subscribers and order by most recent add
-    all_subscribers = agent.subscribers.filter(is_active=True).order_by('-created_at')
+    all_subscribers = agent.subscribers.filter(is_active=True).order_by('-created_at').decrypted()
     
     if query:
-        # SECURE: In-Memory Filtering (Database columns are encrypted/blind)
+        # SECURE: Blind-index lookup in SQL, then confirm the (few) candidates in memory
         subscribers = []
-        for sub in all_subscribers:
+        for sub in all_subscribers.search(agent, query):
             safe_tags = sub.tags.lower() if sub.tags else ""
             safe_name = sub.name.lower() if sub.name else ""
             
@@ -1278,6 +1169,16 @@ def manage_subscribers(request):
         'query': query,
         'today': date.today().strftime('%Y-%m-%d'),
     })
+IMPORT_PREVIEW_PAGE_SIZE = 100
+
+
+def _get_staged_import(request, agent, pk=None):
+    pk = pk or request.session.get('staged_import_id')
+    if not pk:
+        return None
+    return StagedImport.objects.filter(pk=pk, agent=agent).first()
+
+
 @login_required
 def preview_import(request):
     try:
@@ -1285,170 +1186,84 @@ def preview_import(request):
     except Agent.DoesNotExist:
         return redirect('dashboard')
 
-    # Fetch the parsed data and the frequency prompt flag from the session
-    pending_import = request.session.get('pending_import')
-    needs_freq_prompt = request.session.get('needs_freq_prompt', False)
-
-    if not pending_import:
+    staged = _get_staged_import(request, agent)
+    if not staged:
         messages.warning(request, "No pending import found. Please upload your file again.")
         return redirect('manage_subscribers')
 
-    if request.method == 'POST':
-        import uuid
-        import hashlib
-        from datetime import datetime
-        
-        # Get the fallback duration from the form prompt (Default to 12 if missing)
-        default_freq = request.POST.get('default_freq', 12)
-        
-        added_count = 0
-        updated_count = 0
-        skipped_count = 0
-
-        for i, client_data in enumerate(pending_import):
-            action = request.POST.get(f'action_{i}', 'skip')
-            email_raw = client_data.get('email', '')
-            dob_raw = client_data.get('dob_db') or None
-            
-            # --- DATE CONVERSION: DOB ---
-            dob_value = None
-            if dob_raw:
-                try:
-                    dob_value = datetime.strptime(str(dob_raw), '%Y-%m-%d').date()
-                except ValueError:
-                    dob_value = None
-
-            # --- SMART PARSER: NEXT REVIEW DATE ---
-            next_review_val = None
-            last_review_val = None
-            freq_months_val = None
-            calc_date_str = client_data.get('next_review_date_calc')
-            last_updated_str = client_data.get('last_updated_for_calc') or client_data.get('last_review')
-
-            # Parse last_review_date for storage
-            if last_updated_str:
-                try:
-                    last_review_val = datetime.strptime(str(last_updated_str).strip(), '%Y-%m-%d').date()
-                except ValueError:
-                    pass
+    # Only the current page of rows is decrypted
+    page = Paginator(staged.rows.all(), IMPORT_PREVIEW_PAGE_SIZE).get_page(request.GET.get('page'))
+    clients = []
+    for row in page:
+        client = row.data
+        client['position'] = row.position
+        client['action'] = row.action
+        clients.append(client)
 
-            # Parse review_freq_months for storage
-            raw_freq = client_data.get('review_freq') or default_freq
-            try:
-                freq_months_val = int(float(str(raw_freq)))
-            except (ValueError, TypeError):
-                freq_months_val = None
+    summary = staged.summary
+    return render(request, 'core/preview_import.html', {
+        'staged': staged,
+        'page': page,
+        'pending_import': clients,
+        'section': 'audience',
+        'total_count': summary.get('total', 0),
+        'new_count': summary.get('new', 0),
+        'duplicate_count': summary.get('duplicate', 0),
+        'race_chinese': summary.get('C', 0),
+        'race_malay': summary.get('M', 0),
+        'race_indian': summary.get('I', 0),
+        'race_others': summary.get('O', 0),
+        'needs_freq_prompt': staged.needs_freq_prompt,
+    })
 
-            if calc_date_str:
-                try:
-                    next_review_val = datetime.strptime(str(calc_date_str), '%Y-%m-%d').date()
-                except ValueError:
-                    pass
-            elif last_updated_str:
-                # Calculate using file frequency or user-provided default
-                calc_fallback = add_months_to_date(last_updated_str, raw_freq)
-                if calc_fallback:
-                    try:
-                        next_review_val = datetime.strptime(calc_fallback, '%Y-%m-%d').date()
-                    except ValueError:
-                        pass
-
-            if action == 'skip':
-                skipped_count += 1
-                continue
-
-            elif action == 'add':
-                if email_raw:
-                    hashed = hash_email(email_raw)
-                    if Subscriber.objects.filter(agent=agent, email_hash=hashed).exists():
-                        skipped_count += 1
-                        continue
-
-                # --- BUILD WITH ONLY PLAIN MODEL FIELDS IN CONSTRUCTOR ---
-                # IMPORTANT: Do NOT pass encrypted properties (name, race, gender,
-                # date_of_birth) as constructor kwargs. Django's Model.__init__ does
-                # not reliably call @property setters when multiple property kwargs are
-                # mixed with model field kwargs — the encrypted fields end up as b''
-                # (empty). Set every encrypted field explicitly AFTER construction.
-                sub = Subscriber(
-                    agent=agent,
-                    source='csv_import',
-                    pipeline_status=client_data.get('pipeline_status', 'client'),
-                    next_review_date=next_review_val,
-                    last_review_date=last_review_val,
-                    review_freq_months=freq_months_val,
-                )
-                # Set all encrypted / property fields explicitly
-                sub.name = client_data.get('name', '')
-                sub.race = client_data.get('race', 'O')
-                sub.gender = client_data.get('gender', 'U')
-                sub.date_of_birth = dob_value
-                sub.email = email_raw
-                sub.phone = client_data.get('phone', '')
-                sub.address = client_data.get('address', '')
-                sub.notes = client_data.get('notes', '')
-                sub.save()
-                added_count += 1
-
-            elif action == 'replace':
-                existing_sub = None
-                if email_raw:
-                    hashed = hash_email(email_raw)
-                    existing_sub = Subscriber.objects.filter(agent=agent, email_hash=hashed).first()
-                else:
-                    imported_name = client_data.get('name', '').strip()
-                    if imported_name:
-                        name_hashed = hashlib.sha256(imported_name.lower().encode()).hexdigest()
-                        existing_sub = Subscriber.objects.filter(agent=agent, name_hash=name_hashed).first()
-
-                if existing_sub:
-                    if client_data.get('name'): existing_sub.name = client_data.get('name')
-                    if dob_value is not None: existing_sub.date_of_birth = dob_value
-                    if client_data.get('race'): existing_sub.race = client_data.get('race')
-                    if client_data.get('gender'): existing_sub.gender = client_data.get('gender')
-
-                    # Update HQ & Review Fields
-                    existing_sub.pipeline_status = client_data.get('pipeline_status', 'client')
-                    if next_review_val: existing_sub.next_review_date = next_review_val
-                    if last_review_val: existing_sub.last_review_date = last_review_val
-                    if freq_months_val: existing_sub.review_freq_months = freq_months_val
-                    if client_data.get('phone'): existing_sub.phone = client_data.get('phone')
-                    if client_data.get('address'): existing_sub.address = client_data.get('address')
-                    if client_data.get('notes'): existing_sub.notes = client_data.get('notes')
-
-                    existing_sub.save()
-                    updated_count += 1
-
-        # Clear session data after successful import
-        if 'pending_import' in request.session: del request.session['pending_import']
-        if 'needs_freq_prompt' in request.session: del request.session['needs_freq_prompt']
-        
-        messages.success(request, f"Vault updated: {added_count} added, {updated_count} updated, {skipped_count} skipped.")
+@login_required
+@require_POST
+def update_import_row(request, pk, position):
+    """AJAX: persist one row's Add/Overwrite/Skip choice while the agent pages through."""
+    staged = _get_staged_import(request, request.user.agent, pk)
+    action = request.POST.get('action')
+    if not staged or action not in dict(StagedImportRow.ACTION_CHOICES):
+        return JsonResponse({'status': 'error'}, status=400)
+    updated = staged.rows.filter(position=position).update(action=action)
+    if not updated:
+        return JsonResponse({'status': 'error'}, status=404)
+    return JsonResponse({'status': 'success', 'action': action})
+
+@login_required
+@require_POST
+def commit_import(request, pk):
+    agent = request.user.agent
+    staged = _get_staged_import(request, agent, pk)
+    if not staged:
+        messages.warning(request, "No pending import found. Please upload your file again.")
         return redirect('manage_subscribers')
 
-    # GET: Build summary stats for the UI
-    new_count = sum(1 for c in pending_import if c.get('status') == 'new')
-    duplicate_count = sum(1 for c in pending_import if c.get('status') == 'duplicate')
-    race_chinese = sum(1 for c in pending_import if c.get('race') == 'C')
-    race_malay = sum(1 for c in pending_import if c.get('race') == 'M')
-    race_indian = sum(1 for c in pending_import if c.get('race') == 'I')
-    race_others = sum(1 for c in pending_import if c.get('race') == 'O')
+    # Get the fallback duration from the form prompt (Default to 12 if missing)
+    default_freq = request.POST.get('default_freq', 12)
 
-    return render(request, 'core/preview_import.html', {
-        'pending_import': pending_import,
-        'section': 'audience',
-        'new_count': new_count,
-        'duplicate_count': duplicate_count,
-        'race_chinese': race_chinese,
-        'race_malay': race_malay,
-        'race_indian': race_indian,
-        'race_others': race_others,
-        'needs_freq_prompt': needs_freq_prompt,
-    })
+    pending_import, actions = [], []
+    for row in staged.rows.all():
+        # Selects on the submitted page win over the saved choice (works without JS too)
+        posted = request.POST.get(f'action_{row.position}')
+        pending_import.append(row.data)
+        actions.append(posted if posted in dict(StagedImportRow.ACTION_CHOICES) else row.action)
+
+    added_count, updated_count, skipped_count = bulk_import_subscribers(
+        agent, pending_import, actions, default_freq=default_freq
+    )
+
+    staged.delete()
+    request.session.pop('staged_import_id', None)
+
+    messages.success(request, f"Vault updated: {added_count} added, {updated_count} updated, {skipped_count} skipped.")
+    return redirect('manage_subscribers')
 @login_required
 def newsletter_dashboard(request):
     agent = request.user.agent
-    newsletters = agent.newsletters.all().order_by('-created_at')
+    newsletters = agent.newsletters.annotate(
+        recipient_count=Count('deliveries'),
+        delivered_count=Count('deliveries', filter=Q(deliveries__status='sent')),
+    ).order_by('-created_at')
     audience_count = agent.subscribers.filter(is_active=True).count()
     return render(request, 'core/newsletter_dashboard.html', {'newsletters': newsletters, 'audience_count': audience_count, 'section': 'broadcasts'})
 @login_required
@@ -1486,127 +1301,31 @@ def send_newsletter(request, pk):
         messages.error(request, "This broadcast has already been sent.")
         return redirect('newsletter_dashboard')
 
-    from_email = f"{agent.name} <updates@skandage.com>"
-    messages_to_send = []
-    
-    # ---------------------------------------------------------
-    # 1. READ THE PDF SAFELY (IF IT EXISTS)
-    # ---------------------------------------------------------
-    file_content = None
-    file_name = ""
-    pdf_url = ""
-    
-    if newsletter.attachment:
-        try:
-            # Build the absolute URL so we can link to it in the email body
-            pdf_url = request.build_absolute_uri(newsletter.attachment.url)
-            
-            # Open and read the file from the database safely
-            newsletter.attachment.open()
-            file_content = newsletter.attachment.read()
-            file_name = newsletter.attachment.name.split('/')[-1]
-            newsletter.attachment.close()
-        except Exception as e:
-            print(f"Attachment Read Error: {e}")
-
-    # ---------------------------------------------------------
-    # 1.5 READ THE CUSTOM HTML FILE (IF IT EXISTS)
-    # ---------------------------------------------------------
-    custom_html_template = ""
-    # Check if the model actually has the html_file field defined and uploaded
-    if hasattr(newsletter, 'html_file') and newsletter.html_file:
-        try:
-            newsletter.html_file.open()
-            # Read the bytes and decode to a string
-            custom_html_template = newsletter.html_file.read().decode('utf-8', errors='ignore')
-            newsletter.html_file.close()
-        except Exception as e:
-            print(f"HTML File Read Error: {e}")
-
-    # ---------------------------------------------------------
-    # 2. BUILD THE EMAILS
-    # ---------------------------------------------------------
-    # ---------------------------------------------------------
-    # 2. BUILD THE EMAILS
-    # ---------------------------------------------------------
-    for sub in subscribers:
-        client_name = sub.name or "there"
-        
-        # --- FIX: Generate the link INSIDE the loop so 'sub' exists! ---
-        site_url = getattr(settings, 'SITE_URL', request.build_absolute_uri('/')[:-1])
-        unsub_url = f"{site_url}{reverse('unsubscribe', args=[sub.unsubscribe_token])}"
-        
-        # If there's a PDF, generate a massive, beautiful button
-        pdf_button_html = ""
-        if pdf_url:
-            pdf_button_html = f"""
-            <div style="text-align: center; margin: 30px 0;">
-                <a href="{pdf_url}" target="_blank" style="background-color: #2563eb; color: #ffffff; padding: 16px 32px; text-decoration: none; border-radius: 8px; font-weight: bold; font-size: 16px; display: inline-block; box-shadow: 0 4px 6px rgba(0,0,0,0.1);">
-                    📄 View Full PDF Newsletter
-                </a>
-            </div>
-            """
-
-        # --- LOGIC: CHOOSE BETWEEN HTML FILE OR TEXT EDITOR ---
-        if custom_html_template:
-            # Use the uploaded HTML file, allow dynamic name insertion
-            html_message = custom_html_template.replace('{{ client_name }}', client_name)
-            if pdf_button_html:
-                html_message += pdf_button_html 
-        else:
-            # Use the standard Text Editor fallback with the PDPA footer
-            html_message = f"""
-            <div style="font-family: sans-serif; max-width: 600px; margin: 0 auto; color: #1c1917; line-height: 1.6;">
-                <p>Hi {client_name},</p>
-                {newsletter.content}
-                {pdf_button_html}
-                <br>
-                <p>Best regards,<br><strong>{agent.name}</strong><br>{agent.title} at {agent.company}</p>
-                
-                <hr style="border: 0; border-top: 1px solid #e5e7eb; margin-top: 40px; margin-bottom: 20px;">
-                <p style="font-size: 11px; color: #9ca3af; text-align: center;">
-                    You are receiving this email because you are a registered client of {agent.name}.<br>
-                    <a href="{unsub_url}" style="color: #6b7280; text-decoration: underline;">Unsubscribe from future updates</a>
-                </p>
-            </div>
-            """
-        
-        text_message = strip_tags(html_message)
-        
-        msg = EmailMultiAlternatives(
-            subject=newsletter.subject,
-            body=text_message,
-            from_email=from_email,
-            to=[sub.email]
-        )
-        msg.attach_alternative(html_message, "text/html")
-        
-        # ---------------------------------------------------------
-        # 3. ATTACH AS INLINE (Triggers Apple Mail's Native Preview)
-        # ---------------------------------------------------------
-        if file_content:
-            mime_pdf = MIMEApplication(file_content, _subtype="pdf")
-            # 'inline' tells the email client to try and display it in the body!
-            mime_pdf.add_header('Content-Disposition', 'inline', filename=file_name)
-            msg.attach(mime_pdf)
-            
-        messages_to_send.append(msg)
+    # A broadcast mid-send is resumed from its delivery ledger, never restarted
+    active_job = BackgroundJob.objects.filter(
+        kind='send_newsletter', payload__newsletter_id=newsletter.pk, status__in=['queued', 'running']
+    ).first()
+    if active_job:
+        messages.info(request, "This broadcast is already sending.")
+        return redirect('job_status', pk=active_job.pk)
 
-    # ---------------------------------------------------------
-    # 4. SEND BATCH
-    # ---------------------------------------------------------
-    try:
-        connection = get_connection()
-        connection.send_messages(messages_to_send)
+    # Build the absolute PDF link here; the worker has no request to resolve it against
+    pdf_url = request.build_absolute_uri(newsletter.attachment.url) if newsletter.attachment else ""
+    site_url = getattr(settings, 'SITE_URL', request.build_absolute_uri('/')[:-1])
+
+    job = enqueue('send_newsletter', agent=agent, newsletter_id=newsletter.pk, site_url=site_url, pdf_url=pdf_url)
+    if newsletter.status == 'sending':
+        messages.success(request, "Resuming broadcast — only clients who haven't received it yet will be emailed.")
+    else:
+        messages.success(request, f"Blast off! Sending to {subscribers.count()} clients in the background.")
+    return redirect('job_status', pk=job.pk)
 
-        newsletter.status = 'sent'
-        newsletter.sent_at = timezone.now()
-        newsletter.save()
-        messages.success(request, f"Blast off! Sent to {subscribers.count()} clients.")
-    except Exception as e:
-        messages.error(request, f"Failed to send. Error: {str(e)}")
 
-    return redirect('newsletter_dashboard')
+@login_required
+def newsletter_progress(request, pk):
+    """Delivery counts for a broadcast, read straight from the ledger (polled by the dashboard)."""
+    newsletter = get_object_or_404(Newsletter, pk=pk, agent=request.user.agent)
+    return JsonResponse({'status': newsletter.status, **newsletter.delivery_counts()})
 
 
 # ===========================================================================
@@ -1713,18 +1432,7 @@ def mass_update_review_freq(request):
         messages.error(request, "Frequency must be at least 1 month.")
         return redirect('manage_subscribers')
 
-    updated = 0
-    for sub in agent.subscribers.filter(is_active=True):
-        sub.review_freq_months = new_freq
-        base_date = sub.last_review_date or date.today()
-        new_review_date_str = add_months_to_date(base_date.strftime('%Y-%m-%d'), new_freq)
-        if new_review_date_str:
-            try:
-                sub.next_review_date = datetime.strptime(new_review_date_str, '%Y-%m-%d').date()
-            except ValueError:
-                pass
-        sub.save()
-        updated += 1
+    updated = reschedule_reviews(agent.subscribers.filter(is_active=True), freq_months=new_freq)
 
     messages.success(request, f"Updated review frequency to {new_freq} months for {updated} clients.")
     return redirect('manage_subscribers')
@@ -1742,27 +1450,7 @@ def send_review_reminder(request, pk):
         return redirect('upcoming_events')
 
     site_url = getattr(settings, 'SITE_URL', request.build_absolute_uri('/')[:-1])
-    agent_headshot_url = agent.headshot.url if agent.headshot else ""
-    if agent_headshot_url and not agent_headshot_url.startswith('http'):
-        agent_headshot_url = f"{site_url}{agent_headshot_url}"
-
-    context = {
-        'client_name': subscriber.name,
-        'agent': agent,
-        'next_review_date': subscriber.next_review_date,
-        'agent_headshot_url': agent_headshot_url,
-        'site_url': site_url,
-    }
-    html_content = render_to_string('core/emails/review_reminder_email.html', context)
-    text_content = strip_tags(html_content)
-    subject = f"Your Annual Review is Coming Up — {subscriber.name}"
-
-    from_email = getattr(
-        settings, 'DEFAULT_FROM_EMAIL',
-        f"{agent.name} <updates@skandage.com>"
-    )
-    msg = EmailMultiAlternatives(subject=subject, body=text_content, from_email=from_email, to=[subscriber.email])
-    msg.attach_alternative(html_content, "text/html")
+    msg = build_review_reminder_email(agent, subscriber, site_url)
     try:
         msg.send(fail_silently=False)
         messages.success(request, f"Review reminder sent to {subscriber.name}.")
@@ -1775,7 +1463,7 @@ def send_review_reminder(request, pk):
 @login_required
 @require_POST
 def send_bulk_review_reminders(request):
-    """Send review reminder emails to multiple subscribers at once."""
+    """Queue review reminder emails to multiple subscribers at once."""
     agent = request.user.agent
     sub_ids = request.POST.getlist('subscriber_ids')
 
@@ -1784,41 +1472,9 @@ def send_bulk_review_reminders(request):
         return redirect('upcoming_events')
 
     site_url = getattr(settings, 'SITE_URL', request.build_absolute_uri('/')[:-1])
-    agent_headshot_url = agent.headshot.url if agent.headshot else ""
-    if agent_headshot_url and not agent_headshot_url.startswith('http'):
-        agent_headshot_url = f"{site_url}{agent_headshot_url}"
-    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', f"{agent.name} <updates@skandage.com>")
-
-    sent = 0
-    failed = 0
-    for sub in Subscriber.objects.filter(pk__in=sub_ids, agent=agent, is_active=True):
-        if not sub.email:
-            failed += 1
-            continue
-        context = {
-            'client_name': sub.name,
-            'agent': agent,
-            'next_review_date': sub.next_review_date,
-            'agent_headshot_url': agent_headshot_url,
-            'site_url': site_url,
-        }
-        html_content = render_to_string('core/emails/review_reminder_email.html', context)
-        text_content = strip_tags(html_content)
-        subject = f"Your Annual Review is Coming Up — {sub.name}"
-        msg = EmailMultiAlternatives(subject=subject, body=text_content, from_email=from_email, to=[sub.email])
-        msg.attach_alternative(html_content, "text/html")
-        try:
-            msg.send(fail_silently=False)
-            sent += 1
-        except Exception:
-            failed += 1
-
-    if sent:
-        messages.success(request, f"Review reminders sent to {sent} client(s).")
-    if failed:
-        messages.warning(request, f"{failed} client(s) could not be emailed (missing address or send error).")
-
-    return redirect('upcoming_events')
+    job = enqueue('review_reminders', agent=agent, subscriber_ids=[int(pk) for pk in sub_ids if pk.isdigit()], site_url=site_url)
+    messages.success(request, f"Sending review reminders to {len(sub_ids)} client(s) in the background.")
+    return redirect('job_status', pk=job.pk)
 
 
 @login_required
@@ -1985,86 +1641,20 @@ def upcoming_events(request):
     agent = request.user.agent
     today = date.today()
 
-    FESTIVAL_DATES = {
-        'New Year': date(today.year, 1, 1),
-        'Pongal': date(today.year, 1, 14),
-        'Lunar New Year': date(2026, 2, 17),
-        'Hari Raya Aidilfitri': date(2026, 3, 20),
-        'Hari Raya Haji': date(2026, 5, 27),
-        'Mid-Autumn Festival': date(2026, 9, 25),
-        'Deepavali': date(2026, 11, 8),
-        'Christmas': date(today.year, 12, 25),
-    }
-
     if request.method == 'POST':
         # ==========================================
         # BATCH SEND LOGIC
         # ==========================================
         if 'batch_send' in request.POST:
-            batch_data_list = request.POST.getlist('batch_data')
+            # Each checkbox carries "sub_id|template_id|occasion|date"
+            items = [data_string.split('|') for data_string in request.POST.getlist('batch_data')]
+            items = [item for item in items if len(item) == 4]
             custom_message = request.POST.get('batch_custom_message', '').strip()
-            sent_count = 0
-            
-            for data_string in batch_data_list:
-                try:
-                    # Parse the payload from the checkbox
-                    sub_id, temp_id, occasion_type, event_date_str = data_string.split('|')
-                    sub = Subscriber.objects.get(pk=sub_id, agent=agent)
-                    template = CardTemplate.objects.get(pk=temp_id, agent=agent)
-                    
-                    if sub.email:
-                        if occasion_type == 'Birthday':
-                            subject = f"Happy Birthday, {sub.name}!"
-                            emoji = '🎂'
-                        else:
-                            subject = f"Happy {occasion_type}, {sub.name}!"
-                            # Safe dictionary lookup without requiring settings import
-                            from core.views import OCCASION_DEMOGRAPHIC_MAP
-                            emoji = OCCASION_DEMOGRAPHIC_MAP.get(occasion_type, {}).get('emoji', '🎉')
-
-                        site_url = getattr(settings, 'SITE_URL', request.build_absolute_uri('/')[:-1])
-                        image_url = template.image.url if template.image else ""
-                        if image_url and not image_url.startswith('http'):
-                            image_url = f"{site_url}{image_url}"
-
-                        agent_headshot_url = agent.headshot.url if agent.headshot else ""
-                        if agent_headshot_url and not agent_headshot_url.startswith('http'):
-                            agent_headshot_url = f"{site_url}{agent_headshot_url}"
-                        
-                        context = {
-                            'client_name': sub.name,
-                            'agent': agent,
-                            'occasion': occasion_type,
-                            'message': custom_message or template.default_message, 
-                            'card_image_url': image_url,
-                            'agent_headshot_url': agent_headshot_url,
-                            'occasion_emoji': emoji
-                        }
-                        
-                        html_content = render_to_string('core/emails/card_email.html', context)
-                        text_content = strip_tags(html_content)
-                        
-                        msg = EmailMultiAlternatives(
-                            subject=subject, body=text_content,
-                            from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', f"{agent.name} <updates@skandage.com>"),
-                            to=[sub.email]
-                        )
-                        msg.attach_alternative(html_content, "text/html")
-                        
-                        msg.send(fail_silently=False)
-                        
-                        scheduled_date = datetime.strptime(event_date_str, '%Y-%m-%d').date() if event_date_str else today
-                        CardLog.objects.create(
-                            agent=agent, subscriber=sub, card_template=template,
-                            occasion=occasion_type, status='sent', scheduled_date=scheduled_date,
-                            sent_at=timezone.now()
-                        )
-                        sent_count += 1
-                except Exception as e:
-                    print(f"Batch Send Error: {e}")
-                    
-            messages.success(request, f"Batch processed successfully! Sent {sent_count} personalized cards.")
-            return redirect('upcoming_events')
+            site_url = getattr(settings, 'SITE_URL', request.build_absolute_uri('/')[:-1])
+
+            job = enqueue('send_cards', agent=agent, items=items, custom_message=custom_message, site_url=site_url)
+            messages.success(request, f"Batch queued! Sending {len(items)} personalized cards in the background.")
+            return redirect('job_status', pk=job.pk)
 
         # ==========================================
         # SINGLE SEND LOGIC
@@ -2080,38 +1670,8 @@ def upcoming_events(request):
             template = get_object_or_404(CardTemplate, pk=template_id, agent=agent)
             
             if sub.email:
-                if occasion_type == 'Birthday':
-                    subject = f"Happy Birthday, {sub.name}!"
-                    emoji = '🎂'
-                else:
-                    subject = f"Happy {occasion_type}, {sub.name}!"
-                    from core.views import OCCASION_DEMOGRAPHIC_MAP
-                    emoji = OCCASION_DEMOGRAPHIC_MAP.get(occasion_type, {}).get('emoji', '🎉')
-
                 site_url = getattr(settings, 'SITE_URL', request.build_absolute_uri('/')[:-1])
-                image_url = template.image.url if template.image else ""
-                if image_url and not image_url.startswith('http'):
-                    image_url = f"{site_url}{image_url}"
-                
-                agent_headshot_url = agent.headshot.url if agent.headshot else ""
-                if agent_headshot_url and not agent_headshot_url.startswith('http'):
-                    agent_headshot_url = f"{site_url}{agent_headshot_url}"
-                
-                context = {
-                    'client_name': sub.name, 'agent': agent, 'occasion': occasion_type,
-                    'message': custom_message or template.default_message, 
-                    'card_image_url': image_url, 'agent_headshot_url': agent_headshot_url, 'occasion_emoji': emoji
-                }
-                
-                html_content = render_to_string('core/emails/card_email.html', context)
-                text_content = strip_tags(html_content)
-                
-                msg = EmailMultiAlternatives(
-                    subject=subject, body=text_content,
-                    from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', f"{agent.name} <updates@skandage.com>"),
-                    to=[sub.email]
-                )
-                msg.attach_alternative(html_content, "text/html")
+                msg = build_card_email(agent, sub, template, occasion_type, custom_message, site_url)
                 
                 try:
                     msg.send(fail_silently=False)
@@ -2130,110 +1690,15 @@ def upcoming_events(request):
             return redirect('upcoming_events')
 
     # --- GET: CALCULATE UPCOMING EVENTS ---
-    REVIEW_WINDOW_DAYS = 90   # show reviews due in the next 90 days
-    CARD_WINDOW_DAYS = 30     # show birthdays/festivals in the next 30 days
-
-    upcoming_list = []    # birthdays + festivals
-    reviews_list = []     # upcoming policy reviews
-    unique_occasions = set()
-
-    for sub in agent.subscribers.filter(is_active=True, is_subscribed=True):   
-        
-        # 0. CHECK UPCOMING REVIEWS
-        if sub.next_review_date:
-            days_until_review = (sub.next_review_date - today).days
-            if 0 <= days_until_review <= REVIEW_WINDOW_DAYS:
-                # Build WhatsApp link using client's phone
-                wa_url = ''
-                if sub.phone:
-                    phone_digits = ''.join(filter(str.isdigit, sub.phone))
-                    if phone_digits:
-                        wa_url = f"https://wa.me/{phone_digits}"
-                reviews_list.append({
-                    'subscriber': sub,
-                    'days_until': days_until_review,
-                    'event_date': sub.next_review_date,
-                    'last_review_date': sub.last_review_date,
-                    'review_freq_months': sub.review_freq_months,
-                    'wa_url': wa_url,
-                })
-
-        # 1. CHECK BIRTHDAYS
-        if sub.birth_month and sub.birth_day:
-            try: bday_this_year = date(today.year, sub.birth_month, sub.birth_day)
-            except ValueError: bday_this_year = date(today.year, 3, 1)
-                
-            if bday_this_year < today:
-                try: next_bday = date(today.year + 1, sub.birth_month, sub.birth_day)
-                except ValueError: next_bday = date(today.year + 1, 3, 1)
-            else:
-                next_bday = bday_this_year
-            
-            days_until = (next_bday - today).days
-            
-            if 0 <= days_until <= CARD_WINDOW_DAYS:
-                age_turning = next_bday.year - sub.date_of_birth.year if sub.date_of_birth else 0
-
-                if not CardLog.objects.filter(agent=agent, subscriber=sub, occasion='Birthday', scheduled_date=next_bday, status='sent').exists():
-                    template = CardTemplate.objects.filter(
-                        agent=agent, occasion='Birthday', is_active=True
-                    ).filter(Q(target_gender='A') | Q(target_gender=sub.gender)
-                    ).filter(target_age_min__lte=age_turning, target_age_max__gte=age_turning).first()
-
-                    wa_url = ''
-                    if sub.phone:
-                        phone_digits = ''.join(filter(str.isdigit, sub.phone))
-                        if phone_digits:
-                            wa_url = f"https://wa.me/{phone_digits}"
-
-                    upcoming_list.append({
-                        'subscriber': sub, 'occasion': 'Birthday', 'days_until': days_until,
-                        'event_date': next_bday, 'details': f"Turning {age_turning}" if age_turning > 0 else "Birthday",
-                        'template': template, 'wa_url': wa_url,
-                    })
-                    unique_occasions.add('Birthday')
-
-        # 2. CHECK FESTIVALS
-        for tag in sub.tag_list:
-            if tag in FESTIVAL_DATES:
-                fest_date = FESTIVAL_DATES[tag]
-
-                if fest_date < today and tag in ['New Year', 'Christmas', 'Pongal']:
-                    fest_date = date(today.year + 1, fest_date.month, fest_date.day)
-
-                days_until_fest = (fest_date - today).days
-
-                if 0 <= days_until_fest <= CARD_WINDOW_DAYS:
-                    if not CardLog.objects.filter(agent=agent, subscriber=sub, occasion=tag, scheduled_date=fest_date, status='sent').exists():
-                        current_age = sub.age if sub.age else 0
-                        template = CardTemplate.objects.filter(
-                            agent=agent, occasion=tag, is_active=True
-                        ).filter(Q(target_gender='A') | Q(target_gender=sub.gender)
-                        ).filter(target_age_min__lte=current_age, target_age_max__gte=current_age).first()
-
-                        wa_url = ''
-                        if sub.phone:
-                            phone_digits = ''.join(filter(str.isdigit, sub.phone))
-                            if phone_digits:
-                                wa_url = f"https://wa.me/{phone_digits}"
-
-                        upcoming_list.append({
-                            'subscriber': sub, 'occasion': tag, 'days_until': days_until_fest,
-                            'event_date': fest_date, 'details': "Festive Greeting",
-                            'template': template, 'wa_url': wa_url,
-                        })
-                        unique_occasions.add(tag)
-            
-    upcoming_list.sort(key=lambda x: x['days_until'])
-    reviews_list.sort(key=lambda x: x['days_until'])
+    upcoming_list, reviews_list, unique_occasions = build_event_calendar(agent, today)
 
     return render(request, 'core/upcoming_events.html', {
         'upcoming': upcoming_list,
         'reviews': reviews_list,
         'unique_occasions': sorted(list(unique_occasions)),
         'section': 'crm',
-        'review_window_days': 90,
-        'card_window_days': 30,
+        'review_window_days': REVIEW_WINDOW_DAYS,
+        'card_window_days': CARD_WINDOW_DAYS,
     })
 
 import stripe
@@ -2426,19 +1891,13 @@ def manage_bespoke_profile(request, agent):
     return render(request, 'core/manage_bespoke_profile.html', context)
 
 def domain_bio(request):
-    host = request.get_host().split(':')[0].lower()
-    subdomain = host.split('.')[0]
-    return agent_bio(request, slug=subdomain)
+    return agent_bio(request, slug=get_tenant(request).slug)
 
 def domain_expertise(request):
-    host = request.get_host().split(':')[0].lower()
-    subdomain = host.split('.')[0]
-    return agent_services(request, slug=subdomain)
+    return agent_services(request, slug=get_tenant(request).slug)
 
 def domain_letters(request):
-    host = request.get_host().split(':')[0].lower()
-    subdomain = host.split('.')[0]
-    return agent_testimonials(request, slug=subdomain)
+    return agent_testimonials(request, slug=get_tenant(request).slug)
 
 def send_telegram_notification(bot_token, chat_id, message):
     """Hits the Telegram API to send an instant push notification."""
@@ -2536,35 +1995,25 @@ def feedback_submit(request):
 @login_required
 def secure_export_subscribers(request):
     agent = request.user.agent
-    subscribers = agent.subscribers.filter(is_active=True)
-    
-    # Create the HTTP response with CSV headers
-    response = HttpResponse(
+    rows = export_rows(agent.subscribers.filter(is_active=True))
+    filename = f"Skandage_Vault_{agent.slug}"
+
+    if request.GET.get('format') == 'xlsx':
+        spool, count = build_xlsx(rows)
+        # 🚨 CRITICAL COMPLIANCE STEP: Log the export
+        log_audit_event(request, agent, 'CLIENT_EXPORTED', f'Exported {count} active records to XLSX')
+        return FileResponse(spool, as_attachment=True, filename=f"{filename}.xlsx")
+
+    def log_export(count, finished):
+        # 🚨 CRITICAL COMPLIANCE STEP: Log the export (also when the download is cut short)
+        note = '' if finished else ' (download interrupted)'
+        log_audit_event(request, agent, 'CLIENT_EXPORTED', f'Exported {count} active records to CSV{note}')
+
+    return StreamingHttpResponse(
+        stream_csv(rows, on_complete=log_export),
         content_type='text/csv',
-        headers={'Content-Disposition': f'attachment; filename="Skandage_Vault_{agent.slug}.csv"'},
+        headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'},
     )
-
-    writer = csv.writer(response)
-    # Define the columns
-    writer.writerow(['Name', 'Email', 'Phone', 'Date of Birth', 'Race', 'Gender', 'Tags', 'Next Review Date'])
-
-    # Write the decrypted data directly to the stream
-    for sub in subscribers:
-        writer.writerow([
-            sub.name,
-            sub.email,
-            sub.phone,
-            sub.date_of_birth.strftime('%Y-%m-%d') if sub.date_of_birth else '',
-            sub.get_race_display(),
-            sub.get_gender_display(),
-            sub.tags,
-            sub.next_review_date.strftime('%Y-%m-%d') if sub.next_review_date else ''
-        ])
-
-    # 🚨 CRITICAL COMPLIANCE STEP: Log the export
-    log_audit_event(request, agent, 'CLIENT_EXPORTED', f'Exported {subscribers.count()} active records to CSV')
-
-    return response
 def unsubscribe_client(request, token):
     """Public one-click unsubscribe endpoint for PDPA compliance."""
     subscriber = get_object_or_404(Subscriber, unsubscribe_token=token)
@@ -2688,4 +2137,31 @@ def dismiss_passkey_prompt(request):
     agent = request.user.agent
     agent.skip_passkey_prompt = True
     agent.save()
-    return JsonResponse({'status': 'success'})
\ No newline at end of file
+    return JsonResponse({'status': 'success'})
+
+# ===========================================================================
+# BACKGROUND JOBS (progress & status)
+# ===========================================================================
+@login_required
+def job_list(request):
+    agent = request.user.agent
+    jobs = BackgroundJob.objects.filter(agent=agent)[:50]
+    return render(request, 'core/job_list.html', {'jobs': jobs, 'section': 'broadcasts'})
+
+
+@login_required
+def job_status(request, pk):
+    """Progress page for one job; `?format=json` is the cheap polling endpoint."""
+    job = get_object_or_404(BackgroundJob, pk=pk, agent=request.user.agent)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'id': job.pk,
+            'kind': job.kind,
+            'status': job.status,
+            'progress_done': job.progress_done,
+            'progress_total': job.progress_total,
+            'percent': job.percent,
+            'result': job.result,
+            'attempts': job.attempts,
+        })
+    return render(request, 'core/job_status.html', {'job': job, 'section': 'broadcasts'})